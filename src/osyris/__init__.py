@@ -11,9 +11,9 @@ import importlib.metadata
 from .config import config
 from .units import units
 from .core import Array, Datagroup, Dataset, Plot, Vector, VectorBasis
-from .io import RamsesDataset
-from .plot import histogram1d, histogram2d, map, plot, scatter
-from .spatial import extract_box, extract_sphere
+from .io import Catalog, ColumnCache, Octree, RamsesDataset
+from .plot import MapPlan, histogram1d, histogram2d, map, plot, scatter
+from .spatial import Box, Cylinder, Slab, Sphere, extract_box, extract_sphere
 
 try:
     __version__ = importlib.metadata.version(__package__ or __name__)
@@ -30,12 +30,20 @@ __all__ = [
     "Vector",
     "VectorBasis",
     "RamsesDataset",
+    "Catalog",
+    "ColumnCache",
+    "Octree",
+    "Box",
+    "Cylinder",
+    "Slab",
+    "Sphere",
     "config",
     "units",
     "histogram1d",
     "histogram2d",
     "scatter",
     "map",
+    "MapPlan",
     "plot",
     "extract_box",
     "extract_sphere",
@@ -1,31 +1,45 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+from functools import partial
+
 import numpy as np
 
 from .layer import Layer
 from .tools import bytes_to_human_readable
 
 
+def _slice_deferred(func, slice_):
+    return func()[slice_]
+
+
 class Datagroup:
     def __init__(self, *args, **kwargs):
         self._container = {}
+        self._deferred = {}
         self.name = ""
         for key, array in dict(*args, **kwargs).items():
             self[key] = array
 
     def __iter__(self):
-        return self._container.__iter__()
+        return self.keys().__iter__()
 
     def __len__(self):
-        return self._container.__len__()
+        return self._container.__len__() + self._deferred.__len__()
+
+    def __contains__(self, key):
+        return (key in self._container) or (key in self._deferred)
 
     def __getitem__(self, key):
         if isinstance(key, str):
+            if key in self._deferred:
+                self[key] = self._deferred[key]()
             return self._container[key]
         else:
             d = self.__class__()
-            for name, val in self.items():
+            for name, val in self._container.items():
                 d[name] = val[key]
+            for name, func in self._deferred.items():
+                d.defer(name, partial(_slice_deferred, func, key))
             return d
 
     def __setitem__(self, key, value):
@@ -38,8 +52,11 @@ class Datagroup:
             )
         value.name = key
         self._container[key] = value
+        self._deferred.pop(key, None)
 
     def __delitem__(self, key):
+        if key in self._deferred:
+            return self._deferred.__delitem__(key)
         return self._container.__delitem__(key)
 
     def __repr__(self):
@@ -47,10 +64,14 @@ class Datagroup:
 
     def __str__(self):
         header = f"Datagroup: {self.name} {self.print_size()}\n"
-        body = "\n".join([str(item) for item in self.values()])
+        body = "\n".join(
+            [str(item) for item in self._container.values()]
+            + [f"'{key}' [not loaded]" for key in self._deferred]
+        )
         return header + body
 
     def __eq__(self, other):
+        # Note that the deferred items of both groups are loaded
         if self.keys() != other.keys():
             return False
         for key, value in self.items():
@@ -62,45 +83,73 @@ class Datagroup:
         return self.copy()
 
     def copy(self):
-        return self.__class__(**{key: array for key, array in self.items()})
+        out = self.__class__(**{key: array for key, array in self._container.items()})
+        out._deferred.update(self._deferred)
+        return out
 
     def keys(self):
-        return self._container.keys()
+        return {**self._container, **self._deferred}.keys()
 
     def items(self):
-        return self._container.items()
+        """
+        Return the items of the group. The deferred items are loaded.
+        """
+        return {key: self[key] for key in self.keys()}.items()
 
     def values(self):
-        return self._container.values()
+        """
+        Return the values of the group. The deferred items are loaded.
+        """
+        return {key: self[key] for key in self.keys()}.values()
+
+    def defer(self, key, func):
+        """
+        Add an item whose values will only be computed (or loaded from disk) when
+        it is accessed for the first time, by calling ``func`` without arguments.
+        """
+        if key in self._container:
+            del self._container[key]
+        self._deferred[key] = func
+
+    def is_loaded(self, key):
+        """
+        Return ``False`` if the item is deferred and has not been accessed yet.
+        """
+        return key not in self._deferred
 
     def nbytes(self):
-        return np.sum([item.nbytes for item in self.values()])
+        return np.sum([item.nbytes for item in self._container.values()])
 
     def print_size(self):
         return bytes_to_human_readable(self.nbytes())
 
     @property
     def shape(self):
-        if len(self) == 0:
+        if len(self._container) == 0:
             return ()
         else:
-            return self[list(self.keys())[0]].shape
+            return self._container[list(self._container.keys())[0]].shape
 
     def sortby(self, key):
         if key is not None:
             if isinstance(key, str):
                 key = np.argsort(self[key]).values
-            for var in self.keys():
+            for var in list(self._container.keys()):
                 self[var] = self[var][key]
+            for var, func in list(self._deferred.items()):
+                self._deferred[var] = partial(_slice_deferred, func, key)
 
     def clear(self):
         self._container.clear()
+        self._deferred.clear()
 
     def get(self, key, default):
-        return self._container.get(key, default)
+        return self[key] if key in self else default
 
     def pop(self, key):
-        return self._container.pop(key)
+        value = self[key]
+        del self[key]
+        return value
 
     def update(self, *args, **kwargs):
         d = dict(*args, **kwargs)
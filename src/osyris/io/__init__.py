@@ -2,7 +2,21 @@
 # Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
 
 from . import utils
+from .cache import ColumnCache
+from .catalog import Catalog
 from .loader import Loader
+from .octree import Octree
+from .plan import LoadPlan
 from .ramses import RamsesDataset
+from .report import LoadReport
 
-__all__ = ["Loader", "RamsesDataset", "utils"]
+__all__ = [
+    "Catalog",
+    "ColumnCache",
+    "LoadPlan",
+    "LoadReport",
+    "Loader",
+    "Octree",
+    "RamsesDataset",
+    "utils",
+]
@@ -2,7 +2,6 @@
 # Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
 import numpy as np
 
-from . import utils
 from .hilbert import hilbert_cpu_list
 from .reader import Reader
 
@@ -25,13 +24,28 @@ class AmrReader(Reader):
         )
 
         self.cpu_list = hilbert_cpu_list(
-            meta=meta, scaling=units["x"], select=select, infofile=meta["infofile"]
+            meta=meta,
+            scaling=units["x"],
+            select=select,
+            infofile=meta["infofile"],
+            region=self.region,
         )
+        self.ndim = meta["ndim"]
+        self.box_length = meta["boxlen"] * units["x"]
 
         self.xcent = np.zeros([8, 3], dtype=np.float64)
 
         self.initialized = True
 
+    def set_dtype(self, dtype, meta):
+        """
+        Store the floating point variables with type ``dtype``, and the level and
+        cpu number with the smallest integer types that can hold them.
+        """
+        super().set_dtype(dtype, meta)
+        self.variables["level"]["dtype"] = np.min_scalar_type(-meta["levelmax"])
+        self.variables["cpu"]["dtype"] = np.min_scalar_type(-meta["ncpu"])
+
     def allocate_buffers(self, ncache, twotondim):
         super().allocate_buffers(ncache, twotondim)
         self.xg = np.zeros([ncache, 3], dtype=np.float64)
@@ -40,12 +54,8 @@ class AmrReader(Reader):
 
     def read_header(self, info):
         # nx,ny,nz
-        self.offsets["i"] += 2
-        self.offsets["n"] += 2
-        [nx, ny, nz] = utils.read_binary_data(
-            fmt="3i", content=self.bytes, offsets=self.offsets
-        )
-        ncoarse = nx * ny * nz
+        self.skip_records(2)
+        [nx, ny, nz] = self.read_record("i")
         self.meta["xbound"] = [
             float(int(nx / 2)),
             float(int(ny / 2)),
@@ -53,93 +63,39 @@ class AmrReader(Reader):
         ]
 
         # nboundary
-        self.offsets["i"] += 2
-        self.offsets["n"] += 2
-        [self.meta["nboundary"]] = utils.read_binary_data(
-            fmt="i", content=self.bytes, offsets=self.offsets
-        )
+        self.skip_records(2)
+        [self.meta["nboundary"]] = self.read_record("i")
         self.meta["ngridlevel"] = np.zeros(
             [info["ncpu"] + self.meta["nboundary"], info["levelmax"]], dtype=np.int32
         )
 
-        # noutput
-        self.offsets["i"] += 1
-        self.offsets["n"] += 2
-        self.offsets["d"] += 1
-        [noutput] = utils.read_binary_data(
-            fmt="i", content=self.bytes, offsets=self.offsets
-        )
         # dtold, dtnew
-        self.offsets["i"] += 2
-        self.offsets["n"] += 3
-        self.offsets["d"] += 1 + 2 * noutput
-        info["dtold"] = np.array(
-            utils.read_binary_data(
-                fmt="{}d".format(info["levelmax"]),
-                content=self.bytes,
-                offsets=self.offsets,
-            )
-        )
-        info["dtnew"] = np.array(
-            utils.read_binary_data(
-                fmt="{}d".format(info["levelmax"]),
-                content=self.bytes,
-                offsets=self.offsets,
-            )
-        )
+        self.skip_records(6)
+        info["dtold"] = self.read_record("d", info["levelmax"]).copy()
+        info["dtnew"] = self.read_record("d", info["levelmax"]).copy()
 
         # Read the number of grids
-        self.offsets["i"] += 2 + (2 * info["ncpu"] * info["levelmax"])
-        self.offsets["n"] += 7
-        self.offsets["d"] += 16
+        self.skip_records(7)
         self.meta["ngridlevel"][: info["ncpu"], :] = (
-            np.array(
-                utils.read_binary_data(
-                    fmt="{}i".format(info["ncpu"] * info["levelmax"]),
-                    content=self.bytes,
-                    offsets=self.offsets,
-                )
-            )
+            self.read_record("i", info["ncpu"] * info["levelmax"])
             .reshape(info["levelmax"], info["ncpu"])
             .T
         )
 
         # Read boundary grids if any
-        self.offsets["i"] += 10 * info["levelmax"]
-        self.offsets["n"] += 3
+        self.skip_records(1)
         if self.meta["nboundary"] > 0:
-            self.offsets["i"] += 2 * self.meta["nboundary"] * info["levelmax"]
-            # self.offsets["n"] += 4
+            self.skip_records(2)
             self.meta["ngridlevel"][
                 info["ncpu"] : info["ncpu"] + self.meta["nboundary"], :
             ] = (
-                np.array(
-                    utils.read_binary_data(
-                        fmt="{}i".format(self.meta["nboundary"] * info["levelmax"]),
-                        content=self.bytes,
-                        offsets=self.offsets,
-                    )
-                )
+                self.read_record("i", self.meta["nboundary"] * info["levelmax"])
                 .reshape(info["levelmax"], self.meta["nboundary"])
                 .T
             )
-            self.offsets["n"] += 2
-
-        # Determine bound key precision
-        self.offsets["i"] += 5
-        self.offsets["s"] += 128
-        [key_size] = utils.read_binary_data(
-            fmt="i",
-            content=self.bytes,
-            offsets=self.offsets,
-            skip_head=False,
-            increment=False,
-        )
 
-        # Offset for AMR
-        self.offsets["i"] += 3 * ncoarse
-        self.offsets["n"] += 3
-        self.offsets["s"] += key_size
+        # Skip free memory, ordering, bound keys and coarse level
+        self.skip_records(6)
 
     def read_level_header(self, ilevel, twotondim):
         # Geometry
@@ -154,23 +110,17 @@ class AmrReader(Reader):
 
     def read_cacheline_header(self, ncache, ndim):
         # xg: grid coordinates
-        self.offsets["i"] += ncache * 3
-        self.offsets["n"] += 3
+        self.skip_records(3)
         for n in range(ndim):
-            self.xg[:, n] = utils.read_binary_data(
-                fmt="{}d".format(ncache), content=self.bytes, offsets=self.offsets
-            )
+            self.xg[:, n] = self.read_record("d", ncache)
 
-        # son indices
-        self.offsets["i"] += ncache * (1 + 2 * ndim)
-        self.offsets["n"] += 1 + 2 * ndim
+        # father and neighbour indices
+        self.skip_records(1 + 2 * ndim)
 
     def read_variables(self, ncache, ind, ilevel, cpuid, info):
         begin = ind * ncache
         end = (ind + 1) * ncache
-        self.son[begin:end] = utils.read_binary_data(
-            fmt="{}i".format(ncache), content=self.bytes, offsets=self.offsets
-        )
+        self.son[begin:end] = self.read_record("i", ncache)
 
         if self.variables["level"]["read"]:
             self.variables["level"]["buffer"]._array[begin:end] = ilevel + 1
@@ -196,17 +146,45 @@ class AmrReader(Reader):
             np.logical_and(self.son[begin:end] > 0, ilevel < info["lmax"] - 1)
         )
 
+    def count_leaf_cells(self, ncache, ilevel, info):
+        """
+        Count the leaf cells in the current cache line by reading only the son
+        indices, and move the cursor to the end of the cache line.
+        """
+        twotondim = 2 ** info["ndim"]
+        # Skip grid indices, coordinates, father and neighbour indices
+        self.skip_records(4 + 3 * info["ndim"])
+        if ilevel < info["lmax"] - 1:
+            nleaf = 0
+            for ind in range(twotondim):
+                nleaf += np.count_nonzero(self.read_record("i", ncache) <= 0)
+        else:
+            nleaf = ncache * twotondim
+            self.skip_records(twotondim)
+        self.read_footer(ncache, twotondim)
+        return nleaf
+
     def make_conditions(self, select):
         conditions = super().make_conditions(select)
         conditions.update({"leaf": self.ref})
+        if self.region is not None:
+            # Cell centers in units of the box size
+            ndim = self.ndim
+            position = (
+                self.xg[None, :, :ndim]
+                + self.xcent[: 2**ndim, None, :ndim]
+                - np.array(self.meta["xbound"][:ndim])
+            ).reshape(-1, ndim)
+            conditions["region"] = self.region.contains(position, self.box_length)
         return conditions
 
     def read_footer(self, ncache, twotondim):
-        # Increment offsets with remainder of the file
-        self.offsets["i"] += ncache * 2 * twotondim
-        self.offsets["n"] += 2 * twotondim
+        # Skip cpu map and refinement flags
+        self.skip_records(2 * twotondim)
 
     def step_over(self, ncache, twotondim, ndim):
-        self.offsets["i"] += ncache * (4 + 3 * twotondim + 2 * ndim)
-        self.offsets["d"] += ncache * ndim
-        self.offsets["n"] += 4 + 3 * twotondim + 3 * ndim
+        # Integer records: grid index, next, prev, father, neighbours, son, cpu map and
+        # flags. Double records: grid coordinates. Each record has a head and tail
+        # marker of 4 bytes.
+        nint = 4 + 3 * twotondim + 2 * ndim
+        self.cursor += nint * (ncache * 4 + 8) + ndim * (ncache * 8 + 8)
@@ -0,0 +1,303 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import types
+from collections import OrderedDict
+
+import numpy as np
+from pint import Quantity
+
+from ..core import Array, Datagroup, Vector
+
+# Entries of the metadata which are set when the data is loaded, and are therefore
+# stored in the cache alongside the arrays.
+CACHED_META = ("ncells", "nparticles", "lmax", "gamma", "dtold", "dtnew")
+
+
+def _fingerprint(obj, digest, seen=None):
+    """
+    Feed a description of ``obj`` to the ``digest``. Functions (e.g. the lambdas of
+    the selection criteria) are described by their bytecode, constants, and the
+    values of the closure and global variables they use, so that the same selection
+    gives the same description across sessions.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return
+    if isinstance(obj, dict):
+        digest.update(b"dict")
+        for key in sorted(obj, key=str):
+            _fingerprint(key, digest, seen)
+            _fingerprint(obj[key], digest, seen)
+    elif isinstance(obj, (list, tuple, range)):
+        digest.update(type(obj).__name__.encode())
+        for item in obj:
+            _fingerprint(item, digest, seen)
+    elif isinstance(obj, Array):
+        _fingerprint(obj.values, digest, seen)
+        digest.update(str(obj.unit).encode())
+    elif isinstance(obj, Vector):
+        for xyz in obj._xyz.values():
+            _fingerprint(xyz, digest, seen)
+    elif isinstance(obj, Quantity):
+        _fingerprint(obj.magnitude, digest, seen)
+        digest.update(str(obj.units).encode())
+    elif isinstance(obj, np.ndarray):
+        digest.update(str(obj.dtype).encode() + str(obj.shape).encode())
+        digest.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, types.FunctionType):
+        seen.add(id(obj))
+        _fingerprint(obj.__code__, digest, seen)
+        for cell in obj.__closure__ or ():
+            _fingerprint(cell.cell_contents, digest, seen)
+        for name in _global_names(obj.__code__):
+            if name in obj.__globals__:
+                value = obj.__globals__[name]
+                if not isinstance(value, (types.ModuleType, type)):
+                    _fingerprint(name, digest, seen)
+                    _fingerprint(value, digest, seen)
+    elif isinstance(obj, types.CodeType):
+        digest.update(obj.co_code)
+        _fingerprint(obj.co_consts, digest, seen)
+        _fingerprint(obj.co_names, digest, seen)
+    elif isinstance(obj, types.MethodType):
+        _fingerprint(obj.__func__, digest, seen)
+        _fingerprint(obj.__self__, digest, seen)
+    elif isinstance(obj, functools.partial):
+        _fingerprint((obj.func, obj.args, obj.keywords), digest, seen)
+    elif hasattr(obj, "__dict__") and not callable(obj):
+        # Other objects, such as regions, are described by their attributes
+        seen.add(id(obj))
+        digest.update(_qualified_name(obj).encode())
+        _fingerprint(vars(obj), digest, seen)
+    else:
+        # Other callables (e.g. the units registry) are described by their type.
+        # Their representation is only used if it does not hold a memory address,
+        # which changes from one process to the next.
+        digest.update(_qualified_name(obj).encode())
+        text = repr(obj)
+        if re.search(r"\bat 0x[0-9a-fA-F]+", text) is None:
+            digest.update(text.encode())
+
+
+def _qualified_name(obj):
+    kind = type(obj)
+    return kind.__module__ + "." + kind.__qualname__
+
+
+def _global_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return sorted(names)
+
+
+def cache_directory(path, infile, **kwargs):
+    """
+    Return the name of the cache directory for the output ``infile``, inside
+    ``path``. The name contains the output number and a hash of the keyword
+    arguments that determine which data is loaded (e.g. selection, cpu list).
+    """
+    digest = hashlib.sha1()
+    _fingerprint(kwargs, digest)
+    name = os.path.basename(os.path.normpath(infile))
+    return os.path.join(path, name + "_" + digest.hexdigest()[:16])
+
+
+def source_stats(infile):
+    """
+    Return the modification times and sizes of all the files in the output
+    directory, apart from the sidecar files written by osyris.
+    """
+    stats = {}
+    with os.scandir(infile) as entries:
+        for entry in entries:
+            if entry.is_file() and not entry.name.startswith("osyris_"):
+                stat = entry.stat()
+                stats[entry.name] = [stat.st_mtime_ns, stat.st_size]
+    return stats
+
+
+def read_cache(directory, infile, meta):
+    """
+    Read the groups stored in the cache ``directory``. The arrays are memory-mapped
+    (copy-on-write) from the files. The cached metadata is written to ``meta``.
+    Return ``None`` if the cache does not exist, or if the files in the output
+    directory have changed since the cache was written.
+    """
+    try:
+        with open(os.path.join(directory, "manifest.json"), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest["sources"] != source_stats(infile):
+        return None
+
+    out = {}
+    for group, items in manifest["groups"].items():
+        out[group] = Datagroup()
+        for key, item in items.items():
+            arrays = {
+                c: Array(
+                    values=np.load(os.path.join(directory, fname), mmap_mode="c"),
+                    unit=item["unit"],
+                )
+                for c, fname in item["files"].items()
+            }
+            if item["vector"]:
+                out[group][key] = Vector(**arrays)
+            else:
+                out[group][key] = arrays[""]
+    for key, value in manifest["meta"].items():
+        meta[key] = np.array(value) if isinstance(value, list) else value
+    return out
+
+
+def write_cache(directory, infile, groups, meta):
+    """
+    Write the groups to the cache ``directory``, as one ``.npy`` file per array (or
+    vector component), along with a manifest containing the units, the metadata,
+    and the modification times of the files in the output directory.
+    Writing is silently skipped if the cache directory is not writable.
+    """
+    manifest = {
+        "sources": source_stats(infile),
+        "meta": {
+            key: np.asarray(meta[key]).tolist() for key in CACHED_META if key in meta
+        },
+        "groups": {},
+    }
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Remove the manifest first, so that a partially written cache is never used
+        manifest_file = os.path.join(directory, "manifest.json")
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+        for group, datagroup in groups.items():
+            manifest["groups"][group] = {}
+            for key, item in datagroup.items():
+                vector = isinstance(item, Vector)
+                arrays = item._xyz if vector else {"": item}
+                files = {}
+                for c, array in arrays.items():
+                    fname = ".".join(filter(None, [group, key, c, "npy"]))
+                    _save_array(os.path.join(directory, fname), array.values)
+                    files[c] = fname
+                manifest["groups"][group][key] = {
+                    "unit": str(item.unit),
+                    "vector": vector,
+                    "files": files,
+                }
+        tmp = manifest_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, manifest_file)
+    except OSError:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _save_array(fname, values):
+    # Write to a temporary file and rename it, so that the arrays of a previous
+    # version of the cache, which may still be memory-mapped, are left intact.
+    tmp = fname + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, values)
+    os.replace(tmp, fname)
+
+
+class ColumnCache:
+    """
+    An in-memory cache of the columns decoded from the AMR, hydro, gravity and rt
+    files of each cpu, before any selection criteria are applied. It can be passed
+    to several loads of the same output, so that loads which only differ by their
+    selection criteria or region re-use the decoded columns, and only apply the new
+    selection. The columns are identified by the file name, modification time and
+    size, the maximum level, the type of the variables and the variable name.
+
+    When the total size of the columns exceeds ``max_bytes``, the least recently
+    used columns are evicted. The cached arrays are read-only.
+
+    :param max_bytes: The maximum number of bytes held by the cache.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._columns = OrderedDict()
+
+    def get(self, key):
+        """
+        Return the column stored under ``key``, or ``None`` if it is not in the
+        cache.
+        """
+        column = self._columns.get(key)
+        if column is None:
+            self.misses += 1
+            return None
+        self._columns.move_to_end(key)
+        self.hits += 1
+        return column
+
+    def put(self, key, column):
+        """
+        Store a column under ``key``, and evict the least recently used columns if
+        the cache is full. Columns larger than ``max_bytes`` are not stored.
+        """
+        if column.nbytes > self.max_bytes:
+            return
+        previous = self._columns.pop(key, None)
+        if previous is not None:
+            self.nbytes -= previous.nbytes
+        column.flags.writeable = False
+        self._columns[key] = column
+        self.nbytes += column.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._columns.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all the columns from the cache. The statistics are kept.
+        """
+        self._columns.clear()
+        self.nbytes = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __contains__(self, key):
+        return key in self._columns
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        return (
+            "ColumnCache: {} columns, {:.3f} MB / {:.3f} MB, {} hits, {} misses "
+            "({:.1f}%), {} evictions".format(
+                len(self),
+                self.nbytes / 1.0e6,
+                self.max_bytes / 1.0e6,
+                self.hits,
+                self.misses,
+                100.0 * self.hit_rate,
+                self.evictions,
+            )
+        )
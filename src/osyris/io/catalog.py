@@ -0,0 +1,279 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pint import Quantity
+
+from ..core import Array
+from ..units import units
+from .cache import source_stats
+from .ramses import RamsesDataset
+
+# Entries of the info file which are stored in the catalog
+CATALOG_KEYS = (
+    "ncpu",
+    "ndim",
+    "levelmin",
+    "levelmax",
+    "boxlen",
+    "time",
+    "aexp",
+    "unit_l",
+    "unit_d",
+    "unit_t",
+)
+
+
+def _parse_value(value):
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_info_header(fname):
+    """
+    Read the parameters at the top of an info file, stopping before the table of
+    the domain boundaries. The values are converted to numbers without ``eval``.
+    """
+    out = {}
+    with open(fname, "r") as f:
+        for line in f:
+            if line.split()[:1] == ["DOMAIN"]:
+                break
+            sp = line.split("=")
+            if len(sp) > 1:
+                out[sp[0].strip()] = _parse_value(sp[1].strip())
+    return out
+
+
+def _stamp(directory):
+    """
+    Return the modification time of an output directory, and the modification time
+    and size of its info file. These change when files are added to or removed from
+    the directory, or when the info file is written at the end of the output.
+    """
+    number = directory.split("_")[-1]
+    info = os.stat(os.path.join(directory, "info_" + number + ".txt"))
+    return [os.stat(directory).st_mtime_ns, info.st_mtime_ns, info.st_size]
+
+
+def _scan_output(directory, entry=None, check_files=False):
+    """
+    Read the header of the info file of an output directory, and measure the total
+    size of its files. If the ``entry`` of the output in the index is still valid,
+    it is returned as is, and only the stamp of the directory is read (and the
+    metadata of its files, if ``check_files``). Return ``None`` if the directory is
+    not a complete output.
+    """
+    number = directory.split("_")[-1]
+    infofile = os.path.join(directory, "info_" + number + ".txt")
+    try:
+        stamp = _stamp(directory)
+        stats = None
+        if entry is not None and entry.get("stamp") == stamp:
+            if not check_files:
+                return entry
+            stats = source_stats(directory)
+            if entry.get("stat") == stats:
+                return entry
+        if stats is None:
+            stats = source_stats(directory)
+        header = read_info_header(infofile)
+    except OSError:
+        return None
+    entry = {key: header[key] for key in CATALOG_KEYS if key in header}
+    entry["size"] = sum(size for _, size in stats.values())
+    entry["stamp"] = stamp
+    if check_files:
+        entry["stat"] = stats
+    return entry
+
+
+class Catalog:
+    """
+    An index of the outputs of a simulation, holding the time, number of cpus,
+    maximum level, box size, units and size on disk of each output.
+
+    The outputs are scanned once, and the index is stored in a small file in the
+    simulation directory. Opening the catalog again only scans the outputs which
+    have appeared or changed since. An output has changed if the modification time
+    of its directory, or the modification time or size of its info file, have
+    changed.
+
+    :param path: The directory containing the ``output_XXXXX`` directories.
+        Default is ``""`` (the current directory).
+
+    :param workers: The number of threads used to scan the outputs. Default is
+        ``None``, in which case it is chosen by the ``ThreadPoolExecutor``.
+
+    :param index: Read and write the index file. If ``False``, all the outputs are
+        scanned. Default is ``True``.
+
+    :param check_files: Also compare the modification times and sizes of all the
+        files of each output with the index, to detect files which were rewritten
+        in place. This reads the metadata of every file of every output each time
+        the catalog is opened. Default is ``False``.
+    """
+
+    filename = "osyris_catalog.json"
+
+    def __init__(self, path="", workers=None, index=True, check_files=False):
+        self.path = path
+        self.workers = workers
+        self.index = index
+        self.check_files = check_files
+        self.entries = {}
+        if index:
+            self.entries = self._read_index()
+        self.update()
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.path, self.filename), "r") as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {int(nout): entry for nout, entry in content.items()}
+
+    def _write_index(self):
+        fname = os.path.join(self.path, self.filename)
+        tmp = fname + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({str(nout): self.entries[nout] for nout in self}, f)
+            os.replace(tmp, fname)
+        except OSError:
+            pass
+
+    def update(self):
+        """
+        Scan the outputs which have appeared or changed since the last scan, and
+        remove the outputs which no longer exist.
+        """
+        directories = {}
+        for directory in glob.glob(os.path.join(self.path, "output_*")):
+            number = directory.split("_")[-1]
+            if number.isdigit() and os.path.isdir(directory):
+                directories[int(number)] = directory
+
+        removed = set(self.entries) - set(directories)
+        for nout in removed:
+            del self.entries[nout]
+
+        # The stamps of the outputs are checked in parallel, and the outputs which
+        # have appeared or changed are scanned again
+        outdated = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            scanned = executor.map(
+                lambda nout: _scan_output(
+                    directories[nout], self.entries.get(nout), self.check_files
+                ),
+                directories,
+            )
+            for nout, entry in zip(directories, scanned):
+                if entry is self.entries.get(nout):
+                    continue
+                outdated.append(nout)
+                if entry is None:
+                    self.entries.pop(nout, None)
+                else:
+                    self.entries[nout] = entry
+        if self.index and (outdated or removed):
+            self._write_index()
+
+    def __iter__(self):
+        return iter(sorted(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, nout):
+        return self.entries[nout]
+
+    def __contains__(self, nout):
+        return nout in self.entries
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        lines = ["Catalog: {} outputs in '{}'".format(len(self), self.path)]
+        for nout in self:
+            entry = self.entries[nout]
+            lines.append(
+                "  {}: time={} ncpu={} levelmax={} size={:.1f} MB".format(
+                    str(nout).zfill(5),
+                    entry.get("time"),
+                    entry.get("ncpu"),
+                    entry.get("levelmax"),
+                    entry["size"] / 1.0e6,
+                )
+            )
+        return "\n".join(lines)
+
+    @property
+    def nouts(self):
+        """
+        The numbers of the outputs, in increasing order.
+        """
+        return np.array(list(self), dtype=int)
+
+    @property
+    def times(self):
+        """
+        The times of the outputs, in seconds.
+        """
+        return Array(
+            values=np.array(
+                [self.entries[n]["time"] * self.entries[n]["unit_t"] for n in self],
+                dtype=float,
+            ),
+            unit="s",
+        )
+
+    @property
+    def sizes(self):
+        """
+        The sizes of the outputs on disk, in bytes.
+        """
+        return np.array([self.entries[n]["size"] for n in self], dtype=np.int64)
+
+    def nearest(self, time):
+        """
+        Return the number of the output whose time is closest to ``time``.
+
+        :param time: A time, given as an ``Array`` or a ``Quantity``.
+        """
+        if isinstance(time, Array):
+            time = time.values * time.unit
+        if not isinstance(time, Quantity):
+            raise TypeError("The time must be given with units.")
+        if len(self) == 0:
+            raise ValueError("The catalog does not contain any output.")
+        value = time.to(units("s")).magnitude
+        return int(self.nouts[np.argmin(np.abs(self.times.values - value))])
+
+    def open(self, nout=None, time=None):
+        """
+        Create a ``RamsesDataset`` for an output, given either by its number or by
+        the time closest to its time. If neither is given, the last output is used.
+
+        :param nout: The number of the output.
+
+        :param time: A time, given as an ``Array`` or a ``Quantity``.
+        """
+        if time is not None:
+            nout = self.nearest(time)
+        elif nout is None:
+            if len(self) == 0:
+                raise ValueError("The catalog does not contain any output.")
+            nout = int(self.nouts[-1])
+        return RamsesDataset(nout, path=self.path)
@@ -30,9 +30,7 @@ class GravReader(Reader):
         self.initialized = True
 
     def read_header(self, info):
-        self.offsets["i"] += 4
-        self.offsets["n"] += 4
+        self.skip_records(4)
 
     def read_domain_header(self):
-        self.offsets["n"] += 2
-        self.offsets["i"] += 2
+        self.skip_records(2)
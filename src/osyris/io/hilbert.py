@@ -1,6 +1,8 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
 
+from functools import partial
+
 import numpy as np
 
 from ..core import Array
@@ -23,333 +25,280 @@ def _read_bound_key(infofile, ncpu):
     return bound_key
 
 
-def _btest(i, pos):
-    return bool(i & (1 << pos))
-
-
-def _hilbert3d(x, y, z, bit_length):
-    i_bit_mask = np.zeros(3 * bit_length, dtype=bool)
-    x_bit_mask = np.zeros(bit_length, dtype=bool)
-    y_bit_mask = np.zeros_like(x_bit_mask)
-    z_bit_mask = np.zeros_like(x_bit_mask)
-
-    state_diagram = np.array(
-        [
-            1,
-            2,
-            3,
-            2,
-            4,
-            5,
-            3,
-            5,
-            0,
-            1,
-            3,
-            2,
-            7,
-            6,
-            4,
-            5,
-            2,
-            6,
-            0,
-            7,
-            8,
-            8,
-            0,
-            7,
-            0,
-            7,
-            1,
-            6,
-            3,
-            4,
-            2,
-            5,
-            0,
-            9,
-            10,
-            9,
-            1,
-            1,
-            11,
-            11,
-            0,
-            3,
-            7,
-            4,
-            1,
-            2,
-            6,
-            5,
-            6,
-            0,
-            6,
-            11,
-            9,
-            0,
-            9,
-            8,
-            2,
-            3,
-            1,
-            0,
-            5,
-            4,
-            6,
-            7,
-            11,
-            11,
-            0,
-            7,
-            5,
-            9,
-            0,
-            7,
-            4,
-            3,
-            5,
-            2,
-            7,
-            0,
-            6,
-            1,
-            4,
-            4,
-            8,
-            8,
-            0,
-            6,
-            10,
-            6,
-            6,
-            5,
-            1,
-            2,
-            7,
-            4,
-            0,
-            3,
-            5,
-            7,
-            5,
-            3,
-            1,
-            1,
-            11,
-            11,
-            4,
-            7,
-            3,
-            0,
-            5,
-            6,
-            2,
-            1,
-            6,
-            1,
-            6,
-            10,
-            9,
-            4,
-            9,
-            10,
-            6,
-            7,
-            5,
-            4,
-            1,
-            0,
-            2,
-            3,
-            10,
-            3,
-            1,
-            1,
-            10,
-            3,
-            5,
-            9,
-            2,
-            5,
-            3,
-            4,
-            1,
-            6,
-            0,
-            7,
-            4,
-            4,
-            8,
-            8,
-            2,
-            7,
-            2,
-            3,
-            2,
-            1,
-            5,
-            6,
-            3,
-            0,
-            4,
-            7,
-            7,
-            2,
-            11,
-            2,
-            7,
-            5,
-            8,
-            5,
-            4,
-            5,
-            7,
-            6,
-            3,
-            2,
-            0,
-            1,
-            10,
-            3,
-            2,
-            6,
-            10,
-            3,
-            4,
-            4,
-            6,
-            1,
-            7,
-            0,
-            5,
-            2,
-            4,
-            3,
-        ]
-    ).reshape((8, 2, 12), order="F")
+# State diagram of the Hilbert curve, indexed by the octant of the cell (given by the
+# x, y and z bits), the output (0: next state, 1: Hilbert digit) and the current state
+_STATE_DIAGRAM = np.array(
+    [
+        1,
+        2,
+        3,
+        2,
+        4,
+        5,
+        3,
+        5,
+        0,
+        1,
+        3,
+        2,
+        7,
+        6,
+        4,
+        5,
+        2,
+        6,
+        0,
+        7,
+        8,
+        8,
+        0,
+        7,
+        0,
+        7,
+        1,
+        6,
+        3,
+        4,
+        2,
+        5,
+        0,
+        9,
+        10,
+        9,
+        1,
+        1,
+        11,
+        11,
+        0,
+        3,
+        7,
+        4,
+        1,
+        2,
+        6,
+        5,
+        6,
+        0,
+        6,
+        11,
+        9,
+        0,
+        9,
+        8,
+        2,
+        3,
+        1,
+        0,
+        5,
+        4,
+        6,
+        7,
+        11,
+        11,
+        0,
+        7,
+        5,
+        9,
+        0,
+        7,
+        4,
+        3,
+        5,
+        2,
+        7,
+        0,
+        6,
+        1,
+        4,
+        4,
+        8,
+        8,
+        0,
+        6,
+        10,
+        6,
+        6,
+        5,
+        1,
+        2,
+        7,
+        4,
+        0,
+        3,
+        5,
+        7,
+        5,
+        3,
+        1,
+        1,
+        11,
+        11,
+        4,
+        7,
+        3,
+        0,
+        5,
+        6,
+        2,
+        1,
+        6,
+        1,
+        6,
+        10,
+        9,
+        4,
+        9,
+        10,
+        6,
+        7,
+        5,
+        4,
+        1,
+        0,
+        2,
+        3,
+        10,
+        3,
+        1,
+        1,
+        10,
+        3,
+        5,
+        9,
+        2,
+        5,
+        3,
+        4,
+        1,
+        6,
+        0,
+        7,
+        4,
+        4,
+        8,
+        8,
+        2,
+        7,
+        2,
+        3,
+        2,
+        1,
+        5,
+        6,
+        3,
+        0,
+        4,
+        7,
+        7,
+        2,
+        11,
+        2,
+        7,
+        5,
+        8,
+        5,
+        4,
+        5,
+        7,
+        6,
+        3,
+        2,
+        0,
+        1,
+        10,
+        3,
+        2,
+        6,
+        10,
+        3,
+        4,
+        4,
+        6,
+        1,
+        7,
+        0,
+        5,
+        2,
+        4,
+        3,
+    ]
+).reshape((8, 2, 12), order="F")
 
-    # Convert to binary
-    for i in range(bit_length):
-        x_bit_mask[i] = _btest(x, i)
-        y_bit_mask[i] = _btest(y, i)
-        z_bit_mask[i] = _btest(z, i)
+# Maximum number of cells used to cover the bounding box when computing the cpu list
+_MAX_COVERING_CELLS = 2**15
 
-    # Interleave bits
-    for i in range(bit_length):
-        i_bit_mask[3 * i + 2] = x_bit_mask[i]
-        i_bit_mask[3 * i + 1] = y_bit_mask[i]
-        i_bit_mask[3 * i] = z_bit_mask[i]
 
-    # Build Hilbert ordering using state diagram
-    cstate = 0
+def _hilbert3d(x, y, z, bit_length):
+    """
+    Compute the Hilbert keys of the cells with integer coordinates ``x``, ``y`` and
+    ``z`` on a grid of ``2**bit_length`` cells in each dimension. The coordinates
+    can be scalars or arrays, in which case all keys are computed at once.
+    """
+    x, y, z = np.broadcast_arrays(*(np.asarray(c, dtype=np.int64) for c in (x, y, z)))
+    order = np.zeros(x.shape, dtype=np.int64)
+    cstate = np.zeros(x.shape, dtype=np.int64)
+    # Build Hilbert ordering using state diagram, starting from the highest bit
     for i in range(bit_length - 1, -1, -1):
-        b2 = 0
-        if i_bit_mask[3 * i + 2]:
-            b2 = 1
-        b1 = 0
-        if i_bit_mask[3 * i + 1]:
-            b1 = 1
-        b0 = 0
-        if i_bit_mask[3 * i]:
-            b0 = 1
-        sdigit = b2 * 4 + b1 * 2 + b0
-        nstate = state_diagram[sdigit, 0, cstate]
-        hdigit = state_diagram[sdigit, 1, cstate]
-        i_bit_mask[3 * i + 2] = _btest(hdigit, 2)
-        i_bit_mask[3 * i + 1] = _btest(hdigit, 1)
-        i_bit_mask[3 * i] = _btest(hdigit, 0)
-        cstate = nstate
-
-    order = 0
-    for i in range(3 * bit_length):
-        b0 = 0
-        if i_bit_mask[i]:
-            b0 = 1
-        order = order + b0 * (2**i)
+        sdigit = (((x >> i) & 1) << 2) | (((y >> i) & 1) << 1) | ((z >> i) & 1)
+        hdigit = _STATE_DIAGRAM[sdigit, 1, cstate]
+        cstate = _STATE_DIAGRAM[sdigit, 0, cstate]
+        order = (order << 3) | hdigit
+    if order.ndim == 0:
+        return int(order)
     return order
 
 
-def _get_cpu_list(bounding_box, lmax, levelmax, infofile, ncpu, ndim):
-    bound_key = _read_bound_key(infofile=infofile, ncpu=ncpu)
-
-    xmin = bounding_box["xmin"]
-    xmax = bounding_box["xmax"]
-    ymin = bounding_box["ymin"]
-    ymax = bounding_box["ymax"]
-    zmin = bounding_box["zmin"]
-    zmax = bounding_box["zmax"]
-    dmax = max(xmax - xmin, ymax - ymin, zmax - zmin)
-    for ilevel in range(1, lmax + 1):
-        dx = 0.5**ilevel
-        if dx < dmax:
-            break
-
-    lmin = ilevel
-    bit_length = lmin - 1
-    maxdom = 2**bit_length
-    imin = 0
-    imax = 0
-    jmin = 0
-    jmax = 0
-    kmin = 0
-    kmax = 0
-    if bit_length > 0:
-        imin = int(xmin * maxdom)
-        imax = imin + 1
-        jmin = int(ymin * maxdom)
-        jmax = jmin + 1
-        kmin = int(zmin * maxdom)
-        kmax = kmin + 1
+def _get_cpu_list(bounding_box, lmax, levelmax, infofile, ncpu, ndim, cell_filter=None):
+    bound_key = np.array(_read_bound_key(infofile=infofile, ncpu=ncpu), dtype=float)
 
-    dkey = (2 ** (levelmax + 1) // maxdom) ** ndim
-    ndom = 1
-    if bit_length > 0:
-        ndom = 8
-    idom = [imin, imax] * 4
-    jdom = [jmin, jmin, jmax, jmax] * 2
-    kdom = [kmin] * 4 + [kmax] * 4
+    lower = np.array([bounding_box[f"{c}min"] for c in "xyz"])
+    upper = np.array([bounding_box[f"{c}max"] for c in "xyz"])
 
-    bounding_min = [0, 0, 0, 0, 0, 0, 0, 0]
-    bounding_max = [0, 0, 0, 0, 0, 0, 0, 0]
-    bounding = None
-    for i in range(ndom):
-        if bit_length > 0:
-            bounding = _hilbert3d(idom[i], jdom[i], kdom[i], bit_length)
-            order_min = bounding
-        else:
-            order_min = 0
-        bounding_min[i] = order_min * dkey
-        bounding_max[i] = (order_min + 1) * dkey
+    def covering_cells(nx):
+        imin = np.clip(np.floor(lower * nx).astype(np.int64), 0, nx - 1)
+        imax = np.clip(np.ceil(upper * nx).astype(np.int64) - 1, imin, nx - 1)
+        return imin, imax
 
-    cpu_min = [0, 0, 0, 0, 0, 0, 0, 0]
-    cpu_max = [0, 0, 0, 0, 0, 0, 0, 0]
-    for impi in range(ncpu):
-        for i in range(ndom):
-            if (bound_key[impi] <= bounding_min[i]) and (
-                bound_key[impi + 1] > bounding_min[i]
-            ):
-                cpu_min[i] = impi
-
-            if (bound_key[impi] < bounding_max[i]) and (
-                bound_key[impi + 1] >= bounding_max[i]
-            ):
-                cpu_max[i] = impi
+    # Find the finest level at which the bounding box is covered by a limited number
+    # of cells
+    bit_length = 0
+    for bits in range(1, min(lmax, 17) + 1):
+        imin, imax = covering_cells(2**bits)
+        if np.prod(imax - imin + 1) > _MAX_COVERING_CELLS:
+            break
+        bit_length = bits
 
-    cpu_list = []
-    for i in range(ndom):
-        for j in range(cpu_min[i], cpu_max[i] + 1):
-            if j + 1 not in cpu_list:
-                cpu_list.append(j + 1)
+    # Compute the range of Hilbert keys spanned by each of the covering cells
+    imin, imax = covering_cells(2**bit_length)
+    i, j, k = np.meshgrid(
+        *[np.arange(start, end + 1) for start, end in zip(imin, imax)], indexing="ij"
+    )
+    ijk = np.stack([i.ravel(), j.ravel(), k.ravel()], axis=1)
+    # Only keep the cells that intersect the region of interest
+    if cell_filter is not None:
+        ijk = ijk[cell_filter(ijk / 2**bit_length, (ijk + 1) / 2**bit_length)]
+    keys = _hilbert3d(ijk[:, 0], ijk[:, 1], ijk[:, 2], bit_length)
+    dkey = float(2 ** (levelmax + 1 - bit_length)) ** ndim
+    bounding_min = keys * dkey
+    bounding_max = (keys + 1) * dkey
 
-    return cpu_list
+    # Find the cpus whose domains intersect the key ranges
+    cpu_min = np.clip(
+        np.searchsorted(bound_key, bounding_min, side="right") - 1, 0, ncpu - 1
+    )
+    cpu_max = np.clip(
+        np.searchsorted(bound_key, bounding_max, side="left") - 1, 0, ncpu - 1
+    )
+    selected = np.zeros(ncpu + 1, dtype=np.int64)
+    np.add.at(selected, cpu_min, 1)
+    np.add.at(selected, cpu_max + 1, -1)
+    return [int(cpu) + 1 for cpu in np.flatnonzero(np.cumsum(selected)[:ncpu])]
 
 
-def hilbert_cpu_list(meta, scaling, select, infofile):
+def hilbert_cpu_list(meta, scaling, select, infofile, region=None):
     if meta["ordering type"] != "hilbert":
         return
-    if not isinstance(select, dict):
+    if not isinstance(select, dict) and region is None:
         return
     bounding_box = {"xmin": 0, "xmax": 1, "ymin": 0, "ymax": 1, "zmin": 0, "zmax": 1}
     # Make an array of cell centers according to lmax
@@ -363,7 +312,7 @@ def hilbert_cpu_list(meta, scaling, select, infofile):
     new_bbox = False
     for c in "xyz":
         key = f"position_{c}"
-        if key in select:
+        if isinstance(select, dict) and key in select:
             new_bbox = True
             func_test = select[key](xyz_centers)
             inds = np.argwhere(func_test.values).ravel()
@@ -372,6 +321,18 @@ def hilbert_cpu_list(meta, scaling, select, infofile):
             bounding_box["{}min".format(c)] = start._array / box_size
             bounding_box["{}max".format(c)] = end._array / box_size
 
+    # Restrict the bounding box to the region, and only keep the parts of the
+    # Hilbert curve that intersect the region
+    cell_filter = None
+    if region is not None and meta["ndim"] == 3:
+        new_bbox = True
+        box_length = meta["boxlen"] * scaling
+        lower, upper = region.bounds(box_length)
+        for n, c in enumerate("xyz"):
+            bounding_box[f"{c}min"] = max(bounding_box[f"{c}min"], lower[n])
+            bounding_box[f"{c}max"] = min(bounding_box[f"{c}max"], upper[n])
+        cell_filter = partial(region.intersects, length=box_length)
+
     if new_bbox:
         return _get_cpu_list(
             bounding_box=bounding_box,
@@ -380,4 +341,5 @@ def hilbert_cpu_list(meta, scaling, select, infofile):
             infofile=infofile,
             ncpu=meta["ncpu"],
             ndim=meta["ndim"],
+            cell_filter=cell_filter,
         )
@@ -4,7 +4,6 @@ import os
 
 import numpy as np
 
-from . import utils
 from .reader import Reader
 
 
@@ -37,12 +36,8 @@ class HydroReader(Reader):
 
     def read_header(self, info):
         # hydro gamma
-        self.offsets["i"] += 5
-        self.offsets["n"] += 5
-        [info["gamma"]] = utils.read_binary_data(
-            fmt="d", content=self.bytes, offsets=self.offsets
-        )
+        self.skip_records(5)
+        [info["gamma"]] = self.read_record("d")
 
     def read_domain_header(self):
-        self.offsets["n"] += 2
-        self.offsets["i"] += 2
+        self.skip_records(2)
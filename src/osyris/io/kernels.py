@@ -0,0 +1,100 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+import numpy as np
+from numba import njit
+
+from .amr import AmrReader
+from .reader import Reader
+
+
+def supports(reader):
+    """
+    Return ``True`` if the cache lines of the reader can be decoded by the compiled
+    kernels: the AMR reader, and the readers which store one record of doubles per
+    variable and per cell in the oct (hydro, gravity, rt).
+    """
+    if reader.kind != "mesh":
+        return True
+    if isinstance(reader, AmrReader):
+        return True
+    return (
+        type(reader).read_variables is Reader.read_variables
+        and type(reader).step_over is Reader.step_over
+        and all(
+            item["type"] == "d" for item in reader.variables.values() if item["read"]
+        )
+    )
+
+
+@njit(cache=True)
+def _skip_records(buffer, cursor, nrecords):
+    for _ in range(nrecords):
+        cursor += buffer[cursor : cursor + 4].view(np.int32)[0] + 8
+    return cursor
+
+
+@njit(cache=True)
+def decode_amr_blocks(
+    buffer, cursors, levels, ncaches, ndim, lmax, xbound, position, dxcell, leaf
+):
+    """
+    Decode the cache lines of an AMR file, starting at byte positions ``cursors``.
+    The positions of the cell centers (in units of the box size), the cell sizes and
+    the leaf cell flags are written to the output arrays, in the same order as they
+    are read by the ``AmrReader``.
+    """
+    twotondim = 2**ndim
+    offset = 0
+    for block in range(len(cursors)):
+        ilevel = levels[block]
+        ncache = ncaches[block]
+        dx = 0.5 ** (ilevel + 1)
+        # Skip grid index, next and prev, and read grid coordinates
+        cursor = _skip_records(buffer, cursors[block], 3)
+        xg = np.empty((ndim, ncache))
+        for n in range(ndim):
+            xg[n] = buffer[cursor + 4 : cursor + 4 + 8 * ncache].view(np.float64)
+            cursor += 8 * ncache + 8
+        # Skip father and neighbour indices
+        cursor = _skip_records(buffer, cursor, 1 + 2 * ndim)
+        for ind in range(twotondim):
+            iz = ind // 4
+            iy = (ind - 4 * iz) // 2
+            ix = ind - 2 * iy - 4 * iz
+            xcent = ((ix - 0.5) * dx, (iy - 0.5) * dx, (iz - 0.5) * dx)
+            son = buffer[cursor + 4 : cursor + 4 + 4 * ncache].view(np.int32)
+            cursor += 4 * ncache + 8
+            start = offset + ind * ncache
+            for i in range(ncache):
+                for n in range(ndim):
+                    position[n, start + i] = xg[n, i] + xcent[n] - xbound[n]
+                dxcell[start + i] = dx
+                leaf[start + i] = not (son[i] > 0 and ilevel < lmax - 1)
+        offset += ncache * twotondim
+
+
+@njit(cache=True)
+def decode_variable_blocks(buffer, cursors, ncaches, twotondim, slots, scales, out):
+    """
+    Decode the cache lines of a hydro, gravity or rt file, starting at byte positions
+    ``cursors``. The values of the variable number ``ivar`` in the file are
+    multiplied by ``scales[ivar]`` and written to the row ``slots[ivar]`` of the
+    output array, or skipped if the slot is negative.
+    """
+    offset = 0
+    for block in range(len(cursors)):
+        cursor = cursors[block]
+        ncache = ncaches[block]
+        for ind in range(twotondim):
+            start = offset + ind * ncache
+            for ivar in range(len(slots)):
+                size = buffer[cursor : cursor + 4].view(np.int32)[0]
+                if slots[ivar] >= 0:
+                    values = buffer[cursor + 4 : cursor + 4 + 8 * ncache].view(
+                        np.float64
+                    )
+                    for i in range(ncache):
+                        out[slots[ivar], start + i] = values[i] * scales[ivar]
+                cursor += size + 8
+        offset += ncache * twotondim
@@ -1,18 +1,72 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
 
+import mmap
+import multiprocessing
 import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import numpy as np
 
-from ..core import Array, Datagroup
-from . import utils
+from ..core import Array, Datagroup, Vector
+from . import kernels, utils
 from .amr import AmrReader
+from .cache import cache_directory, read_cache, write_cache
 from .grav import GravReader
 from .hydro import HydroReader
+from .octree import Octree, oct_pieces
 from .part import PartReader
+from .plan import LoadPlan
+from .prefetch import Prefetcher
+from .report import LoadReport
 from .rt import RtReader
 from .sink import SinkReader
+from .zonemap import ZoneMap
+
+# State shared with the worker processes of the process pool. It is set just before
+# the pool is created, and inherited by the forked workers, so that the readers and
+# the user selection functions (which are often lambdas) do not need to be pickled.
+_worker_state = {}
+
+
+def _read_cpu_in_worker(cpu_num):
+    state = _worker_state
+    meta = state["meta"]
+    meta["ncells"] = 0
+    meta["nparticles"] = 0
+    state["loader"].report = LoadReport()
+    chunk = state["loader"]._read_cpu(
+        cpu_num=cpu_num,
+        readers=state["readers"],
+        select=state["select"],
+        meta=meta,
+        lmax=state["lmax"],
+    )
+    index = state["loader"].index
+    rows = None
+    if index is not None:
+        rows = {group: index[group][cpu_num - 1] for group in index}
+    zone_map = state["loader"].zone_map
+    zone_rows = None if zone_map is None else zone_map.rows(cpu_num)
+    return (
+        chunk,
+        meta["ncells"],
+        meta["nparticles"],
+        rows,
+        zone_rows,
+        state["loader"].report,
+    )
+
+
+def _astype(array, dtype):
+    if isinstance(array, Vector):
+        return Vector(
+            **{c: _astype(xyz, dtype) for c, xyz in array._xyz.items()},
+            name=array.name,
+        )
+    return Array(values=array.values.astype(dtype), unit=array.unit, name=array.name)
 
 
 class Loader:
@@ -29,6 +83,15 @@ class Loader:
             "rt": RtReader(),
             "sink": SinkReader(),
         }
+        self.index = None
+        self.zone_map = None
+        self.pruned = set()
+        self.compiled = True
+        self.octree = False
+        self.column_cache = None
+        self.dtype = None
+        self.report = LoadReport()
+        self.selection = None
 
     def load_metadata(self):
         # Read info file and create info dictionary
@@ -45,7 +108,348 @@ class Loader:
         meta["nparticles"] = 0
         return meta
 
-    def load(self, select=None, cpu_list=None, sortby=None, meta=None, units=None):
+    def load(
+        self,
+        select=None,
+        cpu_list=None,
+        sortby=None,
+        meta=None,
+        units=None,
+        workers=None,
+        index=True,
+        preallocate=False,
+        lazy=False,
+        cache=None,
+        region=None,
+        prefetch=None,
+        prefetch_max_bytes=None,
+        compiled=True,
+        dtype=None,
+        column_cache=None,
+        prune=False,
+        octree=False,
+        report=None,
+    ):
+        # Reuse the arrays of a previous load with the same arguments, if the files
+        # have not changed since
+        if cache is not None:
+            if lazy:
+                raise ValueError("The cache cannot be used with lazy loading.")
+            if octree:
+                raise ValueError("The cache cannot be used with the octree.")
+            cache_dir = cache_directory(
+                cache,
+                meta["infile"],
+                select=select,
+                cpu_list=cpu_list,
+                sortby=sortby,
+                region=region,
+                dtype=dtype,
+                prune=prune,
+            )
+            out = read_cache(cache_dir, infile=meta["infile"], meta=meta)
+            if out is not None:
+                self.selection = None
+                print(
+                    "Loaded from cache: {} cells, {} particles.".format(
+                        meta["ncells"], meta["nparticles"]
+                    )
+                )
+                return out
+
+        out = {}
+        for out in self.iter_chunks(
+            select=select,
+            cpu_list=cpu_list,
+            meta=meta,
+            units=units,
+            workers=workers,
+            index=index,
+            preallocate=preallocate,
+            lazy=lazy,
+            region=region,
+            prefetch=prefetch,
+            prefetch_max_bytes=prefetch_max_bytes,
+            compiled=compiled,
+            dtype=dtype,
+            column_cache=column_cache,
+            prune=prune,
+            octree=octree,
+            report=report,
+        ):
+            pass
+
+        # Apply sorting if any requested from args
+        if sortby is not None:
+            for group, key in sortby.items():
+                if group in out and key is not None:
+                    if isinstance(key, str):
+                        key = np.argsort(out[group][key]).values
+                    out[group].sortby(key)
+                    # Record the order of the cells for loading more variables
+                    if group == "mesh":
+                        self.selection["order"] = key
+                        if "octree" in meta:
+                            meta["octree"].reorder(key)
+
+        if cache is not None:
+            write_cache(cache_dir, infile=meta["infile"], groups=out, meta=meta)
+
+        return out
+
+    def iter_chunks(
+        self,
+        select=None,
+        cpu_list=None,
+        chunk_cpus=None,
+        meta=None,
+        units=None,
+        workers=None,
+        index=True,
+        preallocate=False,
+        lazy=False,
+        region=None,
+        prefetch=None,
+        prefetch_max_bytes=None,
+        compiled=True,
+        dtype=None,
+        column_cache=None,
+        prune=False,
+        octree=False,
+        report=None,
+    ):
+        """
+        Read the files of the cpus in batches of ``chunk_cpus`` cpus, and yield a
+        dict of Datagroups for every batch. The groups which are not read from the
+        cpu files (i.e. the sink particles) are only included in the first batch.
+        If ``chunk_cpus`` is ``None``, all the cpus are read in a single batch.
+        The time spent in the different phases is recorded in the ``report``.
+        """
+        self.report = report if report is not None else LoadReport()
+        _select, readers, out, lmax = self._initialize_readers(
+            select=select, meta=meta, units=units, region=region, dtype=dtype
+        )
+        do_not_load_amr = lmax == 0
+        do_not_load_cpus = len(readers) == 0
+
+        # In lazy mode, only the variables needed for the selection are read. The
+        # others are read from the files when they are accessed for the first time.
+        deferred = {}
+        if lazy and not do_not_load_amr:
+            deferred = self._defer_variables(
+                readers=readers, select=_select["mesh"], ndim=meta["ndim"]
+            )
+
+        cpu_list = self._default_cpu_list(cpu_list, readers=readers, meta=meta)
+
+        # Read the index of record offsets and the zone map of previous loads
+        index_file = utils.generate_fname(
+            meta["nout"], meta["path"], ftype="osyris_index", cpuid=0, ext=".npz"
+        )
+        zone_file = utils.generate_fname(
+            meta["nout"], meta["path"], ftype="osyris_zonemap", cpuid=0, ext=".npz"
+        )
+        self.index = None
+        self.zone_map = None
+        if index and not do_not_load_amr:
+            self.index = utils.read_record_index(
+                fname=index_file,
+                groups=[g for g, r in readers.items() if r.kind == "mesh"],
+                ncpu=meta["ncpu"],
+                levelmax=meta["levelmax"],
+            )
+            self.zone_map = ZoneMap.read(
+                fname=zone_file, ncpu=meta["ncpu"], levelmax=meta["levelmax"]
+            )
+        self.index_modified = False
+
+        # Skip the mesh files which cannot contain any selected cell
+        self.pruned = set()
+        if prune:
+            self.pruned = self._prune_cpu_list(
+                zone_map=self.zone_map,
+                cpu_list=cpu_list,
+                readers=readers,
+                select=_select["mesh"],
+                meta=meta,
+                lmax=lmax,
+            )
+        if not do_not_load_cpus:
+            print("Processing {} files in {}".format(len(cpu_list), meta["infile"]))
+            if len(self.pruned) > 0:
+                print(
+                    "Skipping the mesh files of {} cpus using the zone map".format(
+                        len(self.pruned)
+                    )
+                )
+        self.compiled = compiled
+        self.octree = octree and not do_not_load_amr
+        self.column_cache = column_cache
+
+        if chunk_cpus is None or len(cpu_list) == 0:
+            batches = [cpu_list]
+        else:
+            batches = [
+                cpu_list[i : i + chunk_cpus]
+                for i in range(0, len(cpu_list), chunk_cpus)
+            ]
+
+        for dg in out.values():
+            utils.make_vector_arrays(dg, ndim=meta["ndim"])
+
+        try:
+            for batch in batches:
+                if not do_not_load_cpus:
+                    meta["ncells"] = 0
+                    meta["nparticles"] = 0
+                out.update(
+                    self._read_batch(
+                        cpu_list=batch,
+                        readers=readers,
+                        select=_select,
+                        meta=meta,
+                        units=units,
+                        lmax=lmax,
+                        workers=workers,
+                        preallocate=preallocate,
+                        deferred=deferred,
+                        prefetch=prefetch,
+                        prefetch_max_bytes=prefetch_max_bytes,
+                    )
+                )
+                yield out
+                out = {}
+        finally:
+            if self.index_modified:
+                utils.write_record_index(fname=index_file, index=self.index)
+            if self.zone_map is not None and self.zone_map.modified:
+                self.zone_map.write(zone_file)
+
+    def plan(
+        self,
+        select=None,
+        cpu_list=None,
+        meta=None,
+        units=None,
+        region=None,
+        dtype=None,
+        preallocate=False,
+        prune=False,
+    ):
+        """
+        Estimate the size of a load with the same arguments, by reading only the
+        headers of the AMR and particle files. Return a ``LoadPlan``.
+        If the zone map of a previous load is available, it is used to count the
+        leaf cells and to find the mesh files which would be skipped.
+        """
+        # Use a copy of the metadata, which is modified by the readers
+        info = dict(meta)
+        _select, readers, out, lmax = self._initialize_readers(
+            select=select, meta=info, units=units, region=region, dtype=dtype
+        )
+        cpu_list = self._default_cpu_list(cpu_list, readers=readers, meta=info)
+        twotondim = 2 ** info["ndim"]
+
+        zone_map = None
+        pruned = set()
+        if lmax > 0:
+            zone_map = ZoneMap.read(
+                fname=utils.generate_fname(
+                    info["nout"],
+                    info["path"],
+                    ftype="osyris_zonemap",
+                    cpuid=0,
+                    ext=".npz",
+                ),
+                ncpu=info["ncpu"],
+                levelmax=info["levelmax"],
+            )
+            if prune:
+                pruned = self._prune_cpu_list(
+                    zone_map=zone_map,
+                    cpu_list=cpu_list,
+                    readers=readers,
+                    select=_select["mesh"],
+                    meta=info,
+                    lmax=lmax,
+                )
+
+        files = {}
+        ncells = []
+        nparticles = []
+        for cpu_num in cpu_list:
+            stats = {}
+            for group, reader in readers.items():
+                if cpu_num in pruned and reader.kind == "mesh":
+                    continue
+                fname = utils.generate_fname(
+                    info["nout"], info["path"], ftype=group, cpuid=cpu_num
+                )
+                stat = os.stat(fname)
+                files[fname] = stat.st_size
+                stats[group] = [stat.st_mtime_ns, stat.st_size]
+            ncells.append(0)
+            nparticles.append(0)
+            if "amr" in stats:
+                ncells[-1] = zone_map.leaf_cells(
+                    cpu_num=cpu_num, stat=stats["amr"], lmax=lmax
+                )
+            if "amr" in stats and ncells[-1] is None:
+                amr = {"amr": readers["amr"]}
+                self._map_files(cpu_num=cpu_num, readers=amr, meta=info)
+                amr["amr"].cursor = 0
+                amr["amr"].read_header(info)
+                ncells[-1] = twotondim * int(
+                    np.sum(amr["amr"].meta["ngridlevel"][cpu_num - 1, :lmax])
+                )
+                amr["amr"].bytes = None
+            if "part" in readers:
+                part = {"part": readers["part"]}
+                self._map_files(cpu_num=cpu_num, readers=part, meta=info)
+                nparticles[-1] = part["part"].read_nparticles()
+                part["part"].bytes = None
+
+        # Number of bytes per cell and per particle
+        itemsizes = {"mesh": {}, "part": {}}
+        for reader in readers.values():
+            for key, item in reader.variables.items():
+                if item["read"]:
+                    itemsizes[reader.kind][key] = item["dtype"].itemsize
+        count = {"mesh": sum(ncells), "part": sum(nparticles)}
+        columns = {
+            kind: {key: size * count[kind] for key, size in sizes.items()}
+            for kind, sizes in itemsizes.items()
+            if len(sizes) > 0
+        }
+        for name, group in out.items():
+            columns[name] = {key: int(array.nbytes) for key, array in group.items()}
+            fname = utils.generate_fname(
+                info["nout"], info["path"], ftype=name, cpuid=0, ext=".csv"
+            )
+            files[fname] = os.path.getsize(fname)
+
+        return LoadPlan(
+            cpu_list=cpu_list,
+            files=files,
+            ncells=count["mesh"],
+            nparticles=count["part"],
+            columns=columns,
+            nbytes_per_cpu=[
+                n * sum(itemsizes["mesh"].values())
+                + p * sum(itemsizes["part"].values())
+                for n, p in zip(ncells, nparticles)
+            ],
+            preallocate=preallocate,
+        )
+
+    def _initialize_readers(self, select, meta, units, region, dtype):
+        """
+        Parse the selection, and initialize the readers of the groups to be loaded.
+        Return the selection for each kind of reader, the readers which need to read
+        the cpu files, the groups which are loaded on initialization (i.e. the sink
+        particles), and the number of AMR levels to read (zero if the AMR files are
+        not needed).
+        """
         out = {}
 
         _select = {reader.kind: {} for reader in self.readers.values()}
@@ -56,25 +460,23 @@ class Loader:
                         f"Warning: {key} found in select is not a valid " "Datagroup."
                     )
                 else:
-                    _select[key] = select[key]
+                    _select[key] = utils.parse_criteria(select[key])
         elif select:
             for key in _select:
                 _select[key] = key in select
 
         # Take into account user specified lmax
         meta["lmax"] = meta["levelmax"]
-        if "amr" in _select:
-            if _select["amr"]:
-                if "level" in _select["amr"]:
-                    meta["lmax"] = utils.find_max_amr_level(
-                        levelmax=meta["levelmax"], select=_select["amr"]
-                    )
+        if isinstance(_select["mesh"], dict) and "level" in _select["mesh"]:
+            meta["lmax"] = utils.find_max_amr_level(
+                levelmax=meta["levelmax"], select=_select["mesh"]
+            )
 
         # Initialize readers
         readers = {}
         do_not_load_amr = True
-        do_not_load_cpus = True
         for group, reader in self.readers.items():
+            reader.region = region
             loaded_on_init = reader.initialize(
                 meta=meta, units=units, select=_select[reader.kind]
             )
@@ -84,156 +486,1067 @@ class Loader:
                 readers[group] = reader
                 if reader.kind == "mesh":
                     do_not_load_amr = False
-                if reader.kind in ("mesh", "part"):
-                    do_not_load_cpus = False
         # If no reader requires the AMR tree to be read, set lmax to zero
         if do_not_load_amr:
             lmax = 0
         else:
-            meta["ncells"] = 0
             lmax = meta["lmax"]
             if "amr" not in readers:
                 readers["amr"] = self.readers["amr"]
 
-        # Take into account user specified cpu list
+        # Cast the floating point variables to the requested type while decoding. The
+        # groups loaded on initialization are small, and are simply cast.
+        self.dtype = dtype
+        if dtype is not None:
+            for reader in readers.values():
+                reader.set_dtype(dtype, meta)
+            for dg in out.values():
+                for key, array in dg.items():
+                    if array.dtype.kind == "f" and not utils.is_geometry(key):
+                        dg[key] = _astype(array, dtype)
+
+        return _select, readers, out, lmax
+
+    def _default_cpu_list(self, cpu_list, readers, meta):
+        """
+        Return the list of cpus to read: the list given by the user, or the cpus
+        whose domains intersect the selection. The list is empty if no reader
+        requires the cpu files (if loading only sinks).
+        """
+        if len(readers) == 0:
+            return []
         if cpu_list is None:
             cpu_list = (
                 self.readers["amr"].cpu_list
                 if self.readers["amr"].cpu_list is not None
                 else range(1, meta["ncpu"] + 1)
             )
+        return cpu_list
 
-        # If no reader requires the CPUs (if loading only sinks), make empty cpu list
-        if do_not_load_cpus:
-            cpu_list = []
-        else:
-            meta["nparticles"] = 0
-            print("Processing {} files in {}".format(len(cpu_list), meta["infile"]))
+    def _prune_cpu_list(self, zone_map, cpu_list, readers, select, meta, lmax):
+        """
+        Return the cpus whose mesh files can be skipped, because the ranges of
+        values recorded in the zone map show that none of their cells satisfy one
+        of the interval selection criteria.
+        """
+        if zone_map is None or not isinstance(select, dict):
+            return set()
+        return {
+            cpu_num
+            for cpu_num in cpu_list
+            if zone_map.can_skip(
+                cpu_num=cpu_num,
+                readers=readers,
+                select=select,
+                fnames={
+                    group: utils.generate_fname(
+                        meta["nout"], meta["path"], ftype=group, cpuid=cpu_num
+                    )
+                    for group in readers
+                },
+                lmax=lmax,
+            )
+        }
 
-        # Allocate work arrays
-        twotondim = 2 ** meta["ndim"]
+    def _read_batch(
+        self,
+        cpu_list,
+        readers,
+        select,
+        meta,
+        units,
+        lmax,
+        workers,
+        preallocate,
+        deferred,
+        prefetch,
+        prefetch_max_bytes,
+    ):
+        """
+        Read the files of the cpus in the list, and merge the selected data into a
+        dict of Datagroups.
+        """
+        out = {}
 
-        iprog = 1
-        istep = 10
-        npieces = 0
+        # With preallocation, the number of leaf cells and particles in each cpu is
+        # counted in a first pass, and the selected cells are written directly into
+        # the final arrays. Otherwise, the pieces are concatenated at the end.
+        counts = None
+        if preallocate:
+            counts = self._count_cells_and_particles(
+                cpu_list=cpu_list, readers=readers, meta=meta, lmax=lmax
+            )
+        columns = {
+            group: {
+                key: {"pieces": [], "values": None, "size": 0}
+                for key, item in reader.variables.items()
+                if item["read"]
+            }
+            for group, reader in readers.items()
+        }
+        masks = {}
+        octs = []
 
-        # byte, integer, double, line, string, quad, long
-        null_offsets = {key: 0 for key in "bidnsql"}
+        self._read_cpus(
+            cpu_list=cpu_list,
+            readers=readers,
+            select=select,
+            meta=meta,
+            lmax=lmax,
+            workers=workers,
+            prefetch=prefetch,
+            prefetch_max_bytes=prefetch_max_bytes,
+            store=lambda chunk: self._store_chunk(
+                chunk=chunk,
+                columns=columns,
+                masks=masks,
+                octs=octs,
+                readers=readers,
+                counts=counts,
+            ),
+        )
 
-        # Loop over the cpus and read the AMR and HYDRO files in binary format
-        for cpu_ind, cpu_num in enumerate(cpu_list):
-            # Print progress
-            percentage = int(float(cpu_ind) * 100.0 / float(len(cpu_list)))
-            if percentage >= iprog * istep:
-                print(
-                    "{:>3d}% : read {:>10d} cells, {:>10d} particles".format(
-                        percentage, meta["ncells"], meta["nparticles"]
+        # Merge all the data pieces into the Arrays
+        with self.report.time("concatenate"):
+            for group, reader in readers.items():
+                name = reader.kind
+                if name not in out:
+                    out[name] = Datagroup()
+                for key, column in columns[group].items():
+                    if column["values"] is not None:
+                        values = column["values"]
+                        values.resize(column["size"], refcheck=False)
+                    elif len(column["pieces"]) > 0:
+                        values = np.concatenate(column["pieces"])
+                    else:
+                        continue
+                    out[name][key] = Array(
+                        values=values, unit=reader.variables[key]["unit"].units
                     )
+
+        with self.report.time("vectors"):
+            for dg in out.values():
+                # If vector quantities are found, make them into vector Arrays
+                utils.make_vector_arrays(dg, ndim=meta["ndim"])
+
+        meta.pop("octree", None)
+        if self.octree:
+            meta["octree"] = self._build_octree(octs, ndim=meta["ndim"])
+
+        # Keep the selection, so that more variables can be read for the same cells
+        self.selection = {
+            "cpu_list": list(cpu_list),
+            "masks": masks,
+            "lmax": lmax,
+            "dtype": self.dtype,
+            "order": None,
+        }
+
+        for name, components in deferred.items():
+            out["mesh"].defer(
+                name,
+                partial(
+                    self._load_deferred,
+                    components=components,
+                    cpu_list=list(cpu_list),
+                    masks=masks,
+                    meta=meta,
+                    units=units,
+                    lmax=lmax,
+                    dtype=self.dtype,
+                ),
+            )
+
+        print(
+            "Loaded: {} cells, {} particles.".format(meta["ncells"], meta["nparticles"])
+        )
+        return out
+
+    def _read_cpus(
+        self,
+        cpu_list,
+        readers,
+        select,
+        meta,
+        lmax,
+        workers,
+        store,
+        prefetch=None,
+        prefetch_max_bytes=None,
+    ):
+        """
+        Read the files of all the cpus in the list, either serially or using a pool
+        of ``workers`` processes. The selected pieces of every cpu are handed to the
+        ``store`` function in the same order as the cpu list, so that the final
+        arrays are identical regardless of the number of workers.
+
+        When reading serially, the files of the next ``prefetch`` cpus can be read
+        into memory by a background thread while the current cpu is decoded.
+        """
+        if workers is None:
+            workers = 1
+        if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            warnings.warn(
+                "Loading with multiple workers requires the 'fork' start method, "
+                "which is not available on this platform. Falling back to serial "
+                "loading."
+            )
+            workers = 1
+        workers = min(workers, len(cpu_list))
+
+        progress = {"iprog": 1, "istep": 10}
+
+        if workers <= 1:
+            prefetcher = None
+            if prefetch and len(cpu_list) > 0:
+                prefetcher = Prefetcher(
+                    fnames=[
+                        {
+                            group: utils.generate_fname(
+                                meta["nout"], meta["path"], ftype=group, cpuid=cpu_num
+                            )
+                            for group, reader in readers.items()
+                            if cpu_num not in self.pruned or reader.kind != "mesh"
+                        }
+                        for cpu_num in cpu_list
+                    ],
+                    depth=prefetch,
+                    max_bytes=prefetch_max_bytes,
                 )
-                iprog += 1
+            try:
+                for cpu_ind, cpu_num in enumerate(cpu_list):
+                    self._print_progress(cpu_ind, len(cpu_list), meta, progress)
+                    buffers = None
+                    if prefetcher is not None:
+                        with self.report.time("read"):
+                            buffers = prefetcher.get()
+                    store(
+                        self._read_cpu(
+                            cpu_num=cpu_num,
+                            readers=readers,
+                            select=select,
+                            meta=meta,
+                            lmax=lmax,
+                            buffers=buffers,
+                        )
+                    )
+                    self.report.update(meta)
+            finally:
+                if prefetcher is not None:
+                    prefetcher.close()
+            return
 
-            # Read binary files
-            for group, reader in readers.items():
-                fname = utils.generate_fname(
-                    meta["nout"], meta["path"], ftype=group, cpuid=cpu_num
+        _worker_state.update(
+            loader=self,
+            readers=readers,
+            select=select,
+            meta=dict(meta),
+            lmax=lmax,
+        )
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("fork")
+            ) as pool:
+                # The first cpu is read by the main process while the workers are
+                # busy with the others. This also ensures that the header
+                # information (e.g. gamma) is recorded in the metadata.
+                results = pool.map(
+                    _read_cpu_in_worker,
+                    cpu_list[1:],
+                    chunksize=max(1, (len(cpu_list) - 1) // (4 * workers)),
+                )
+                store(
+                    self._read_cpu(
+                        cpu_num=cpu_list[0],
+                        readers=readers,
+                        select=select,
+                        meta=meta,
+                        lmax=lmax,
+                    )
                 )
-                with open(fname, mode="rb") as f:
-                    reader.bytes = f.read()
+                self.report.update(meta)
+                for cpu_ind, (
+                    chunk,
+                    ncells,
+                    nparticles,
+                    rows,
+                    zone_rows,
+                    report,
+                ) in enumerate(results):
+                    self._print_progress(cpu_ind + 1, len(cpu_list), meta, progress)
+                    store(chunk)
+                    meta["ncells"] += ncells
+                    meta["nparticles"] += nparticles
+                    self.report.merge(report)
+                    self.report.update(meta)
+                    cpu_num = cpu_list[cpu_ind + 1]
+                    if zone_rows is not None:
+                        self.zone_map.update_rows(cpu_num, zone_rows)
+                    if rows is not None:
+                        for group, row in rows.items():
+                            if not np.array_equal(self.index[group][cpu_num - 1], row):
+                                self.index[group][cpu_num - 1] = row
+                                self.index_modified = True
+        finally:
+            _worker_state.clear()
 
-            # Read file headers
+    def _store_chunk(self, chunk, columns, masks, octs, readers, counts):
+        """
+        Store the pieces, selection masks and octs read from a cpu. If the total
+        number of cells and particles is known, the pieces are copied into arrays
+        allocated with the final size.
+        """
+        masks[chunk["cpu"]] = chunk["masks"]
+        if chunk["octs"] is not None:
+            octs.append(chunk["octs"])
+        with self.report.time("concatenate"):
+            for group, variables in chunk["pieces"].items():
+                for key, arrays in variables.items():
+                    column = columns[group][key]
+                    if counts is None:
+                        column["pieces"] += arrays
+                        continue
+                    for array in arrays:
+                        if column["values"] is None:
+                            column["values"] = np.empty(
+                                counts[readers[group].kind], dtype=array.dtype
+                            )
+                        size = column["size"]
+                        column["values"][size : size + len(array)] = array
+                        column["size"] += len(array)
+
+    def _build_octree(self, octs, ndim):
+        """
+        Merge the octs read from the files of all the cpus into an ``Octree``, and
+        link the octs to the cells of the mesh, which are stored in the same order
+        as the cpus.
+        """
+        noct = np.cumsum([0] + [len(piece["level"]) for piece in octs])
+        cell_oct = np.concatenate(
+            [piece["cell_oct"] + start for piece, start in zip(octs, noct)]
+            or [np.empty(0, dtype=np.int64)]
+        )
+        cell_ind = np.concatenate(
+            [piece["cell_ind"] for piece in octs] or [np.empty(0, dtype=np.int8)]
+        )
+        cells = np.full((noct[-1], 2**ndim), -1, dtype=np.int64)
+        cells[cell_oct, cell_ind] = np.arange(len(cell_oct))
+        return Octree(
+            level=np.concatenate(
+                [piece["level"] for piece in octs] or [np.empty(0, dtype=np.int8)]
+            ),
+            coords=np.concatenate(
+                [piece["coords"] for piece in octs]
+                or [np.empty((0, ndim), dtype=np.int32)]
+            ),
+            cells=cells,
+        )
+
+    def _count_cells_and_particles(self, cpu_list, readers, meta, lmax):
+        """
+        Count the number of leaf cells and particles in the files of all the cpus in
+        the list, by reading only the headers and the son indices of the AMR files,
+        and the headers of the particle files. This gives the maximum number of cells
+        and particles that can be selected.
+        """
+        counts = {"mesh": 0, "part": 0}
+        amr = {"amr": readers["amr"]} if "amr" in readers else {}
+        for cpu_num in cpu_list:
+            if cpu_num not in self.pruned:
+                stats = self._map_files(cpu_num=cpu_num, readers=amr, meta=meta)
+                for reader in amr.values():
+                    reader.cursor = 0
+                    reader.read_header(meta)
+                for ilevel, ncache in self._walk_own_blocks(
+                    cpu_num=cpu_num, readers=amr, meta=meta, lmax=lmax, stats=stats
+                ):
+                    counts["mesh"] += amr["amr"].count_leaf_cells(
+                        ncache=ncache, ilevel=ilevel, info=meta
+                    )
+            if "part" in readers:
+                self._map_files(
+                    cpu_num=cpu_num, readers={"part": readers["part"]}, meta=meta
+                )
+                counts["part"] += readers["part"].read_nparticles()
             for reader in readers.values():
-                reader.offsets.update(null_offsets)
+                reader.bytes = None
+        return counts
+
+    def _print_progress(self, cpu_ind, ncpus, meta, progress):
+        percentage = int(float(cpu_ind) * 100.0 / float(ncpus))
+        if percentage >= progress["iprog"] * progress["istep"]:
+            print(
+                "{:>3d}% : read {:>10d} cells, {:>10d} particles".format(
+                    percentage, meta["ncells"], meta["nparticles"]
+                )
+            )
+            progress["iprog"] += 1
+
+    def _read_cpu(self, cpu_num, readers, select, meta, lmax, masks=None, buffers=None):
+        """
+        Read the AMR, hydro, gravity, rt and particle files of a single cpu, and
+        return the pieces of data that satisfy the selection criteria, as a dict
+        of lists of arrays for each reader. The selection masks of all the cache
+        lines are also returned (as packed bits), so that more variables can be read
+        later for the same cells.
+
+        If ``masks`` are given, they are used instead of the selection criteria, and
+        the readers that have no variables to read simply step over the cache lines.
+
+        If ``buffers`` are given, they contain the contents of the files, which have
+        already been read into memory.
+        """
+        # The mesh files of the cpus skipped using the zone map are not read
+        if masks is None and cpu_num in self.pruned:
+            readers = {g: r for g, r in readers.items() if r.kind != "mesh"}
+            lmax = 0
+
+        with self.report.time("open"):
+            stats = self._map_files(
+                cpu_num=cpu_num, readers=readers, meta=meta, buffers=buffers
+            )
+        for group, stat in stats.items():
+            self.report.add_file_nbytes(group, stat[1])
+
+        # Read file headers
+        with self.report.time("header"):
+            for reader in readers.values():
+                reader.cursor = 0
                 reader.read_header(meta)
 
-            # Loop over levels
-            for ilevel in range(lmax):
-                for reader in readers.values():
-                    reader.read_level_header(ilevel, twotondim)
+        # Readers with nothing to read do not need to decode the cache lines, apart
+        # from the AMR reader which is needed to find the leaf cells
+        active = {
+            group: reader
+            for group, reader in readers.items()
+            if any(item["read"] for item in reader.variables.values())
+            or (group == "amr" and masks is None)
+        }
 
-                # Loop over domains
-                for domain in range(readers["amr"].meta["nboundary"] + meta["ncpu"]):
-                    ncache = readers["amr"].meta["ngridlevel"][domain, ilevel]
+        decode = (
+            self._decode_cachelines_compiled
+            if self.compiled and all(kernels.supports(r) for r in active.values())
+            else self._decode_cachelines
+        )
+        # The selection is timed separately by the decoding functions
+        selection = self.report.timings["selection"]
+        with self.report.time("decode"):
+            selections, octs = decode(
+                cpu_num=cpu_num,
+                readers=readers,
+                active=active,
+                select=select,
+                meta=meta,
+                lmax=lmax,
+                stats=stats,
+                masks=masks,
+            )
+        self.report.timings["decode"] -= self.report.timings["selection"] - selection
 
-                    for reader in readers.values():
-                        reader.read_domain_header()
+        # Collect the pieces and reset the readers for the next cpu
+        pieces = {}
+        for group, reader in readers.items():
+            pieces[group] = {}
+            for key, item in reader.variables.items():
+                if item["read"]:
+                    pieces[group][key] = [
+                        piece.values for piece in item["pieces"].values()
+                    ]
+                item["pieces"] = {}
+            reader.bytes = None
+        return {"cpu": cpu_num, "pieces": pieces, "masks": selections, "octs": octs}
+
+    def _decode_cachelines(
+        self, cpu_num, readers, active, select, meta, lmax, stats, masks
+    ):
+        """
+        Decode the cache lines of the cpu's own domain one by one, and store the
+        selected cells in the pieces of the variables of the active readers. Return
+        the selection masks of the cache lines, as packed bits, and the octs of the
+        cpu's own domain if the octree is requested (see ``oct_pieces``).
+        """
+        twotondim = 2 ** meta["ndim"]
+        npieces = 0
+        selections = []
+        octree = self.octree and masks is None
+        blocks = {"levels": [], "ncaches": [], "centers": [], "sel": []}
+
+        for iblock, (ilevel, ncache) in enumerate(
+            self._walk_own_blocks(
+                cpu_num=cpu_num, readers=readers, meta=meta, lmax=lmax, stats=stats
+            )
+        ):
+            for group, reader in readers.items():
+                if group not in active:
+                    reader.step_over(ncache, twotondim, meta["ndim"])
 
-                    if ncache > 0:
-                        if domain == cpu_num - 1:
-                            for reader in readers.values():
-                                reader.allocate_buffers(ncache, twotondim)
+            for reader in active.values():
+                reader.allocate_buffers(ncache, twotondim)
 
-                            for reader in readers.values():
-                                reader.read_cacheline_header(ncache, meta["ndim"])
+            for reader in active.values():
+                reader.read_cacheline_header(ncache, meta["ndim"])
 
-                            for ind in range(twotondim):
-                                # Read variables in cells
-                                for reader in readers.values():
-                                    reader.read_variables(
-                                        ncache, ind, ilevel, cpu_num - 1, meta
+            for ind in range(twotondim):
+                # Read variables in cells
+                for reader in active.values():
+                    reader.read_variables(ncache, ind, ilevel, cpu_num - 1, meta)
+
+            with self.report.time("selection"):
+                if masks is not None:
+                    sel = np.unpackbits(masks[iblock], count=ncache * twotondim).astype(
+                        bool
+                    )
+                else:
+                    # Apply selection criteria: select only leaf cells and
+                    # add any criteria requested by the user via select.
+                    conditions = {}
+                    for reader in active.values():
+                        conditions.update(reader.make_conditions(select[reader.kind]))
+                    # Combine all selection criteria together with AND
+                    # operation by using a product on bools
+                    sel = np.prod(
+                        np.array(
+                            [
+                                c.values if isinstance(c, Array) else c
+                                for c in conditions.values()
+                            ]
+                        ),
+                        axis=0,
+                    ).astype(bool)
+                selections.append(np.packbits(sel))
+
+                if octree:
+                    amr = readers["amr"]
+                    blocks["levels"].append(ilevel)
+                    blocks["ncaches"].append(ncache)
+                    blocks["centers"].append(
+                        (
+                            amr.xg[:, : meta["ndim"]]
+                            - amr.meta["xbound"][: meta["ndim"]]
+                        ).T
+                    )
+                    blocks["sel"].append(sel)
+
+                # Count the number of cells
+                ncells = np.sum(sel)
+                if ncells > 0:
+                    meta["ncells"] += ncells
+                    npieces += 1
+                    # Add the cells in the pieces dictionaries
+                    for reader in active.values():
+                        if reader.kind == "mesh":
+                            for item in reader.variables.values():
+                                if item["read"]:
+                                    item["pieces"][npieces] = item["buffer"][sel]
+
+            # Move cursors to the end of the cache line
+            for reader in active.values():
+                reader.read_footer(ncache, twotondim)
+
+        octs = None
+        if octree:
+            octs = oct_pieces(
+                levels=blocks["levels"],
+                ncaches=blocks["ncaches"],
+                centers=np.concatenate(
+                    blocks["centers"] or [np.empty((meta["ndim"], 0))], axis=1
+                ),
+                ndim=meta["ndim"],
+                sel=np.concatenate(blocks["sel"] or [np.empty(0, dtype=bool)]),
+            )
+        return selections, octs
+
+    def _decode_cachelines_compiled(
+        self, cpu_num, readers, active, select, meta, lmax, stats, masks
+    ):
+        """
+        Same as ``_decode_cachelines``, but the cache lines of all the levels are
+        decoded in a single pass by compiled kernels, which write the values of all
+        the cells of the cpu's own domain into arrays. The selection criteria are
+        then applied to the arrays at once.
+
+        If a column cache is used, the arrays decoded from the files of a cpu are
+        stored in the cache, and are taken from the cache by the next loads instead
+        of decoding the files again.
+        """
+        ndim = meta["ndim"]
+        twotondim = 2**ndim
+        # The particles are read with the file headers, and have no cache lines
+        active = {g: r for g, r in active.items() if r.kind == "mesh"}
+
+        # Take the columns decoded by previous loads from the column cache. A group
+        # is only taken from the cache if all of its columns are found.
+        values = {}
+        blocks = None
+        cache = self.column_cache if lmax > 0 else None
+        if cache is not None:
+            keys = {
+                group: (
+                    utils.generate_fname(
+                        meta["nout"], meta["path"], ftype=group, cpuid=cpu_num
+                    ),
+                    *stats[group],
+                    lmax,
+                    str(self.dtype),
+                )
+                for group in readers
+            }
+            # The levels and numbers of octs of the cache lines
+            blocks = cache.get(keys["amr"] + ("_blocks",))
+            if blocks is not None:
+                levels, ncaches = blocks
+                for group, reader in active.items():
+                    names = self._column_names(group, reader, ndim)
+                    columns = [cache.get(keys[group] + (name,)) for name in names]
+                    if all(column is not None for column in columns):
+                        values[group] = dict(zip(names, columns))
+
+        if blocks is None or len(values) < len(active):
+            levels, ncaches, cursors = self._find_own_blocks(
+                cpu_num=cpu_num, readers=readers, meta=meta, lmax=lmax, stats=stats
+            )
+            if cache is not None:
+                cache.put(keys["amr"] + ("_blocks",), np.stack([levels, ncaches]))
+            if len(ncaches) == 0:
+                return [], None
+            # Decode the variables of all the cells
+            for group, reader in active.items():
+                if group in values:
+                    continue
+                values[group] = self._decode_columns(
+                    group=group,
+                    reader=reader,
+                    cursors=cursors[group],
+                    levels=levels,
+                    ncaches=ncaches,
+                    cpu_num=cpu_num,
+                    meta=meta,
+                    lmax=lmax,
+                )
+                if cache is not None:
+                    for name, column in values[group].items():
+                        cache.put(keys[group] + (name,), column)
+        nblocks = len(ncaches)
+        if nblocks == 0:
+            return [], None
+
+        # Record the ranges of the values in the files
+        if self.zone_map is not None and masks is None:
+            for group in active:
+                self.zone_map.record(
+                    cpu_num=cpu_num,
+                    group=group,
+                    stat=stats[group],
+                    lmax=lmax,
+                    values=values[group],
+                )
+
+        with self.report.time("selection"):
+            if masks is not None:
+                sel = np.concatenate(
+                    [
+                        np.unpackbits(masks[iblock], count=ncaches[iblock] * twotondim)
+                        for iblock in range(nblocks)
+                    ]
+                    or [np.empty(0, dtype=np.uint8)]
+                ).astype(bool)
+            else:
+                # Apply selection criteria: select only leaf cells and
+                # add any criteria requested by the user via select.
+                conditions = {"leaf": values["amr"]["_leaf"]}
+                for group, reader in active.items():
+                    if isinstance(select[reader.kind], dict):
+                        for key, func in select[reader.kind].items():
+                            if key in values[group]:
+                                cond = func(
+                                    Array(
+                                        values=values[group][key],
+                                        unit=reader.variables[key]["unit"].units,
                                     )
+                                )
+                                conditions[key] = (
+                                    cond.values if isinstance(cond, Array) else cond
+                                )
+                region = active["amr"].region
+                if region is not None:
+                    conditions["region"] = region.contains(
+                        values["amr"]["_position"].T, active["amr"].box_length
+                    )
+                sel = np.logical_and.reduce(list(conditions.values()))
+            bounds = np.cumsum(ncaches * twotondim)[:-1]
+            selections = [np.packbits(s) for s in np.split(sel, bounds)]
 
-                            # Apply selection criteria: select only leaf cells and
-                            # add any criteria requested by the user via select.
-                            conditions = {}
-                            for reader in readers.values():
-                                conditions.update(
-                                    reader.make_conditions(_select[reader.kind])
+            nselected = np.count_nonzero(sel)
+            if nselected > 0:
+                meta["ncells"] += nselected
+                for group, reader in active.items():
+                    if reader.kind == "mesh":
+                        for key, item in reader.variables.items():
+                            if item["read"]:
+                                item["pieces"][0] = Array(
+                                    values=values[group][key][sel],
+                                    unit=item["unit"].units,
                                 )
-                            # Combine all selection criteria together with AND
-                            # operation by using a product on bools
-                            sel = np.prod(
-                                np.array(
-                                    [
-                                        c.values if isinstance(c, Array) else c
-                                        for c in conditions.values()
-                                    ]
-                                ),
-                                axis=0,
-                            ).astype(bool)
-
-                            # Count the number of cells
-                            ncells = np.sum(sel)
-                            if ncells > 0:
-                                meta["ncells"] += ncells
-                                npieces += 1
-                                # Add the cells in the pieces dictionaries
-                                for reader in readers.values():
-                                    if reader.kind == "mesh":
-                                        for item in reader.variables.values():
-                                            if item["read"]:
-                                                item["pieces"][npieces] = item[
-                                                    "buffer"
-                                                ][sel]
-
-                            # Increment offsets with remainder of the file
-                            for reader in readers.values():
-                                reader.read_footer(ncache, twotondim)
-
-                        else:
-                            for reader in readers.values():
-                                reader.step_over(ncache, twotondim, meta["ndim"])
 
-        # Merge all the data pieces into the Arrays
-        for group, reader in readers.items():
-            name = reader.kind
-            if name not in out:
-                out[name] = Datagroup()
-            for key, item in reader.variables.items():
-                if item["read"] and len(item["pieces"]) > 0:
-                    out[name][key] = np.concatenate(list(item["pieces"].values()))
+        octs = None
+        if self.octree and masks is None:
+            # The centers of the octs are half a cell away from their first cell
+            first = np.concatenate(
+                [
+                    start + np.arange(n)
+                    for start, n in zip(
+                        np.cumsum(ncaches * twotondim) - ncaches * twotondim, ncaches
+                    )
+                ]
+            )
+            octs = oct_pieces(
+                levels=levels,
+                ncaches=ncaches,
+                centers=values["amr"]["_position"][:, first]
+                + 0.5 ** np.repeat(levels + 2, ncaches),
+                ndim=ndim,
+                sel=sel,
+            )
+        return selections, octs
 
-        for dg in out.values():
-            # If vector quantities are found, make them into vector Arrays
-            utils.make_vector_arrays(dg, ndim=meta["ndim"])
+    def _find_own_blocks(self, cpu_num, readers, meta, lmax, stats):
+        """
+        Find the levels and the numbers of grids of the cache lines of the cpu's own
+        domain, and the byte positions where they start in the files of the readers.
+        """
+        twotondim = 2 ** meta["ndim"]
+        levels = []
+        ncaches = []
+        cursors = {group: [] for group in readers}
+        for ilevel, ncache in self._walk_own_blocks(
+            cpu_num=cpu_num, readers=readers, meta=meta, lmax=lmax, stats=stats
+        ):
+            levels.append(ilevel)
+            ncaches.append(ncache)
+            for group, reader in readers.items():
+                cursors[group].append(reader.cursor)
+                reader.step_over(ncache, twotondim, meta["ndim"])
+        cursors = {
+            group: np.array(cursor, dtype=np.int64) for group, cursor in cursors.items()
+        }
+        return (
+            np.array(levels, dtype=np.int64),
+            np.array(ncaches, dtype=np.int64),
+            cursors,
+        )
 
-        print(
-            "Loaded: {} cells, {} particles.".format(meta["ncells"], meta["nparticles"])
+    def _column_names(self, group, reader, ndim):
+        """
+        The names of the columns decoded from the files of a group. The AMR group
+        also has the leaf cell flags and the cell positions in units of the box size,
+        which are needed for the selection.
+        """
+        if group == "amr":
+            return ["_leaf", "_position", "level", "cpu", "dx"] + [
+                "position_" + "xyz"[n] for n in range(ndim)
+            ]
+        return [key for key, item in reader.variables.items() if item["read"]]
+
+    def _decode_columns(
+        self, group, reader, cursors, levels, ncaches, cpu_num, meta, lmax
+    ):
+        """
+        Decode the values of all the cells of the cpu's own domain from the files of
+        a group, using the compiled kernels. Return a dict of arrays.
+        """
+        ndim = meta["ndim"]
+        twotondim = 2**ndim
+        ncells = int(np.sum(ncaches)) * twotondim
+        buffer = np.frombuffer(reader.bytes, dtype=np.uint8)
+        values = {}
+        if group == "amr":
+            position = np.empty((ndim, ncells))
+            dxcell = np.empty(ncells)
+            leaf = np.empty(ncells, dtype=bool)
+            kernels.decode_amr_blocks(
+                buffer,
+                cursors,
+                levels,
+                ncaches,
+                ndim,
+                lmax,
+                np.array(reader.meta["xbound"][:ndim]),
+                position,
+                dxcell,
+                leaf,
+            )
+            values["_leaf"] = leaf
+            values["_position"] = position
+            magnitudes = {
+                key: item["unit"].magnitude for key, item in reader.variables.items()
+            }
+            dtypes = {key: item["dtype"] for key, item in reader.variables.items()}
+            values["level"] = np.repeat(levels + 1, ncaches * twotondim).astype(
+                dtypes["level"]
+            )
+            values["cpu"] = np.full(ncells, cpu_num, dtype=dtypes["cpu"])
+            for n, key in enumerate(
+                ["dx"] + ["position_" + "xyz"[n] for n in range(ndim)]
+            ):
+                values[key] = np.multiply(
+                    (dxcell if n == 0 else position[n - 1]) * meta["boxlen"],
+                    magnitudes[key],
+                    out=np.empty(ncells, dtype=dtypes[key]),
+                    casting="unsafe",
+                )
+        else:
+            keys = self._column_names(group, reader, ndim)
+            # All the variables are stored with the same type (see kernels.supports)
+            out = np.empty(
+                (len(keys), ncells), dtype=reader.variables[keys[0]]["dtype"]
+            )
+            kernels.decode_variable_blocks(
+                buffer,
+                cursors,
+                ncaches,
+                twotondim,
+                np.array(
+                    [keys.index(key) if key in keys else -1 for key in reader.variables]
+                ),
+                np.array(
+                    [item["unit"].magnitude for item in reader.variables.values()],
+                    dtype=np.float64,
+                ),
+                out,
+            )
+            for key, row in zip(keys, out):
+                values[key] = row
+        return values
+
+    def _defer_variables(self, readers, select, ndim):
+        """
+        Find the mesh variables that are not needed for the selection, and mark them
+        as not to be read. Return a dict containing the (group, key) pairs of the
+        components of each deferred item.
+        """
+        needed = select.keys() if isinstance(select, dict) else []
+        groups = {
+            key: group
+            for group, reader in readers.items()
+            if reader.kind == "mesh" and group != "amr"
+            for key, item in reader.variables.items()
+            if item["read"]
+        }
+        items = {key: [key] for key in groups}
+        for name, components in utils.find_vector_components(
+            keys=groups.keys(), ndim=ndim
+        ).items():
+            for key in components:
+                del items[key]
+            items[name] = components
+
+        deferred = {}
+        for name, components in items.items():
+            if any(key in needed for key in components):
+                continue
+            deferred[name] = [(groups[key], key) for key in components]
+            for key in components:
+                readers[groups[key]].variables[key]["read"] = False
+        return deferred
+
+    def _load_deferred(
+        self, components, cpu_list, masks, meta, units, lmax, dtype=None
+    ):
+        """
+        Read the variables of a deferred item from the files, for the cells that were
+        selected when the dataset was loaded.
+        """
+        arrays = self._read_more_variables(
+            components=components,
+            cpu_list=cpu_list,
+            masks=masks,
+            meta=meta,
+            units=units,
+            lmax=lmax,
+            dtype=dtype,
         )
+        if len(arrays) == 1:
+            return arrays[0]
+        return Vector(**dict(zip("xyz", arrays)))
 
-        # Apply sorting if any requested from args
-        if sortby is not None:
-            for group, key in sortby.items():
-                if group in out:
-                    out[group].sortby(key)
+    def _read_more_variables(
+        self, components, cpu_list, masks, meta, units, lmax, dtype=None
+    ):
+        """
+        Read the mesh variables given as a list of (group, key) pairs from the files,
+        for the cells selected by the ``masks`` of each cpu, and return a list of
+        Arrays. Only the files that contain the variables are decoded. The AMR files
+        are used only to step over the blocks.
+        """
+        readers = {"amr": AmrReader()}
+        readers["amr"].initialize(meta=meta, units=units, select=[])
+        for group, key in components:
+            if group not in readers:
+                readers[group] = self.readers[group].__class__()
+                readers[group].initialize(meta=meta, units=units, select=[])
+            readers[group].variables[key]["read"] = True
+        if dtype is not None:
+            for reader in readers.values():
+                reader.set_dtype(dtype, meta)
 
-        return out
+        # Use a copy of the metadata to avoid counting the cells twice, and a separate
+        # report to leave the report of the load untouched
+        info = dict(meta)
+        report, self.report = self.report, LoadReport()
+        try:
+            chunks = [
+                self._read_cpu(
+                    cpu_num=cpu_num,
+                    readers=readers,
+                    select=None,
+                    meta=info,
+                    lmax=lmax,
+                    masks=masks[cpu_num],
+                )
+                for cpu_num in cpu_list
+                # The cpus skipped using the zone map have no selected cells
+                if len(masks[cpu_num]) > 0
+            ]
+        finally:
+            self.report = report
+
+        arrays = []
+        for group, key in components:
+            arrays.append(
+                Array(
+                    values=np.concatenate(
+                        [piece for c in chunks for piece in c["pieces"][group][key]]
+                        or [np.empty(0, dtype=readers[group].variables[key]["dtype"])]
+                    ),
+                    unit=readers[group].variables[key]["unit"].units,
+                )
+            )
+        return arrays
+
+    def load_more(self, keys, meta, units):
+        """
+        Read more mesh variables for the cells that were selected by the last load,
+        in the same order. Vector quantities can be requested by their name, e.g.
+        ``"velocity"``. Return a dict of Arrays and Vectors.
+        """
+        if self.selection is None or self.selection["lmax"] == 0:
+            raise RuntimeError(
+                "More variables can only be loaded after the mesh has been loaded "
+                "from the output files."
+            )
+        groups = {}
+        for group, reader in self.readers.items():
+            if reader.kind == "mesh" and group != "amr":
+                reader = reader.__class__()
+                reader.initialize(meta=meta, units=units, select=[])
+                groups.update({key: group for key in reader.variables})
+        vectors = utils.find_vector_components(keys=groups.keys(), ndim=meta["ndim"])
+        components = []
+        for name in keys:
+            for key in vectors.get(name, [name]):
+                if key not in groups:
+                    raise KeyError(
+                        f"Variable {key} was not found in the hydro, gravity or rt "
+                        "files."
+                    )
+                components.append((groups[key], key))
+
+        arrays = self._read_more_variables(
+            components=components,
+            cpu_list=self.selection["cpu_list"],
+            masks=self.selection["masks"],
+            meta=meta,
+            units=units,
+            lmax=self.selection["lmax"],
+            dtype=self.selection["dtype"],
+        )
+        order = self.selection["order"]
+        out = Datagroup()
+        for (group, key), array in zip(components, arrays):
+            out[key] = array if order is None else array[order]
+        utils.make_vector_arrays(out, ndim=meta["ndim"])
+        return dict(out.items())
+
+    def _map_files(self, cpu_num, readers, meta, buffers=None):
+        """
+        Map the binary files of a cpu into memory, and return the modification times
+        and sizes of the files. If the contents of the files have already been read
+        into ``buffers``, they are used instead.
+        """
+        stats = {}
+        for group, reader in readers.items():
+            if buffers is not None:
+                reader.bytes, stats[group] = buffers[group]
+                continue
+            fname = utils.generate_fname(
+                meta["nout"], meta["path"], ftype=group, cpuid=cpu_num
+            )
+            with open(fname, mode="rb") as f:
+                reader.bytes = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                stat = os.fstat(f.fileno())
+            stats[group] = [stat.st_mtime_ns, stat.st_size]
+        return stats
+
+    def _walk_own_blocks(self, cpu_num, readers, meta, lmax, stats):
+        """
+        Walk through the levels of the files of a cpu, whose headers have already
+        been read, and yield the level and the number of grids every time the
+        readers are positioned at the start of a cache line of the cpu's own domain.
+        The caller must read the entire cache line before asking for the next one.
+
+        The blocks of the other domains are stepped over. If the offsets of the
+        blocks have been recorded in the index by a previous load, the readers jump
+        straight to the blocks instead. If the files have changed, or if the required
+        levels have not been indexed yet, the offsets are recorded on the way.
+        """
+        twotondim = 2 ** meta["ndim"]
+        rows = {}
+        use_index = False
+        if self.index is not None:
+            rows = {
+                group: self.index[group][cpu_num - 1]
+                for group in self.index
+                if group in readers
+            }
+            use_index = all(
+                list(rows[group][:2]) == stats[group]
+                and np.all(rows[group][2:][:lmax] >= 0)
+                for group in rows
+            )
+            if not use_index:
+                for group, row in rows.items():
+                    if list(row[:2]) != stats[group]:
+                        row[:] = -1
+                        row[:2] = stats[group]
+
+        # Loop over levels
+        for ilevel in range(lmax):
+            for reader in readers.values():
+                reader.read_level_header(ilevel, twotondim)
+
+            if use_index:
+                domains = [cpu_num - 1]
+                for group, row in rows.items():
+                    readers[group].cursor = int(row[ilevel + 2])
+            else:
+                domains = range(readers["amr"].meta["nboundary"] + meta["ncpu"])
+
+            # Loop over domains
+            for domain in domains:
+                ncache = readers["amr"].meta["ngridlevel"][domain, ilevel]
+
+                if (not use_index) and (domain == cpu_num - 1):
+                    for group, row in rows.items():
+                        if row[ilevel + 2] != readers[group].cursor:
+                            row[ilevel + 2] = readers[group].cursor
+                            self.index_modified = True
+
+                for reader in readers.values():
+                    reader.read_domain_header()
+
+                if ncache > 0:
+                    if domain == cpu_num - 1:
+                        yield ilevel, ncache
+                    else:
+                        for reader in readers.values():
+                            reader.step_over(ncache, twotondim, meta["ndim"])
@@ -0,0 +1,188 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+import numpy as np
+
+
+def oct_pieces(levels, ncaches, centers, ndim, sel):
+    """
+    Describe the octs of the cache lines of a cpu, and link the selected cells to
+    them. The cells of a cache line of ``ncache`` octs are stored slot by slot, i.e.
+    the cell in slot ``ind`` of the oct ``i`` is at position ``ind * ncache + i``.
+
+    :param levels: The level of each cache line (starting at zero).
+
+    :param ncaches: The number of octs in each cache line.
+
+    :param centers: The positions of the centers of the octs, in units of the box
+        size, with shape ``(ndim, noct)``.
+
+    :param sel: The selection mask of the cells.
+
+    Return a dict with the level (starting at one) and the integer coordinates of
+    each oct on its level, and the oct and slot of each selected cell.
+    """
+    twotondim = 2**ndim
+    level = np.repeat(np.asarray(levels) + 1, ncaches)
+    # Size of the octs on each level
+    size = 0.5 ** (level - 1).astype(np.float64)
+    coords = np.rint(centers / size - 0.5).astype(np.int64).T
+    first = np.concatenate([[0], np.cumsum(ncaches)[:-1]]).astype(np.int64)
+    cell_oct = np.concatenate(
+        [np.tile(np.arange(n) + o, twotondim) for o, n in zip(first, ncaches)]
+        or [np.empty(0, dtype=np.int64)]
+    )
+    cell_ind = np.concatenate(
+        [np.repeat(np.arange(twotondim), n) for n in ncaches]
+        or [np.empty(0, dtype=np.int64)]
+    )
+    return {
+        "level": level.astype(np.int8),
+        "coords": coords.astype(np.int32),
+        "cell_oct": cell_oct[sel],
+        "cell_ind": cell_ind[sel].astype(np.int8),
+    }
+
+
+def _row_keys(level, coords):
+    rows = np.ascontiguousarray(
+        np.column_stack([level, coords]).astype(np.int64), dtype=np.int64
+    )
+    return rows.view(np.dtype((np.void, 8 * rows.shape[1]))).ravel()
+
+
+class Octree:
+    """
+    The oct tree of the AMR mesh, for the cells loaded into the ``mesh`` group.
+    All the octs of the domains of the cpus that were read are included, whether
+    their cells are leaf cells or refined cells.
+
+    Each oct is identified by its level and its integer coordinates on its level,
+    which are used to link the octs to their parents, children and neighbours
+    across the files of all the cpus. The links are ``-1`` when the oct does not
+    exist or has not been read (e.g. outside of the box, or in the domain of a cpu
+    that was not read).
+
+    The cells are numbered ``ind = ix + 2 * iy + 4 * iz`` inside their oct, where
+    ``ix``, ``iy`` and ``iz`` are 0 or 1, as in RAMSES.
+
+    :param level: The level of each oct (starting at one, the level of its cells).
+
+    :param coords: The integer coordinates of each oct on its level, with shape
+        ``(noct, ndim)``. An oct at level ``l`` with coordinates ``i`` spans
+        ``[i, i + 1] / 2**(l - 1)`` in units of the box size.
+
+    :param cells: The index of the cell of each slot of each oct in the ``mesh``
+        group, with shape ``(noct, 2**ndim)``. It is ``-1`` if the cell was not
+        loaded, because it is refined or not selected.
+    """
+
+    def __init__(self, level, coords, cells):
+        self.level = level
+        self.coords = coords
+        self.cells = cells
+        self.ndim = coords.shape[1]
+
+        keys = _row_keys(level, coords)
+        self._order = np.argsort(keys)
+        self._keys = keys[self._order]
+
+        self.parent = np.where(level > 1, self.find(level - 1, coords // 2), -1).astype(
+            np.int64
+        )
+        # The slot of the parent cell that each oct refines
+        self.slot = np.sum(
+            (coords & 1) << np.arange(self.ndim), axis=1, dtype=np.int64
+        ).astype(np.int8)
+        self.children = np.full((len(level), 2**self.ndim), -1, dtype=np.int64)
+        has_parent = self.parent >= 0
+        self.children[self.parent[has_parent], self.slot[has_parent]] = np.nonzero(
+            has_parent
+        )[0]
+        # Neighbours in the directions -x, +x, -y, +y, -z, +z
+        self.neighbours = np.stack(
+            [
+                self.find(level, coords + side * np.eye(self.ndim, dtype=np.int64)[n])
+                for n in range(self.ndim)
+                for side in (-1, 1)
+            ],
+            axis=1,
+        )
+
+    def __len__(self):
+        return len(self.level)
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        lines = "Octree: {} octs, {} cells".format(
+            len(self), np.count_nonzero(self.cells >= 0)
+        )
+        if len(self) > 0:
+            lines += ", levels {}-{}".format(self.level.min(), self.level.max())
+        return lines
+
+    def find(self, level, coords):
+        """
+        Return the indices of the octs with the given levels and integer
+        coordinates, or ``-1`` for the octs which are not in the tree.
+        """
+        keys = _row_keys(level, coords)
+        if len(self._keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        found = self._keys[pos] == keys
+        return np.where(found, self._order[pos], -1)
+
+    def cell_octs(self):
+        """
+        Return the oct and the slot of each loaded cell, in the order of the cells
+        in the ``mesh`` group.
+        """
+        octs, slots = np.nonzero(self.cells >= 0)
+        order = np.argsort(self.cells[octs, slots])
+        return octs[order], slots[order]
+
+    def reorder(self, order):
+        """
+        Update the indices of the cells after the ``mesh`` group has been sorted
+        with the indices ``order``.
+        """
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        loaded = self.cells >= 0
+        self.cells[loaded] = inverse[self.cells[loaded]]
+
+    def cell_neighbours(self, axis, side):
+        """
+        Return the index of the neighbour of each loaded cell in the direction
+        ``side`` (``-1`` or ``1``) along ``axis`` (0, 1 or 2). The neighbour is a
+        leaf cell at the same level or at a coarser level. The index is ``-1`` if the
+        neighbour is refined, was not loaded, or is outside of the box.
+        """
+        octs, slots = self.cell_octs()
+        bit = np.int64(1 << axis)
+        direction = 2 * axis + int(side > 0)
+
+        def step(octs, slots):
+            # The neighbour is in the same oct if the slot is on the near side
+            inside = (slots & bit) == (0 if side > 0 else bit)
+            return np.where(inside, octs, self.neighbours[octs, direction]), slots ^ bit
+
+        slots = slots.astype(np.int64)
+        nb_octs, nb_slots = step(octs, slots)
+        # If the neighbouring oct does not exist, the neighbour cell is coarser: it
+        # is the neighbour of the parent cell (or of a further ancestor)
+        missing = (nb_octs < 0) & (self.parent[octs] >= 0)
+        while np.any(missing):
+            octs[missing], slots[missing] = (
+                self.parent[octs[missing]],
+                self.slot[octs[missing]],
+            )
+            nb_octs[missing], nb_slots[missing] = step(octs[missing], slots[missing])
+            missing &= (nb_octs < 0) & (self.parent[octs] >= 0)
+        out = np.full(len(octs), -1, dtype=np.int64)
+        found = nb_octs >= 0
+        out[found] = self.cells[nb_octs[found], nb_slots[found]]
+        return out
@@ -5,7 +5,6 @@ import os
 import numpy as np
 
 from ..core import Array
-from . import utils
 from .reader import Reader
 
 
@@ -34,39 +33,86 @@ class PartReader(Reader):
         self.descriptor_to_variables(
             descriptor=descriptor, meta=meta, units=units, select=select
         )
+        # All the variables are multiplied by the magnitude of their unit
+        for item in self.variables.values():
+            item["dtype"] = np.result_type(
+                np.dtype(item["type"]), item["unit"].magnitude
+            )
+        self.select = select if isinstance(select, dict) else {}
+        self.ndim = meta["ndim"]
+        self.boxlen = meta["boxlen"]
+        self.box_length = meta["boxlen"] * units["x"]
         self.initialized = True
 
     def read_header(self, info):
         if not self.initialized:
             return
-        self.offsets["i"] += 2
-        self.offsets["n"] += 2
-        [nparticles] = utils.read_binary_data(
-            fmt="i", content=self.bytes, offsets=self.offsets
-        )
-        for i in range(5):
-            self.offsets["b"] += utils.skip_binary_line(
-                content=self.bytes, offsets=self.offsets
+        self.skip_records(2)
+        [nparticles] = self.read_record("i")
+        self.skip_records(5)
+        records = {}
+        for key, item in self.variables.items():
+            records[key] = self.read_record(item["type"], nparticles)
+
+        # Apply the selection criteria and the region to the particles of the file,
+        # before any of the variables are copied
+        conditions = []
+        for key, func in self.select.items():
+            if key in records and callable(func):
+                item = self.variables[key]
+                cond = func(
+                    Array(
+                        values=records[key] * item["unit"].magnitude,
+                        unit=item["unit"].units,
+                    )
+                )
+                conditions.append(cond.values if isinstance(cond, Array) else cond)
+        if self.region is not None:
+            position = np.stack(
+                [records[f"position_{c}"] for c in "xyz"[: self.ndim]], axis=1
             )
-        for item in self.variables.values():
+            conditions.append(
+                self.region.contains(position / self.boxlen, self.box_length)
+            )
+        sel = slice(None)
+        if len(conditions) > 0:
+            sel = np.logical_and.reduce(conditions)
+            nparticles = np.count_nonzero(sel)
+
+        for key, item in self.variables.items():
             if item["read"]:
                 npieces = len(item["pieces"])
                 item["pieces"][npieces] = Array(
-                    values=np.array(
-                        utils.read_binary_data(
-                            fmt="{}{}".format(nparticles, item["type"]),
-                            content=self.bytes,
-                            offsets=self.offsets,
-                        )
-                    )
-                    * item["unit"].magnitude,
+                    values=np.multiply(
+                        records[key][sel],
+                        item["unit"].magnitude,
+                        out=np.empty(nparticles, dtype=item["dtype"]),
+                        casting="unsafe",
+                    ),
                     unit=item["unit"].units,
                 )
-            else:
-                self.offsets[item["type"]] += nparticles
-                self.offsets["n"] += 1
         info["nparticles"] += nparticles
 
+    def set_dtype(self, dtype, meta):
+        """
+        Store the floating point variables with type ``dtype``, apart from the
+        positions. The integer variables without units (e.g. the identity or family
+        of the particles) keep the type they have in the files.
+        """
+        super().set_dtype(dtype, meta)
+        for item in self.variables.values():
+            if np.dtype(item["type"]).kind != "f" and item["unit"].magnitude == 1:
+                item["dtype"] = np.dtype(item["type"])
+
+    def read_nparticles(self):
+        """
+        Read only the number of particles from the file header.
+        """
+        self.cursor = 0
+        self.skip_records(2)
+        [nparticles] = self.read_record("i")
+        return int(nparticles)
+
     def allocate_buffers(self, ncache, twotondim):
         return
 
@@ -74,6 +120,7 @@ class PartReader(Reader):
         return
 
     def make_conditions(self, select):
+        # The selection criteria are applied when the particles are read
         return {}
 
     def read_footer(self, *args, **kwargs):
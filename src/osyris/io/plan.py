@@ -0,0 +1,96 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+
+class LoadPlan:
+    """
+    An estimate of the size of a load, obtained by reading only the headers of the
+    files. The number of cells is an upper bound: it counts all the cells (leaf and
+    refined) in the domains of the cpus, up to the maximum level to be read, before
+    any selection criteria are applied. If a previous load has recorded the zone map
+    of the output, the number of leaf cells is used instead. The variables computed
+    by the ``additional_variables`` of the configuration are not included.
+
+    :param cpu_list: The cpus whose files would be read.
+
+    :param files: The files which would be read, with their size in bytes.
+
+    :param ncells: The maximum number of cells that would be loaded.
+
+    :param nparticles: The maximum number of particles that would be loaded.
+
+    :param columns: The maximum number of bytes of each variable, for each group.
+
+    :param nbytes_per_cpu: The maximum number of bytes of all the variables loaded
+        from the files of each cpu.
+
+    :param preallocate: Whether the final arrays would be allocated before reading
+        the files.
+    """
+
+    def __init__(
+        self, cpu_list, files, ncells, nparticles, columns, nbytes_per_cpu, preallocate
+    ):
+        self.cpu_list = list(cpu_list)
+        self.files = files
+        self.ncells = ncells
+        self.nparticles = nparticles
+        self.columns = columns
+        self.nbytes_per_cpu = nbytes_per_cpu
+        self.preallocate = preallocate
+
+    @property
+    def file_nbytes(self):
+        """
+        The total size of the files which would be read.
+        """
+        return sum(self.files.values())
+
+    @property
+    def nbytes(self):
+        """
+        The maximum number of bytes of the loaded data.
+        """
+        return sum(sum(group.values()) for group in self.columns.values())
+
+    @property
+    def peak_nbytes(self):
+        """
+        An estimate of the peak memory used while loading. Without preallocation,
+        the pieces read from all the cpus are held in memory while they are
+        concatenated into the final arrays. With preallocation, only the pieces of
+        one cpu are held alongside the final arrays.
+        """
+        largest = max(self.nbytes_per_cpu, default=0)
+        if self.preallocate:
+            return self.nbytes + largest
+        return 2 * self.nbytes + largest
+
+    def estimate_time(self, report):
+        """
+        Estimate the time needed to read the files, in seconds, from the throughput
+        of a previous load.
+
+        :param report: The ``LoadReport`` of a previous load.
+        """
+        if report.file_nbytes_per_second == 0:
+            return None
+        return self.file_nbytes / report.file_nbytes_per_second
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        lines = [
+            "LoadPlan: {} cpus, {} files ({:.3f} MB)".format(
+                len(self.cpu_list), len(self.files), self.file_nbytes / 1.0e6
+            ),
+            "  at most {} cells, {} particles".format(self.ncells, self.nparticles),
+        ]
+        for name, group in self.columns.items():
+            lines.append(
+                "  {:<12s} {:>12.3f} MB".format(name, sum(group.values()) / 1.0e6)
+            )
+        lines.append("  {:<12s} {:>12.3f} MB".format("total", self.nbytes / 1.0e6))
+        lines.append("  {:<12s} {:>12.3f} MB".format("peak", self.peak_nbytes / 1.0e6))
+        return "\n".join(lines)
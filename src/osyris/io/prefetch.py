@@ -0,0 +1,98 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+import os
+import threading
+
+
+class Prefetcher:
+    """
+    Read the files of the next cpus in the list into memory in a background thread,
+    while the files of the current cpu are being decoded.
+
+    :param fnames: A list containing, for every cpu to be read, a dict of the file
+        names to read for each group.
+
+    :param depth: The maximum number of cpus whose files are held in memory ahead of
+        the one being decoded.
+
+    :param max_bytes: The maximum number of bytes held in memory by the prefetched
+        files. The files of a cpu are always read if no other files are held, even
+        if they are larger than ``max_bytes``. Default is ``None`` (no limit).
+    """
+
+    def __init__(self, fnames, depth, max_bytes=None):
+        self._fnames = fnames
+        self._depth = max(depth, 1)
+        self._max_bytes = max_bytes
+        self._buffers = {}
+        self._nbytes = 0
+        self._next = 0
+        self._error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _can_read(self, position, size):
+        if self._closed:
+            return True
+        if position - self._next >= self._depth:
+            return False
+        if self._max_bytes is None or len(self._buffers) == 0:
+            return True
+        return self._nbytes + size <= self._max_bytes
+
+    def _run(self):
+        try:
+            for position, fnames in enumerate(self._fnames):
+                size = sum(os.path.getsize(fname) for fname in fnames.values())
+                with self._condition:
+                    self._condition.wait_for(lambda: self._can_read(position, size))
+                    if self._closed:
+                        return
+                buffers = {}
+                for group, fname in fnames.items():
+                    with open(fname, mode="rb") as f:
+                        stat = os.fstat(f.fileno())
+                        buffers[group] = (
+                            f.read(),
+                            [stat.st_mtime_ns, stat.st_size],
+                        )
+                with self._condition:
+                    self._buffers[position] = buffers
+                    self._nbytes += sum(len(b) for b, _ in buffers.values())
+                    self._condition.notify_all()
+        except Exception as error:
+            with self._condition:
+                self._error = error
+                self._condition.notify_all()
+
+    def get(self):
+        """
+        Return the contents of the files of the next cpu in the list, as a dict of
+        (bytes, [modification time, size]) for each group, waiting for the files to
+        be read if necessary.
+        """
+        with self._condition:
+            position = self._next
+            self._condition.wait_for(
+                lambda: position in self._buffers or self._error is not None
+            )
+            if position not in self._buffers:
+                raise self._error
+            buffers = self._buffers.pop(position)
+            self._nbytes -= sum(len(b) for b, _ in buffers.values())
+            self._next += 1
+            self._condition.notify_all()
+        return buffers
+
+    def close(self):
+        """
+        Stop reading files and release the buffers.
+        """
+        with self._condition:
+            self._closed = True
+            self._buffers.clear()
+            self._condition.notify_all()
+        self._thread.join()
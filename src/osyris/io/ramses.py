@@ -3,6 +3,7 @@
 from .. import config
 from ..core import Dataset
 from .loader import Loader
+from .report import LoadReport
 
 
 class RamsesDataset(Dataset):
@@ -13,13 +14,211 @@ class RamsesDataset(Dataset):
         self.set_units()
         self.meta["time"] *= self.units["time"]
 
-    def load(self, *args, **kwargs):
-        groups = self.loader.load(*args, meta=self.meta, units=self.units, **kwargs)
+    def load(self, *args, callback=None, **kwargs):
+        """
+        Load the data from the output files, and store the groups in the dataset.
+
+        :param select: A list of groups to load, or a dict of selection criteria to
+            apply to the variables of each group. A criterion is either a function
+            returning a mask, or a ``(lower, upper)`` tuple selecting the values
+            between the two bounds (inclusive), where either bound can be ``None``.
+            Default is ``None``, in which case everything is loaded.
+
+        :param cpu_list: A list of the cpu files to read. Default is ``None``, in
+            which case the list is determined automatically.
+
+        :param sortby: A dict of the variables to use to sort the groups after
+            loading, e.g. ``{"mesh": "level"}``. Default is ``None``.
+
+        :param workers: The number of processes used to read the cpu files in
+            parallel. Default is ``None`` (serial loading).
+
+        :param index: Use and update the index of the locations of the blocks of data
+            inside the files, and the zone map of the ranges of the values in the
+            files of each cpu. Default is ``True``.
+
+        :param preallocate: Count the cells and particles in a first pass over the
+            files, in order to allocate the final arrays with the right size and
+            reduce peak memory usage. Default is ``False``.
+
+        :param lazy: Only read the mesh variables that are needed for the selection.
+            The other variables are read from the files the first time they are
+            accessed, for the same cells. Note that the variables used in
+            ``config.additional_variables`` are accessed straight away, and that
+            ``items()``, ``values()`` and comparisons of the ``mesh`` group access
+            all the variables. To loop over the variables which have been read so
+            far, use ``keys()`` and ``is_loaded()``. Default is ``False``.
+
+        :param region: A region of space, such as a ``Sphere`` or a ``Box``. Only the
+            cpu files whose domains intersect the region are read, and only the cells
+            and particles inside the region are loaded. Default is ``None``.
+
+        :param prefetch: When loading serially, the number of cpus whose files are
+            read into memory by a background thread, ahead of the cpu being decoded.
+            This allows to overlap reading the files with decoding them.
+            Default is ``None`` (no prefetching).
+
+        :param prefetch_max_bytes: The maximum number of bytes held in memory by the
+            prefetched files. Default is ``None`` (no limit).
+
+        :param compiled: Decode the AMR, hydro, gravity and rt files of each cpu in a
+            single pass with compiled kernels. If ``False``, the files are decoded
+            one cache line at a time in Python. Both give identical results. The
+            kernels are compiled on first use and cached on disk.
+            Default is ``True``.
+
+        :param dtype: The type used to store the floating point variables, e.g.
+            ``"float32"`` to halve the memory used by the hydro, gravity, rt and
+            particle variables. The values are cast as they are decoded. The positions
+            and cell sizes are kept in double precision. The AMR level and cpu number
+            are then stored with the smallest integer types that can hold them, and
+            the integer particle variables keep the type they have in the files. Note
+            that quantities with large values in CGS units (e.g. the masses of
+            particles in grams) may overflow in single precision. Default is ``None``,
+            in which case all the floating point variables are stored in double
+            precision.
+
+        :param prune: Skip the mesh files of the cpus which cannot contain any cell
+            satisfying the selection criteria, according to the ranges of values
+            recorded in the zone map of the output by previous loads (the zone map
+            is recorded when ``index`` is ``True`` and ``compiled`` is ``True``).
+            Only the criteria given as ``(lower, upper)`` intervals are compared with
+            the ranges, such as ``(1.0e-20 * osyris.units("g/cm**3"), None)``. The
+            criteria given as functions are applied to the cells as usual, but are
+            never used to skip files. The particle files of the skipped cpus are
+            still read. Default is ``False``.
+
+        :param octree: Keep the oct tree of the AMR mesh. An ``Octree`` holding all
+            the octs of the domains of the cpus that were read (leaf and refined),
+            linked to their parents, children and neighbours, and to the loaded
+            cells of the ``mesh`` group, is stored in ``meta["octree"]``.
+            Cannot be used with ``cache``. Default is ``False``.
+
+        :param column_cache: A ``ColumnCache`` holding the columns decoded from the
+            AMR, hydro, gravity and rt files of each cpu, before the selection is
+            applied. Passing the same cache to several loads of an output means
+            that loads which only differ by their selection criteria or region do
+            not decode the files again. Only used with ``compiled=True``. When
+            loading with ``workers``, the columns in the cache are used, but the
+            columns decoded by the workers are not added to it.
+            Default is ``None`` (no column cache).
+
+        :param cache: A directory in which to store the loaded arrays, one ``.npy``
+            file per array. Subsequent loads of the same output with the same
+            ``select``, ``cpu_list``, ``sortby`` and ``region`` memory-map the arrays
+            from the cache instead of reading the output files. The cache is
+            discarded if the output files have changed. Cannot be used with ``lazy``.
+            Default is ``None`` (no cache).
+
+        :param callback: A function which is called with the ``LoadReport`` of the
+            load after every cpu file has been read, and at the end of the load.
+            Default is ``None``.
+
+        The time spent in the different phases of the load, the sizes of the files
+        that were opened, the throughput and the peak memory usage are recorded in
+        a ``LoadReport``, which is stored in ``meta["load_report"]``.
+        """
+        report = LoadReport(callback=callback)
+        groups = self.loader.load(
+            *args, meta=self.meta, units=self.units, report=report, **kwargs
+        )
         for name, group in groups.items():
             self[name] = group
+        with report.time("additional_variables"):
+            config.additional_variables(self)
+        report.finish(self.meta)
+        self.meta["load_report"] = report
+        return self
+
+    def load_more(self, select):
+        """
+        Load more variables from the hydro, gravity and rt files, for the cells that
+        were selected by the last call to ``load``, and add them to the ``mesh``
+        group. The selection of the cells, and the order given by ``sortby``, are
+        reused so that the new variables line up with the existing ones. The cache
+        lines of the AMR files are not decoded again.
+
+        :param select: A list of the variables to load, e.g.
+            ``["pressure", "grav_potential"]``. Vector quantities can be given by
+            their name, e.g. ``"velocity"``.
+        """
+        if isinstance(select, str):
+            select = [select]
+        for key, array in self.loader.load_more(
+            select, meta=self.meta, units=self.units
+        ).items():
+            self["mesh"][key] = array
         config.additional_variables(self)
         return self
 
+    def plan(
+        self,
+        select=None,
+        cpu_list=None,
+        region=None,
+        dtype=None,
+        preallocate=False,
+        prune=False,
+    ):
+        """
+        Estimate the size of a load without loading the data, by reading only the
+        headers of the AMR and particle files of the cpus that would be read. This
+        gives an upper bound on the number of cells and particles, the number of
+        bytes of every variable, the peak memory usage, and the list of files that
+        would be read.
+
+        The arguments are the same as for ``load``. Returns a ``LoadPlan``.
+        """
+        return self.loader.plan(
+            select=select,
+            cpu_list=cpu_list,
+            meta=self.meta,
+            units=self.units,
+            region=region,
+            dtype=dtype,
+            preallocate=preallocate,
+            prune=prune,
+        )
+
+    def iter_chunks(self, chunk_cpus=1, callback=None, **kwargs):
+        """
+        Iterate over the output in batches of cpu files, and yield a new dataset
+        containing the data of each batch, with the same units, vector arrays and
+        additional variables as with ``load``. Only one batch is held in memory at a
+        time, which allows to compute reductions (e.g. histograms) over outputs that
+        are too large to be loaded at once. The sink particles are only included in
+        the first batch.
+
+        :param chunk_cpus: The number of cpu files in each batch. Default is 1.
+
+        :param select: A list of groups to load, or a dict of selection criteria to
+            apply to the variables of each group. Default is ``None``, in which case
+            everything is loaded.
+
+        :param cpu_list: A list of the cpu files to read. Default is ``None``, in
+            which case the list is determined automatically.
+
+        The ``region``, ``workers``, ``index``, ``preallocate``, ``lazy``,
+        ``prefetch``, ``prefetch_max_bytes``, ``compiled``, ``dtype``, ``prune``,
+        ``octree``, ``column_cache`` and ``callback`` arguments are the same as for
+        ``load``. The ``LoadReport`` in the metadata of each batch covers all the
+        batches read so far, while the ``Octree`` only holds the octs of the batch.
+        """
+        meta = dict(self.meta)
+        report = LoadReport(callback=callback)
+        for groups in self.loader.iter_chunks(
+            chunk_cpus=chunk_cpus, meta=meta, units=self.units, report=report, **kwargs
+        ):
+            chunk = Dataset(groups)
+            chunk.meta = dict(meta)
+            chunk.units = self.units
+            chunk.loader = self.loader
+            with report.time("additional_variables"):
+                config.additional_variables(chunk)
+            report.finish(chunk.meta)
+            chunk.meta["load_report"] = report
+            yield chunk
+
     def copy(self):
         nout = self.loader.nout
         path = self.loader.path
@@ -10,11 +10,12 @@ from . import utils
 class Reader:
     def __init__(self, kind: str = None):
         self.variables = {}
-        self.offsets = {}
+        self.cursor = 0
         self.meta = {}
         self.bytes = None
         self.initialized = False
         self.kind = kind
+        self.region = None
 
     def descriptor_to_variables(self, descriptor, meta, units, select):
         read = {key: False for key in descriptor}
@@ -32,19 +33,46 @@ class Reader:
             self.variables[key] = {
                 "read": read[key],
                 "type": descriptor[key],
+                "dtype": np.dtype(descriptor[key]),
                 "buffer": None,
                 "pieces": {},
                 "unit": units[key],
             }
 
+    def set_dtype(self, dtype, meta):
+        """
+        Store the floating point variables with type ``dtype`` instead of the type
+        they have in the files. The values are cast as they are decoded.
+        The positions and cell sizes are kept in double precision, as they need it in
+        deep AMR levels, and their powers overflow in single precision in CGS units.
+        """
+        for key, item in self.variables.items():
+            if np.dtype(item["type"]).kind == "f" and not utils.is_geometry(key):
+                item["dtype"] = np.dtype(dtype)
+
     def allocate_buffers(self, ncache, twotondim):
         for item in self.variables.values():
             if item["read"]:
                 item["buffer"] = Array(
-                    values=np.empty([ncache * twotondim], dtype=np.dtype(item["type"])),
+                    values=np.empty([ncache * twotondim], dtype=item["dtype"]),
                     unit=item["unit"].units,
                 )
 
+    def read_record(self, dtype, count=None):
+        """
+        Decode the record at the current cursor position and move the cursor to
+        the next record.
+        """
+        values, self.cursor = utils.read_record(
+            content=self.bytes, cursor=self.cursor, dtype=dtype, count=count
+        )
+        return values
+
+    def skip_records(self, nrecords=1):
+        self.cursor = utils.skip_records(
+            content=self.bytes, cursor=self.cursor, nrecords=nrecords
+        )
+
     def read_header(self, *args, **kwargs):
         return
 
@@ -60,19 +88,14 @@ class Reader:
     def read_variables(self, ncache, ind, ilevel, cpuid, info):
         for item in self.variables.values():
             if item["read"]:
-                item["buffer"]._array[ind * ncache : (ind + 1) * ncache] = (
-                    np.array(
-                        utils.read_binary_data(
-                            fmt="{}{}".format(ncache, item["type"]),
-                            content=self.bytes,
-                            offsets=self.offsets,
-                        )
-                    )
-                    * item["unit"].magnitude
+                np.multiply(
+                    self.read_record(item["type"], ncache),
+                    item["unit"].magnitude,
+                    out=item["buffer"]._array[ind * ncache : (ind + 1) * ncache],
+                    casting="unsafe",
                 )
             else:
-                self.offsets[item["type"]] += ncache
-                self.offsets["n"] += 1
+                self.skip_records()
 
     def make_conditions(self, select):
         conditions = {}
@@ -86,5 +109,7 @@ class Reader:
         return
 
     def step_over(self, ncache, twotondim, ndim):
-        self.offsets["d"] += ncache * twotondim * len(self.variables)
-        self.offsets["n"] += twotondim * len(self.variables)
+        # One record per variable and per cell in the oct, each with a head and tail
+        # marker of 4 bytes
+        for item in self.variables.values():
+            self.cursor += twotondim * (ncache * np.dtype(item["type"]).itemsize + 8)
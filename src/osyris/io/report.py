@@ -0,0 +1,169 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class LoadReport:
+    """
+    The time spent in the different phases of loading an output, the sizes of the
+    files that were opened, and the throughput of the load.
+
+    The sizes of the files (``file_nbytes``, for each group) are the total sizes of
+    the files, which are memory-mapped: the number of bytes actually read from disk
+    can be smaller, e.g. when the deepest levels of the files are skipped with
+    ``levelmax``, or when only some of the variables are read.
+
+    The peak memory (``peak_memory``) is the high-water mark of the resident
+    memory of the process, since it started, and not only during the load. When
+    loading with multiple workers, the high-water mark of the largest worker
+    process is also recorded (``peak_memory_workers``).
+
+    The phases are:
+
+    - ``open``: opening and memory-mapping the files
+    - ``read``: waiting for the files read by the prefetch thread (when the files are
+      memory-mapped, they are read from disk while they are decoded)
+    - ``header``: reading the file headers (this includes decoding the particles)
+    - ``decode``: decoding the cache lines of the AMR, hydro, gravity and rt files
+    - ``selection``: applying the selection criteria to the cells
+    - ``concatenate``: merging the data of all the cpus into the final arrays
+    - ``vectors``: merging the vector components into vector arrays
+    - ``additional_variables``: computing the variables of the configuration
+
+    When loading with multiple workers, the times of the phases of reading the cpu
+    files are summed over the workers, and may exceed the total wall time.
+
+    :param callback: A function which is called with the report after every cpu file
+        has been read, and at the end of the load. Default is ``None``.
+    """
+
+    phases = (
+        "open",
+        "read",
+        "header",
+        "decode",
+        "selection",
+        "concatenate",
+        "vectors",
+        "additional_variables",
+    )
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.timings = {phase: 0.0 for phase in self.phases}
+        self.file_nbytes = {}
+        self.ncpus = 0
+        self.ncells = 0
+        self.nparticles = 0
+        self.wall_time = 0.0
+        self.peak_memory = None
+        self.peak_memory_workers = None
+        self._workers = False
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def time(self, phase):
+        """
+        Add the time spent in the body of the ``with`` statement to ``phase``.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] += time.perf_counter() - start
+
+    def add_file_nbytes(self, group, nbytes):
+        self.file_nbytes[group] = self.file_nbytes.get(group, 0) + int(nbytes)
+
+    def merge(self, other):
+        """
+        Add the timings and file sizes of the report of a worker process.
+        """
+        for phase, seconds in other.timings.items():
+            self.timings[phase] += seconds
+        for group, nbytes in other.file_nbytes.items():
+            self.add_file_nbytes(group, nbytes)
+        self._workers = True
+
+    def update(self, meta, ncpus=1):
+        """
+        Record that ``ncpus`` more cpu files have been read, and notify the callback.
+        """
+        self.ncpus += ncpus
+        self.ncells = int(meta["ncells"])
+        self.nparticles = int(meta["nparticles"])
+        self.wall_time = time.perf_counter() - self._start
+        if self.callback is not None:
+            self.callback(self)
+
+    def finish(self, meta):
+        """
+        Record the total wall time and the peak memory usage, and notify the callback.
+        """
+        self.peak_memory = _peak_memory("RUSAGE_SELF")
+        if self._workers:
+            # The worker processes have exited, and are included in the usage of
+            # the children of the process
+            self.peak_memory_workers = _peak_memory("RUSAGE_CHILDREN")
+        self.update(meta, ncpus=0)
+
+    @property
+    def cells_per_second(self):
+        if self.wall_time == 0:
+            return 0.0
+        return self.ncells / self.wall_time
+
+    @property
+    def file_nbytes_per_second(self):
+        if self.wall_time == 0:
+            return 0.0
+        return sum(self.file_nbytes.values()) / self.wall_time
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        lines = [
+            "LoadReport: {} cpus, {} cells, {} particles in {:.3f} s".format(
+                self.ncpus, self.ncells, self.nparticles, self.wall_time
+            ),
+            "  {:.4g} cells/s, {:.4g} MB/s".format(
+                self.cells_per_second, self.file_nbytes_per_second / 1.0e6
+            ),
+        ]
+        for phase, seconds in self.timings.items():
+            lines.append(
+                "  {:<21s} {:>9.3f} s {:>6.1f}%".format(
+                    phase, seconds, 100.0 * seconds / max(self.wall_time, 1.0e-12)
+                )
+            )
+        for group, nbytes in self.file_nbytes.items():
+            lines.append("  {:<21s} {:>9.3f} MB".format(group, nbytes / 1.0e6))
+        for name, nbytes in [
+            ("peak memory", self.peak_memory),
+            ("peak memory (workers)", self.peak_memory_workers),
+        ]:
+            if nbytes is not None:
+                lines.append("  {:<21s} {:>9.3f} MB".format(name, nbytes / 1.0e6))
+        return "\n".join(lines)
+
+
+def _peak_memory(who):
+    """
+    Return the high-water mark of the resident memory in bytes, of the process
+    (``"RUSAGE_SELF"``) or of its largest child process which has exited
+    (``"RUSAGE_CHILDREN"``), or ``None`` if it cannot be measured on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(getattr(resource, who)).ru_maxrss
+    # The peak is given in kilobytes on Linux, and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
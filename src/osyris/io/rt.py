@@ -35,10 +35,7 @@ class RtReader(Reader):
         self.initialized = True
 
     def read_header(self, info):
-        self.offsets["i"] += 5
-        self.offsets["n"] += 6
-        self.offsets["d"] += 1
+        self.skip_records(6)
 
     def read_domain_header(self):
-        self.offsets["n"] += 2
-        self.offsets["i"] += 2
+        self.skip_records(2)
@@ -7,7 +7,7 @@ import struct
 
 import numpy as np
 
-from ..core import Vector
+from ..core import Array, Vector
 
 
 def generate_fname(nout, path="", ftype="", cpuid=1, ext=""):
@@ -48,84 +48,167 @@ def read_parameter_file(fname=None, delimiter="="):
     return out
 
 
-def read_binary_data(
-    content=None, fmt=None, offsets=None, skip_head=True, increment=True
-):
+def record_size(content, cursor):
     """
-    Unpack binary data from a content buffer using a dict of offsets.
-    Also increment the offsets of the corresponding data read, as well as
-    increase the line count by 1.
+    Return the number of bytes in the data of the Fortran record starting at byte
+    position ``cursor``, as given by the record marker.
     """
+    return struct.unpack_from("i", content, cursor)[0]
 
-    byte_size = {
-        "b": 1,
-        "h": 2,
-        "i": 4,
-        "q": 8,
-        "f": 4,
-        "d": 8,
-        "e": 8,
-        "n": 8,
-        "l": 8,
-        "s": 1,
-    }
 
-    offset = 0
-    for key in offsets:
-        offset += offsets[key] * byte_size[key]
-    # if offset is None:
-    #     offset = 4*ninteg + 8*(nlines+nfloat+nlongi) + nstrin + nquadr*16
-    if skip_head:
-        offset += 4  # + correction
-
-    # byte_size = {"b": 1 , "h": 2, "i": 4, "q": 8, "f": 4, "d": 8, "e": 8}
-    if len(fmt) == 1:
-        mult = 1
-    else:
-        mult = int(fmt[:-1])
-    pack_size = mult * byte_size[fmt[-1]]
+def read_record(content, cursor, dtype, count=None):
+    """
+    Decode the Fortran record starting at byte position ``cursor`` in the content
+    buffer as an array of type ``dtype``. If ``count`` is not given, the whole
+    record is decoded. The returned array is a read-only view into the buffer, so
+    it should be copied if it is to outlive the buffer.
+    Also return the position of the start of the next record.
+    """
+    nbytes = record_size(content, cursor)
+    dtype = np.dtype(dtype)
+    if count is None:
+        count = nbytes // dtype.itemsize
+    values = np.frombuffer(content, dtype=dtype, count=count, offset=cursor + 4)
+    return values, cursor + nbytes + 8
 
-    if increment:
-        offsets[fmt[-1]] += mult
-    offsets["n"] += 1
 
-    return struct.unpack(fmt, content[offset : offset + pack_size])
+def skip_records(content, cursor, nrecords=1):
+    """
+    Return the position of the record located ``nrecords`` records after the one
+    starting at byte position ``cursor``.
+    """
+    for _ in range(nrecords):
+        cursor += record_size(content, cursor) + 8
+    return cursor
 
 
-def skip_binary_line(content, offsets):
+def read_record_index(fname, groups, ncpu, levelmax):
+    """
+    Read the index of record offsets from the sidecar file ``fname``.
+    The index contains one array per file type, with one row per cpu file. Each row
+    holds the modification time and size of the file it was built from, followed by
+    the byte offset of the block belonging to the cpu's own domain on each level
+    (-1 if unknown).
+    Missing, corrupt or mismatching entries are replaced by empty rows.
     """
-    Return the number of bytes necessary to skip the current line.
+    try:
+        with np.load(fname) as content:
+            index = {key: content[key] for key in content.files}
+    except (OSError, ValueError):
+        index = {}
+    for group in groups:
+        if index.get(group, np.empty(0)).shape != (ncpu, levelmax + 2):
+            index[group] = np.full([ncpu, levelmax + 2], -1, dtype=np.int64)
+    return index
+
+
+def write_record_index(fname, index):
     """
-    [nbytes] = read_binary_data(
-        fmt="i", content=content, offsets=offsets, skip_head=False, increment=False
-    )
-    return nbytes
+    Write the index of record offsets to the sidecar file ``fname``.
+    Writing is silently skipped if the output directory is not writable.
+    """
+    tmp = fname + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, **index)
+        os.replace(tmp, fname)
+    except OSError:
+        pass
 
 
-def make_vector_arrays(data, ndim):
+def is_geometry(key):
     """
-    Merge vector components in 2d arrays.
+    Return ``True`` if the variable ``key`` is a position or a cell size, which are
+    always stored in double precision.
+    """
+    return key == "dx" or key.startswith("position")
+
+
+def find_vector_components(keys, ndim):
+    """
+    Find the groups of keys that are the components of vector quantities.
+    Returns a dict of the lists of components, with the name of the vector as keys.
     """
     components = list("xyz"[:ndim])
+    vectors = {}
     if len(components) > 1:
-        delete = []
-        for key in list(data.keys()):
-            comp_list = None
-            rawkey = None
+        for key in keys:
             inds = [i for i, letter in enumerate(key) if letter == "x"]
             for ind in inds:
                 comp_list = [key[:ind] + c + key[ind + 1 :] for c in components]
-                if all([item in data for item in comp_list]):
+                if all([item in keys for item in comp_list]):
                     cut = ind - 1 if key[ind - 1] == "_" else ind
                     rawkey = key[:cut] + key[ind + 1 :]
                     if len(rawkey) == 0:
                         rawkey = "position"
-                    data[rawkey] = Vector(
-                        **{components[c]: data[comp_list[c]] for c in range(ndim)}
-                    )
-                    delete += comp_list
-        for key in delete:
-            del data[key]
+                    vectors[rawkey] = comp_list
+    return vectors
+
+
+def make_vector_arrays(data, ndim):
+    """
+    Merge vector components in 2d arrays.
+    """
+    components = list("xyz"[:ndim])
+    delete = []
+    for rawkey, comp_list in find_vector_components(
+        keys=list(data.keys()), ndim=ndim
+    ).items():
+        data[rawkey] = Vector(
+            **{components[c]: data[comp_list[c]] for c in range(ndim)}
+        )
+        delete += comp_list
+    for key in delete:
+        del data[key]
+
+
+class Interval:
+    """
+    A selection criterion which selects the values between ``lower`` and ``upper``
+    (inclusive). It is given in ``select`` as a ``(lower, upper)`` tuple, where
+    either bound can be ``None``. Unlike a function, it can be compared with the
+    range of the values in a file, to prove that none of them are selected.
+    """
+
+    def __init__(self, lower, upper):
+        self.lower = lower
+        self.upper = upper
+
+    def __call__(self, values):
+        cond = np.ones(len(values), dtype=bool)
+        if self.lower is not None:
+            cond &= _as_mask(values >= self.lower)
+        if self.upper is not None:
+            cond &= _as_mask(values <= self.upper)
+        return Array(values=cond) if isinstance(values, Array) else cond
+
+    def excludes(self, bounds):
+        """
+        Return ``True`` if none of the values between ``bounds[0]`` and ``bounds[1]``
+        are selected.
+        """
+        lower, upper = bounds[:1], bounds[1:]
+        return bool(
+            (self.lower is not None and not _as_mask(upper >= self.lower)[0])
+            or (self.upper is not None and not _as_mask(lower <= self.upper)[0])
+        )
+
+
+def _as_mask(cond):
+    return cond.values if isinstance(cond, Array) else np.asarray(cond)
+
+
+def parse_criteria(select):
+    """
+    Replace the ``(lower, upper)`` tuples in a dict of selection criteria by
+    ``Interval`` criteria.
+    """
+    if not isinstance(select, dict):
+        return select
+    return {
+        key: Interval(*func) if isinstance(func, tuple) else func
+        for key, func in select.items()
+    }
 
 
 def find_max_amr_level(levelmax, select):
@@ -0,0 +1,205 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+import os
+
+import numpy as np
+
+from ..core import Array
+from . import utils
+
+
+def _value_range(column):
+    """
+    Return the minimum and maximum of a column as floats. Floating point values are
+    widened by one unit in the last place, so that the range also holds the values
+    decoded with a different precision.
+    """
+    lo = np.min(column)
+    hi = np.max(column)
+    if column.dtype.kind == "f":
+        lo = np.nextafter(lo, column.dtype.type(-np.inf))
+        hi = np.nextafter(hi, column.dtype.type(np.inf))
+    return float(lo), float(hi)
+
+
+class ZoneMap:
+    """
+    The ranges of values of the mesh variables in the files of each cpu, and the
+    number of leaf cells on each level, recorded when the files are decoded. They
+    are used to skip the files which cannot contain any cell that satisfies the
+    selection criteria.
+
+    The ranges are taken over all the cells (leaf and refined) of the cpu's own
+    domain, up to the maximum level that was read. They remain valid for the loads
+    with the same or a lower maximum level, as long as the files have not changed.
+
+    The zone map is stored in a sidecar file in the output directory, with one
+    array per variable holding the range of each cpu (``NaN`` if unknown), and one
+    array per file type holding the modification time and size of the file the
+    ranges were recorded from, and the maximum level.
+
+    :param ncpu: The number of cpus.
+
+    :param levelmax: The maximum level of refinement.
+    """
+
+    def __init__(self, ncpu, levelmax):
+        self.ncpu = ncpu
+        self.levelmax = levelmax
+        self.arrays = {}
+        self.modified = False
+
+    @classmethod
+    def read(cls, fname, ncpu, levelmax):
+        """
+        Read a zone map from the sidecar file ``fname``. Missing, corrupt or
+        mismatching entries are ignored.
+        """
+        zone_map = cls(ncpu=ncpu, levelmax=levelmax)
+        try:
+            with np.load(fname) as content:
+                arrays = {key: content[key] for key in content.files}
+        except (OSError, ValueError):
+            arrays = {}
+        shapes = {"stat": (ncpu, 3), "ncells": (ncpu, levelmax), "range": (ncpu, 2)}
+        for key, array in arrays.items():
+            if array.shape == shapes.get(key.split(".")[0]):
+                zone_map.arrays[key] = array
+        return zone_map
+
+    def write(self, fname):
+        """
+        Write the zone map to the sidecar file ``fname``.
+        Writing is silently skipped if the output directory is not writable.
+        """
+        utils.write_record_index(fname=fname, index=self.arrays)
+        self.modified = False
+
+    def _array(self, name, shape, fill, dtype):
+        if name not in self.arrays:
+            self.arrays[name] = np.full(shape, fill, dtype=dtype)
+        return self.arrays[name]
+
+    def recorded_lmax(self, group, cpu_num, stat):
+        """
+        Return the maximum level up to which the ranges of the file of a cpu were
+        recorded, or zero if they are unknown or if the file has changed since.
+        """
+        stats = self.arrays.get("stat." + group)
+        if stats is None or list(stats[cpu_num - 1, :2]) != list(stat):
+            return 0
+        return int(stats[cpu_num - 1, 2])
+
+    def record(self, cpu_num, group, stat, lmax, values):
+        """
+        Record the ranges of the columns decoded from the file of a cpu. The ranges
+        recorded by a previous load are kept if the file has not changed, and if they
+        cover at least as many levels.
+
+        :param values: A dict of the decoded columns. For the AMR files, it also
+            holds the leaf cell flags (``"_leaf"``), used to count the leaf cells on
+            each level.
+        """
+        stats = self._array("stat." + group, (self.ncpu, 3), -1, np.int64)
+        row = stats[cpu_num - 1]
+        prefix = "range." + group + "."
+        if list(row[:2]) != list(stat) or lmax > row[2]:
+            for name, array in self.arrays.items():
+                if name.startswith(prefix):
+                    array[cpu_num - 1] = np.nan
+            row[:] = [*stat, lmax]
+            self.modified = True
+        elif lmax < row[2]:
+            return
+
+        for key, column in values.items():
+            if key.startswith("_"):
+                continue
+            ranges = self._array(prefix + key, (self.ncpu, 2), np.nan, np.float64)
+            if np.isnan(ranges[cpu_num - 1]).any() and len(column) > 0:
+                ranges[cpu_num - 1] = _value_range(column)
+                self.modified = True
+
+        if group == "amr":
+            leaf_levels = values["level"][values["_leaf"]].astype(np.int64) - 1
+            ncells = self._array("ncells", (self.ncpu, self.levelmax), -1, np.int64)
+            ncells[cpu_num - 1] = np.bincount(leaf_levels, minlength=self.levelmax)[
+                : self.levelmax
+            ]
+
+    def rows(self, cpu_num):
+        """
+        Return the entries of a cpu, to be merged with ``update_rows`` in another
+        process.
+        """
+        return {name: array[cpu_num - 1] for name, array in self.arrays.items()}
+
+    def update_rows(self, cpu_num, rows):
+        """
+        Set the entries of a cpu, recorded by another process.
+        """
+        for name, row in rows.items():
+            array = self.arrays.get(name)
+            if array is None:
+                fill = np.nan if row.dtype.kind == "f" else -1
+                array = self._array(
+                    name, (self.ncpu,) + row.shape, fill, dtype=row.dtype
+                )
+            if not np.array_equal(array[cpu_num - 1], row, equal_nan=True):
+                array[cpu_num - 1] = row
+                self.modified = True
+
+    def leaf_cells(self, cpu_num, stat, lmax):
+        """
+        Return the number of leaf cells in the domain of a cpu, when reading the AMR
+        levels up to ``lmax``, or ``None`` if it is not known.
+        """
+        if self.recorded_lmax("amr", cpu_num, stat) != lmax or "ncells" not in self:
+            return None
+        return int(np.sum(self.arrays["ncells"][cpu_num - 1, :lmax]))
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def can_skip(self, cpu_num, readers, select, fnames, lmax):
+        """
+        Return ``True`` if the ranges recorded for the files of a cpu show that none
+        of their cells can satisfy one of the selection criteria.
+
+        Only the criteria given as ``(lower, upper)`` intervals are used, as they can
+        be compared with the ranges. A function is never used to skip a file, since
+        its values at the bounds of a range say nothing about the values inside it
+        (e.g. for a criterion selecting a band of values).
+
+        :param fnames: The names of the files of the cpu, for each group.
+        """
+        for key, func in select.items():
+            if not isinstance(func, utils.Interval):
+                continue
+            group = next(
+                (
+                    g
+                    for g, reader in readers.items()
+                    if reader.kind == "mesh" and key in reader.variables
+                ),
+                None,
+            )
+            bounds = self.arrays.get("range." + str(group) + "." + key)
+            if bounds is None or np.isnan(bounds[cpu_num - 1]).any():
+                continue
+            stat = os.stat(fnames[group])
+            if (
+                self.recorded_lmax(group, cpu_num, [stat.st_mtime_ns, stat.st_size])
+                < lmax
+            ):
+                continue
+            item = readers[group].variables[key]
+            if func.excludes(
+                Array(
+                    values=bounds[cpu_num - 1].astype(item["dtype"]),
+                    unit=item["unit"].units,
+                )
+            ):
+                return True
+        return False
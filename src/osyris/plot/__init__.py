@@ -3,9 +3,17 @@
 
 from .histogram1d import histogram1d
 from .histogram2d import histogram2d
-from .map import map
+from .map import MapPlan, map
 from .plot import plot
 from .render import render
 from .scatter import scatter
 
-__all__ = ["histogram1d", "histogram2d", "map", "plot", "render", "scatter"]
+__all__ = [
+    "histogram1d",
+    "histogram2d",
+    "map",
+    "MapPlan",
+    "plot",
+    "render",
+    "scatter",
+]
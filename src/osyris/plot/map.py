@@ -9,11 +9,12 @@ from pint import Quantity
 
 from ..core import Array, Layer, Plot, Vector, VectorBasis
 from ..core.tools import apply_mask
+from ..spatial import Slab, spatial_index
 from .direction import get_direction
 from .parser import get_norm, parse_layer
 from .render import render
 from .scatter import scatter
-from .utils import evaluate_on_grid
+from .utils import PROJECTIONS, evaluate_on_grid, project_on_grid
 
 
 def _add_scatter(to_scatter, origin, basis, dx, dy, ax, map_unit):
@@ -57,6 +58,460 @@ def _add_scatter(to_scatter, origin, basis, dx, dy, ax, map_unit):
         )
 
 
+def _check_layers(layers):
+    for layer in layers:
+        if not isinstance(layer, Layer):
+            raise TypeError(f"Expected Layer object, got {type(layer)} instead. ")
+
+
+class MapPlan:
+    """
+    The geometry of a map: the cells of the mesh close to the plane of the map,
+    their positions in the basis of the map, and the mapping of the cells onto the
+    pixels of the image. A plan is computed once for a given view of a group of
+    cells, and can then render any number of layers of the same group, with
+    different modes, norms, colormaps or operations, without selecting and
+    projecting the cells again.
+
+    For a map with no thickness, the plan stores the index of the cell under each
+    pixel, so that rendering a layer only gathers the values of these cells. For a
+    thick map, the plan stores the cells inside the slab, and rendering a layer
+    projects their values along the line of sight.
+
+    The arguments have the same meaning as for :func:`map`.
+
+    :param data: The ``Datagroup`` (or a ``Layer``) containing the ``position`` and
+        ``dx`` of the cells. The layers rendered with the plan must have the same
+        number of cells.
+
+    :param direction: The vector normal to the map. Default is ``'z'``.
+
+    :param dx: The horizontal size of the plotted region. Default is ``None``.
+
+    :param dy: The vertical size of the plotted region. Default is ``None``.
+
+    :param dz: The thickness of the map. Default is ``None``.
+
+    :param origin: The position of the center of the map. Default is ``None``.
+
+    :param resolution: The resolution of the map. Default is ``None`` (= ``256``).
+
+    Example:
+
+    .. code-block:: python
+
+        plan = osyris.MapPlan(mesh, dx=2000.0 * osyris.units("au"), origin=center)
+        plan.map(mesh.layer("density"), norm="log")
+        plan.map(mesh.layer("temperature"), norm="log", cmap="magma")
+    """
+
+    def __init__(
+        self,
+        data,
+        direction: Union[str, list] = "z",
+        dx: Quantity = None,
+        dy: Quantity = None,
+        dz: Quantity = None,
+        origin: Array = None,
+        resolution: Union[int, dict] = None,
+    ):
+        position = data["position"]
+        cell_size = data["dx"]
+        ndim = position.nvec
+        self.ncells = len(cell_size)
+        self.ndim = ndim
+
+        self.thick = dz is not None
+
+        spatial_unit = position.unit
+        map_unit = spatial_unit
+
+        # Set window size
+        if dx is not None:
+            map_unit = dx.units
+            dx = dx.to(spatial_unit)
+        dy = dx if dy is None else dy.to(spatial_unit)
+        dz = dx if dz is None else dz.to(spatial_unit)
+
+        if origin is None:
+            origin = Vector(*([0] * ndim), unit=spatial_unit)
+
+        if ndim < 3:
+            basis = VectorBasis(
+                n=Vector(0, 0, name="z"),
+                u=Vector(1, 0, name="x"),
+                v=Vector(0, 1, name="y"),
+            )
+        else:
+            basis = get_direction(
+                direction=direction,
+                data=data,
+                dx=dx,
+                dy=dy,
+                origin=origin,
+            )
+
+        diagonal = np.sqrt(ndim)
+        normal = basis.n
+        vec_u = basis.u
+        vec_v = basis.v
+
+        # Select cells close to the plane, including factor of sqrt(ndim), using the
+        # spatial index of the positions
+        if ndim < 3:
+            indices_close_to_plane = np.arange(len(cell_size))
+        elif self.thick:
+            indices_close_to_plane = spatial_index(data).query(
+                Slab(thickness=diagonal * dz, origin=origin, normal=normal)
+            )
+        else:
+            indices_close_to_plane = spatial_index(data).query(
+                Slab(thickness=0.0 * spatial_unit, origin=origin, normal=normal),
+                pad=0.5 * diagonal,
+            )
+
+        if len(indices_close_to_plane) == 0:
+            raise RuntimeError(
+                "No cells were selected to construct the map. "
+                "The resulting figure would be empty."
+            )
+
+        xmin = None
+        if dx is not None:
+            xmin = -0.5 * dx.magnitude
+            xmax = xmin + dx.magnitude
+            ymin = -0.5 * dy.magnitude
+            ymax = ymin + dy.magnitude
+            zmin = -0.5 * dz.magnitude
+            zmax = zmin + dz.magnitude
+            # Limit selection further by using distance from center
+            radial_distance = (
+                position[indices_close_to_plane]
+                - origin
+                - 0.5 * cell_size[indices_close_to_plane] * diagonal
+            )
+            radial_selection = (
+                np.abs(radial_distance.norm.values)
+                <= max(dx.magnitude, dy.magnitude, dz.magnitude) * 0.6 * diagonal
+            )
+            indices_close_to_plane = indices_close_to_plane[radial_selection]
+
+        # Project coordinates onto the plane by taking dot product with axes vectors
+        coords = position[indices_close_to_plane] - origin
+        datax = coords.dot(vec_u)
+        datay = coords.dot(vec_v)
+        dataz = coords.dot(normal)
+        datadx = cell_size[indices_close_to_plane] * 0.5
+
+        if xmin is None:
+            xmin = (datax - datadx).min().values
+            xmax = (datax + datadx).max().values
+            ymin = (datay - datadx).min().values
+            ymax = (datay + datadx).max().values
+            zmin = (dataz - datadx).min().values
+            zmax = (dataz + datadx).max().values
+            dx = (xmax - xmin) * datadx.unit
+            dy = (ymax - ymin) * datadx.unit
+
+        # Create a grid of pixel centers
+        default_resolution = 256
+        if resolution is None:
+            resolution = default_resolution
+        if isinstance(resolution, int):
+            resolution = {"x": resolution, "y": resolution}
+        else:
+            resolution = {xy: resolution.get(xy, default_resolution) for xy in "xy"}
+        xspacing = (xmax - xmin) / resolution["x"]
+        yspacing = (ymax - ymin) / resolution["y"]
+        xcenters = np.linspace(
+            xmin + 0.5 * xspacing, xmax - 0.5 * xspacing, resolution["x"]
+        )
+        ycenters = np.linspace(
+            ymin + 0.5 * yspacing, ymax - 0.5 * yspacing, resolution["y"]
+        )
+
+        u_array, v_array, n_array = (
+            np.array(
+                [
+                    vec.x.values,
+                    vec.y.values,
+                    vec.z.values if vec.z is not None else np.zeros_like(vec.x.values),
+                ]
+            )
+            for vec in (vec_u, vec_v, normal)
+        )
+
+        div = dx.to(datadx.unit).magnitude
+        if self.thick:
+            # Keep the cells in the basis of the map, to project their values along
+            # the line of sight
+            self._projection = {
+                "cell_positions_in_new_basis_x": apply_mask(datax.values / div),
+                "cell_positions_in_new_basis_y": apply_mask(datay.values / div),
+                "cell_positions_in_new_basis_z": apply_mask(dataz.values / div),
+                "cell_positions_in_original_basis": np.array(
+                    [xyz.values / div for xyz in coords._xyz.values()]
+                ).T,
+                "cell_sizes": datadx.values / div,
+                "grid_centers_in_new_basis_x": xcenters / div,
+                "grid_centers_in_new_basis_y": ycenters / div,
+                "grid_spacing_in_new_basis_x": xspacing / div,
+                "grid_spacing_in_new_basis_y": yspacing / div,
+                "zmin": zmin / div,
+                "zmax": zmax / div,
+                "basis": np.array([u_array, v_array, n_array]),
+                "ndim": ndim,
+            }
+            self._depth = div * dataz.unit
+        else:
+            xg, yg = np.meshgrid(xcenters, ycenters, indexing="ij")
+            xgrid = xg.T.reshape((1,) + xg.T.shape + (1,))
+            ygrid = yg.T.reshape((1,) + yg.T.shape + (1,))
+            pixel_positions = xgrid * u_array + ygrid * v_array
+
+            # Find the cell under each pixel, by evaluating the indices of the cells
+            # at the grid positions
+            pixels = evaluate_on_grid(
+                cell_positions_in_new_basis_x=apply_mask(datax.values / div),
+                cell_positions_in_new_basis_y=apply_mask(datay.values / div),
+                cell_positions_in_new_basis_z=apply_mask(dataz.values / div),
+                cell_positions_in_original_basis_x=coords.x.values / div,
+                cell_positions_in_original_basis_y=(
+                    coords.y.values / div if coords.y is not None else None
+                ),
+                cell_positions_in_original_basis_z=(
+                    coords.z.values / div if coords.z is not None else None
+                ),
+                cell_values=np.arange(len(indices_close_to_plane), dtype=np.float64)[
+                    np.newaxis, :
+                ],
+                cell_sizes=datadx.values / div,
+                grid_lower_edge_in_new_basis_x=xmin / div,
+                grid_lower_edge_in_new_basis_y=ymin / div,
+                grid_lower_edge_in_new_basis_z=0.0,
+                grid_spacing_in_new_basis_x=xspacing / div,
+                grid_spacing_in_new_basis_y=yspacing / div,
+                grid_spacing_in_new_basis_z=zmax / div,
+                grid_positions_in_original_basis=pixel_positions / div,
+                ndim=ndim,
+            )[0, 0]
+            # Empty pixels point to the last cell, which is a NaN added when
+            # rendering
+            self._pixels = np.where(np.isnan(pixels), -1, pixels).astype(np.int64)
+
+        self.indices = indices_close_to_plane
+        self.basis = basis
+        self.origin = origin
+        self.dx = dx
+        self.dy = dy
+        self.spatial_unit = spatial_unit
+        self.map_unit = map_unit
+        self.xmin, self.xmax, self.ymin, self.ymax = xmin, xmax, ymin, ymax
+        self.xcenters = xcenters
+        self.ycenters = ycenters
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        return "MapPlan: {} map of {}x{} pixels, {} cells out of {}".format(
+            "thick" if self.thick else "thin",
+            len(self.xcenters),
+            len(self.ycenters),
+            len(self.indices),
+            self.ncells,
+        )
+
+    def _values(self, to_process, to_weigh, to_render):
+        """
+        Return the values of the layers in the cells of the plan (three values for
+        vector layers), their weights, and whether each layer is a scalar.
+        """
+        scalar_layer = []
+        to_binning = []  # contains the variables in cells close to the plane
+        binning_weights = []  # the weights of the variables, for thick maps
+        for ind in range(len(to_process)):
+            if len(to_process[ind]) != self.ncells:
+                raise ValueError(
+                    "Layer '{}' has {} values, but the map was planned for {} "
+                    "cells.".format(
+                        to_process[ind].name, len(to_process[ind]), self.ncells
+                    )
+                )
+            weights = np.ones(len(self.indices))
+            if to_weigh[ind] is not None:
+                weights = apply_mask(to_weigh[ind].norm.values[self.indices])
+            if to_render[ind]["mode"] in ["vec", "stream", "lic"]:
+                uv = to_process[ind][self.indices]
+                if to_process[ind].z is None:
+                    u = uv.x.values
+                    v = uv.y.values
+                else:
+                    u = uv.dot(self.basis.u).values
+                    v = uv.dot(self.basis.v).values
+
+                w = None
+                if isinstance(to_render[ind]["params"].get("color"), (Array, Vector)):
+                    w = to_render[ind]["params"]["color"].norm.values[self.indices]
+                else:
+                    w = u * u
+                    w += v * v
+                    w = np.sqrt(w)
+                to_binning.append(apply_mask(u))
+                to_binning.append(apply_mask(v))
+                to_binning.append(w)
+                binning_weights.extend([weights] * 3)
+                scalar_layer.append(False)
+            else:
+                to_binning.append(apply_mask(to_process[ind].norm.values[self.indices]))
+                binning_weights.append(weights)
+                scalar_layer.append(True)
+        return (
+            np.array(to_binning, dtype=np.float64),
+            np.array(binning_weights, dtype=np.float64),
+            scalar_layer,
+        )
+
+    def map(
+        self,
+        *layers,
+        filename: str = None,
+        title: str = None,
+        plot: bool = True,
+        mode: str = None,
+        norm: str = None,
+        vmin: float = None,
+        vmax: float = None,
+        operation: str = "sum",
+        ax: object = None,
+        **kwargs,
+    ) -> Plot:
+        """
+        Render layers with the geometry of the plan. The arguments have the same
+        meaning as for :func:`map`.
+        """
+        to_process = []
+        to_weigh = []
+        to_render = []
+        to_scatter = []
+        _check_layers(layers)
+        for layer in layers:
+            layer = parse_layer(
+                layer,
+                mode=mode,
+                operation=operation,
+                norm=norm,
+                vmin=vmin,
+                vmax=vmax,
+                **kwargs,
+            )
+            layer.kwargs.update(
+                norm=get_norm(norm=layer.norm, vmin=layer.vmin, vmax=layer.vmax)
+            )
+            if layer.mode == "scatter":
+                to_scatter.append({"data": layer.data, "params": layer.kwargs})
+            else:
+                to_process.append(layer.data)
+                to_weigh.append(layer.weights)
+                to_render.append(
+                    {
+                        "mode": layer.mode,
+                        "params": layer.kwargs,
+                        "unit": layer.data.unit,
+                        "name": layer.data.name,
+                    }
+                )
+
+        values, weights, scalar_layer = self._values(to_process, to_weigh, to_render)
+
+        if self.thick:
+            # Deposit the cells directly onto the image, with the length of the line
+            # of sight through each cell
+            binned = project_on_grid(
+                cell_values=values,
+                cell_weights=weights,
+                operation=operation,
+                **self._projection,
+            )
+            if PROJECTIONS[operation] == PROJECTIONS["sum"]:
+                binned *= self._depth.magnitude
+                for layer in to_render:
+                    layer["unit"] = layer["unit"] * self._depth.units
+        else:
+            # Gather the values of the cells under the pixels
+            binned = np.concatenate(
+                [values, np.full((len(values), 1), np.nan)], axis=1
+            )[:, self._pixels]
+
+        # Mask NaN values
+        mask = np.isnan(binned[-1, ...])
+        mask_vec = np.broadcast_to(mask.reshape(*mask.shape, 1), mask.shape + (3,))
+
+        # Now we fill the arrays to be sent to the renderer, also constructing vectors
+        counter = 0
+        for ind in range(len(to_render)):
+            if scalar_layer[ind]:
+                to_render[ind]["data"] = ma.masked_where(
+                    mask, binned[counter, ...], copy=False
+                )
+                counter += 1
+            else:
+                to_render[ind]["data"] = ma.masked_where(
+                    mask_vec,
+                    np.array(
+                        [
+                            binned[counter, ...].T,
+                            binned[counter + 1, ...].T,
+                            binned[counter + 2, ...].T,
+                        ]
+                    ).T,
+                    copy=False,
+                )
+                counter += 3
+
+        scale_ratio = (1.0 * self.spatial_unit).to(self.map_unit).magnitude
+        xcenters = self.xcenters * scale_ratio
+        ycenters = self.ycenters * scale_ratio
+
+        to_return = {
+            "x": xcenters,
+            "y": ycenters,
+            "layers": to_render,
+            "filename": filename,
+        }
+        if plot:
+            # Render the map
+            figure = render(x=xcenters, y=ycenters, data=to_render, ax=ax)
+            figure["ax"].set_xlabel(
+                Array(values=0, unit=self.map_unit, name=self.basis.u.name).label
+            )
+            figure["ax"].set_ylabel(
+                Array(values=0, unit=self.map_unit, name=self.basis.v.name).label
+            )
+            if ax is None:
+                figure["ax"].set_aspect("equal")
+
+            # Add scatter layer
+            if len(to_scatter) > 0:
+                _add_scatter(
+                    to_scatter=to_scatter,
+                    origin=self.origin,
+                    basis=self.basis,
+                    dx=self.dx,
+                    dy=self.dy,
+                    ax=figure["ax"],
+                    map_unit=self.map_unit,
+                )
+
+            figure["ax"].set_xlim(self.xmin * scale_ratio, self.xmax * scale_ratio)
+            figure["ax"].set_ylim(self.ymin * scale_ratio, self.ymax * scale_ratio)
+            figure["ax"].set_title(title)
+
+            to_return.update({"fig": figure["fig"], "ax": figure["ax"]})
+
+        return Plot(**to_return)
+
+
 def map(
     *layers,
     direction: Union[str, list] = "z",
@@ -80,8 +535,12 @@ def map(
     Create a 2D spatial map of a region inside a simulation domain.
     By default, the map represents a plane with zero thickness.
     A thick slab or cube can also be computed by specifying a thickness via the
-    ``dz`` argument. In this case, the resulting 3D box is integrated along the ``z``
-    direction before being sent to the image rendering.
+    ``dz`` argument. In this case, the cells are projected along the ``z``
+    direction: each cell is deposited onto the pixels it covers, with the length of
+    the line of sight through the cell inside the slab.
+
+    To make several maps of the same view, e.g. of different variables, a
+    :class:`MapPlan` can be used to compute the geometry of the map only once.
 
     :param layers: Dicts or Arrays representing the quantities to be mapped onto the
         generated image.
@@ -132,330 +591,39 @@ def map(
         integer or a dict. In the case of an integer, it represents the number of
         pixels used for the horizontal and vertical dimensions. For a dictionary,
         the following syntax should be used: ``resolution={'x': 128, 'y': 192}``.
-        Default is ``256``.
+        Thick maps do not need a resolution along ``z``. Default is ``256``.
 
-    :param operation: Numpy operation to apply along the ``z`` dimension if ``dz`` is
-        not ``None``. Example values are ``'sum'``, ``'nansum'``, ``'nanmin'``,
-        ``'nanmax'``, ``'nanmean'``, ``'mean'``, ``'min'``, and ``'max'``.
-        Default is ``'sum'``.
+    :param operation: The operation to apply along the ``z`` dimension if ``dz`` is
+        not ``None``. Possible values are ``'sum'`` (the integral along the line of
+        sight, e.g. a column density), ``'mean'`` (the mean along the line of sight,
+        weighted by the ``weights`` of the layer if any), ``'min'`` and ``'max'``.
+        A cell with a ``NaN`` (e.g. masked) value makes the pixels it covers
+        ``NaN``, unless the numpy names ``'nansum'``, ``'nanmean'``, ``'nanmin'``
+        and ``'nanmax'`` are used, which skip it. Default is ``'sum'``.
 
     :param ax: A matplotlib axes inside which the figure will be plotted.
         Default is ``None``, in which case some new axes a created.
     """
-
-    to_process = []
-    to_render = []
-    to_scatter = []
-    for layer in layers:
-        if not isinstance(layer, Layer):
-            raise TypeError(f"Expected Layer object, got {type(layer)} instead. ")
-        layer = parse_layer(
-            layer,
-            mode=mode,
-            operation=operation,
-            norm=norm,
-            vmin=vmin,
-            vmax=vmax,
-            **kwargs,
-        )
-        layer.kwargs.update(
-            norm=get_norm(norm=layer.norm, vmin=layer.vmin, vmax=layer.vmax)
-        )
-        if layer.mode == "scatter":
-            to_scatter.append({"data": layer.data, "params": layer.kwargs})
-        else:
-            to_process.append(layer.data)
-            to_render.append(
-                {
-                    "mode": layer.mode,
-                    "params": layer.kwargs,
-                    "unit": layer.data.unit,
-                    "name": layer.data.name,
-                }
-            )
-
-    position = layers[0]["position"]
-    cell_size = layers[0]["dx"]
-    ndim = position.nvec
-
-    thick = dz is not None
-
-    spatial_unit = position.unit
-    map_unit = spatial_unit
-
-    # Set window size
-    if dx is not None:
-        map_unit = dx.units
-        dx = dx.to(spatial_unit)
-    dy = dx if dy is None else dy.to(spatial_unit)
-    dz = dx if dz is None else dz.to(spatial_unit)
-
-    if origin is None:
-        origin = Vector(*([0] * ndim), unit=spatial_unit)
-
-    if ndim < 3:
-        basis = VectorBasis(
-            n=Vector(0, 0, name="z"), u=Vector(1, 0, name="x"), v=Vector(0, 1, name="y")
-        )
-    else:
-        basis = get_direction(
-            direction=direction,
-            data=layers[0],
-            dx=dx,
-            dy=dy,
-            origin=origin,
-        )
-
-    # Distance to the plane
-    diagonal = np.sqrt(ndim)
-    xyz = position - origin
-    selection_distance = 0.5 * diagonal * (dz if thick else cell_size)
-
-    normal = basis.n
-    vec_u = basis.u
-    vec_v = basis.v
-
-    dist_to_plane = xyz.dot(normal)
-    # Create an array of indices to allow further narrowing of the selection below
-    global_indices = np.arange(len(cell_size))
-    # Select cells close to the plane, including factor of sqrt(ndim)
-    close_to_plane = (np.abs(dist_to_plane) <= selection_distance).values
-    indices_close_to_plane = global_indices[close_to_plane]
-
-    if len(indices_close_to_plane) == 0:
-        raise RuntimeError(
-            "No cells were selected to construct the map. "
-            "The resulting figure would be empty."
-        )
-
-    xmin = None
-    if dx is not None:
-        xmin = -0.5 * dx.magnitude
-        xmax = xmin + dx.magnitude
-        ymin = -0.5 * dy.magnitude
-        ymax = ymin + dy.magnitude
-        zmin = -0.5 * dz.magnitude
-        zmax = zmin + dz.magnitude
-        # Limit selection further by using distance from center
-        radial_distance = (
-            xyz[indices_close_to_plane]
-            - 0.5 * cell_size[indices_close_to_plane] * diagonal
-        )
-        radial_selection = (
-            np.abs(radial_distance.norm.values)
-            <= max(dx.magnitude, dy.magnitude, dz.magnitude) * 0.6 * diagonal
-        )
-        indices_close_to_plane = indices_close_to_plane[radial_selection]
-
-    # Project coordinates onto the plane by taking dot product with axes vectors
-    coords = xyz[indices_close_to_plane]
-    datax = coords.dot(vec_u)
-    datay = coords.dot(vec_v)
-    dataz = coords.dot(normal)
-    datadx = cell_size[indices_close_to_plane] * 0.5
-
-    if xmin is None:
-        xmin = (datax - datadx).min().values
-        xmax = (datax + datadx).max().values
-        ymin = (datay - datadx).min().values
-        ymax = (datay + datadx).max().values
-        zmin = (dataz - datadx).min().values
-        zmax = (dataz + datadx).max().values
-        dx = (xmax - xmin) * datadx.unit
-        dy = (ymax - ymin) * datadx.unit
-
-    scalar_layer = []
-    to_binning = []  # contains the variables in cells close to the plane
-    for ind in range(len(to_process)):
-        if to_render[ind]["mode"] in ["vec", "stream", "lic"]:
-            uv = to_process[ind][indices_close_to_plane]
-            if to_process[ind].z is None:
-                u = uv.x.values
-                v = uv.y.values
-            else:
-                u = uv.dot(vec_u).values
-                v = uv.dot(vec_v).values
-
-            w = None
-            if isinstance(to_render[ind]["params"].get("color"), (Array, Vector)):
-                w = to_render[ind]["params"]["color"].norm.values[
-                    indices_close_to_plane
-                ]
-            else:
-                w = u * u
-                w += v * v
-                w = np.sqrt(w)
-            to_binning.append(apply_mask(u))
-            to_binning.append(apply_mask(v))
-            to_binning.append(w)
-            scalar_layer.append(False)
-        else:
-            to_binning.append(
-                apply_mask(to_process[ind].norm.values[indices_close_to_plane])
-            )
-            scalar_layer.append(True)
-
-    # Create a grid of pixel centers
-    default_resolution = 256
-    if resolution is None:
-        resolution = default_resolution
-    if isinstance(resolution, int):
-        resolution = {"x": resolution, "y": resolution}
-    else:
-        for xy in "xy":
-            if xy not in resolution:
-                resolution[xy] = default_resolution
-    xspacing = (xmax - xmin) / resolution["x"]
-    yspacing = (ymax - ymin) / resolution["y"]
-    xcenters = np.linspace(
-        xmin + 0.5 * xspacing, xmax - 0.5 * xspacing, resolution["x"]
+    _check_layers(layers)
+    plan = MapPlan(
+        layers[0],
+        direction=direction,
+        dx=dx,
+        dy=dy,
+        dz=dz,
+        origin=origin,
+        resolution=resolution,
     )
-    ycenters = np.linspace(
-        ymin + 0.5 * yspacing, ymax - 0.5 * yspacing, resolution["y"]
-    )
-
-    if thick:
-        if "z" not in resolution:
-            resolution["z"] = round((zmax - zmin) / (0.5 * (xspacing + yspacing)))
-        zspacing = (zmax - zmin) / resolution["z"]
-        zcenters = np.linspace(
-            zmin + 0.5 * zspacing, zmax - 0.5 * zspacing, resolution["z"]
-        )
-    else:
-        zmin = 0.0
-        zspacing = zmax - zmin
-        zcenters = [0.0]
-
-    xg, yg, zg = np.meshgrid(xcenters, ycenters, zcenters, indexing="ij")
-    xgrid = xg.T
-    ygrid = yg.T
-    zgrid = zg.T
-    u_array = np.array(
-        [
-            vec_u.x.values,
-            vec_u.y.values,
-            vec_u.z.values if vec_u.z is not None else np.zeros_like(vec_u.x.values),
-        ]
-    )
-    v_array = np.array(
-        [
-            vec_v.x.values,
-            vec_v.y.values,
-            vec_v.z.values if vec_v.z is not None else np.zeros_like(vec_v.x.values),
-        ]
-    )
-    n_array = np.array(
-        [
-            normal.x.values,
-            normal.y.values,
-            normal.z.values if normal.z is not None else np.zeros_like(normal.x.values),
-        ]
-    )
-
-    pixel_positions = (
-        xgrid.reshape(xgrid.shape + (1,)) * u_array
-        + ygrid.reshape(ygrid.shape + (1,)) * v_array
-        + zgrid.reshape(zgrid.shape + (1,)) * n_array
+    return plan.map(
+        *layers,
+        filename=filename,
+        title=title,
+        plot=plot,
+        mode=mode,
+        norm=norm,
+        vmin=vmin,
+        vmax=vmax,
+        operation=operation,
+        ax=ax,
+        **kwargs,
     )
-
-    # Evaluate the values of the data layers at the grid positions
-    div = dx.to(datadx.unit).magnitude
-    binned = evaluate_on_grid(
-        cell_positions_in_new_basis_x=apply_mask(datax.values / div),
-        cell_positions_in_new_basis_y=apply_mask(datay.values / div),
-        cell_positions_in_new_basis_z=apply_mask(dataz.values / div),
-        cell_positions_in_original_basis_x=coords.x.values / div,
-        cell_positions_in_original_basis_y=(
-            coords.y.values / div if coords.y is not None else None
-        ),
-        cell_positions_in_original_basis_z=(
-            coords.z.values / div if coords.z is not None else None
-        ),
-        cell_values=np.array(to_binning),
-        cell_sizes=datadx.values / div,
-        grid_lower_edge_in_new_basis_x=xmin / div,
-        grid_lower_edge_in_new_basis_y=ymin / div,
-        grid_lower_edge_in_new_basis_z=zmin / div,
-        grid_spacing_in_new_basis_x=xspacing / div,
-        grid_spacing_in_new_basis_y=yspacing / div,
-        grid_spacing_in_new_basis_z=zspacing / div,
-        grid_positions_in_original_basis=pixel_positions / div,
-        ndim=ndim,
-    )
-
-    # Apply operation along depth
-    binned = getattr(np, operation)(binned, axis=1)
-
-    # Handle thick maps
-    if thick and ((operation == "sum") or (operation == "nansum")):
-        binned *= zspacing
-        for layer in to_render:
-            layer["unit"] = layer["unit"] * dataz.unit
-
-    # Mask NaN values
-    mask = np.isnan(binned[-1, ...])
-    mask_vec = np.broadcast_to(mask.reshape(*mask.shape, 1), mask.shape + (3,))
-
-    # Now we fill the arrays to be sent to the renderer, also constructing vectors
-    counter = 0
-    for ind in range(len(to_render)):
-        if scalar_layer[ind]:
-            to_render[ind]["data"] = ma.masked_where(
-                mask, binned[counter, ...], copy=False
-            )
-            counter += 1
-        else:
-            to_render[ind]["data"] = ma.masked_where(
-                mask_vec,
-                np.array(
-                    [
-                        binned[counter, ...].T,
-                        binned[counter + 1, ...].T,
-                        binned[counter + 2, ...].T,
-                    ]
-                ).T,
-                copy=False,
-            )
-            counter += 3
-
-    scale_ratio = (1.0 * spatial_unit).to(map_unit).magnitude
-    xcenters *= scale_ratio
-    ycenters *= scale_ratio
-
-    to_return = {
-        "x": xcenters,
-        "y": ycenters,
-        "layers": to_render,
-        "filename": filename,
-    }
-    if plot:
-        # Render the map
-        figure = render(x=xcenters, y=ycenters, data=to_render, ax=ax)
-        figure["ax"].set_xlabel(Array(values=0, unit=map_unit, name=basis.u.name).label)
-        figure["ax"].set_ylabel(Array(values=0, unit=map_unit, name=basis.v.name).label)
-        if ax is None:
-            figure["ax"].set_aspect("equal")
-
-        # Add scatter layer
-        if len(to_scatter) > 0:
-            _add_scatter(
-                to_scatter=to_scatter,
-                origin=origin,
-                basis=basis,
-                dx=dx,
-                dy=dy,
-                ax=figure["ax"],
-                map_unit=map_unit,
-            )
-
-        xmin *= scale_ratio
-        xmax *= scale_ratio
-        ymin *= scale_ratio
-        ymax *= scale_ratio
-        figure["ax"].set_xlim(xmin, xmax)
-        figure["ax"].set_ylim(ymin, ymax)
-        figure["ax"].set_title(title)
-
-        to_return.update({"fig": figure["fig"], "ax": figure["ax"]})
-
-    return Plot(**to_return)
@@ -6,6 +6,135 @@ from numba import njit, prange
 
 
 @njit(parallel=True)
+def _footprints(
+    positions_x,
+    positions_y,
+    positions_z,
+    sizes,
+    lower_x,
+    lower_y,
+    lower_z,
+    spacing_x,
+    spacing_y,
+    spacing_z,
+    nx,
+    ny,
+    nz,
+    diagonal,
+):
+    """
+    Return the range of pixels ``[i1, i2)``, ``[j1, j2)`` and ``[k1, k2)`` along
+    each axis of the grid which may be covered by each cell.
+    """
+    ncells = len(positions_x)
+    out = np.empty((ncells, 6), dtype=np.int64)
+    for n in prange(ncells):
+        half_size = sizes[n] * diagonal
+        out[n, 0] = max(int(((positions_x[n] - half_size) - lower_x) / spacing_x), 0)
+        out[n, 1] = min(
+            int(((positions_x[n] + half_size) - lower_x) / spacing_x) + 1, nx
+        )
+        out[n, 2] = max(int(((positions_y[n] - half_size) - lower_y) / spacing_y), 0)
+        out[n, 3] = min(
+            int(((positions_y[n] + half_size) - lower_y) / spacing_y) + 1, ny
+        )
+        out[n, 4] = max(int(((positions_z[n] - half_size) - lower_z) / spacing_z), 0)
+        out[n, 5] = min(
+            int(((positions_z[n] + half_size) - lower_z) / spacing_z) + 1, nz
+        )
+    return out
+
+
+@njit
+def _bands(footprints, order, band_height, nbands):
+    """
+    Make the list of the cells which may cover each band of ``band_height`` rows of
+    the grid, keeping the cells of each band in the painting ``order``.
+    """
+    offsets = np.zeros(nbands + 1, dtype=np.int64)
+    for n in order:
+        if footprints[n, 0] < footprints[n, 1] and footprints[n, 4] < footprints[n, 5]:
+            for b in range(
+                footprints[n, 2] // band_height,
+                (footprints[n, 3] - 1) // band_height + 1,
+            ):
+                offsets[b + 1] += 1
+    offsets = np.cumsum(offsets)
+    cursor = offsets[:-1].copy()
+    cells = np.empty(offsets[-1], dtype=np.int64)
+    for n in order:
+        if footprints[n, 0] < footprints[n, 1] and footprints[n, 4] < footprints[n, 5]:
+            for b in range(
+                footprints[n, 2] // band_height,
+                (footprints[n, 3] - 1) // band_height + 1,
+            ):
+                cells[cursor[b]] = n
+                cursor[b] += 1
+    return offsets, cells
+
+
+@njit
+def _first_above(grid, k, j, a, lo, hi, center, sign, threshold, strict):
+    """
+    Return the first pixel ``i`` between ``lo`` and ``hi`` (or ``hi + 1`` if there
+    is none) where ``sign * (grid[k, j, i, a] - center)`` is above ``threshold``
+    (strictly if ``strict``), assuming it does not decrease along the row.
+    """
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        d = sign * (grid[k, j, mid, a] - center)
+        if (d > threshold) if strict else (d >= threshold):
+            hi = mid - 1
+        else:
+            lo = mid + 1
+    return lo
+
+
+@njit
+def _row_interval(grid, k, j, i1, i2, center, size):
+    """
+    Return the first and last pixels of the row ``(k, j)`` of the grid, between
+    ``i1`` and ``i2``, which are inside a cell. Along a row, the pixel positions
+    change monotonically in each direction, so that the pixels inside the cell are
+    contiguous, and their ends can be found with a binary search. The pixels in
+    between are never tested.
+    """
+    lo = i1
+    hi = i2 - 1
+    for a in range(len(center)):
+        sign = 1.0 if grid[k, j, i2 - 1, a] >= grid[k, j, i1, a] else -1.0
+        # The pixel is inside along this direction if -size <= distance <= size
+        start = _first_above(grid, k, j, a, lo, hi, center[a], sign, -size, False)
+        end = _first_above(grid, k, j, a, start, hi, center[a], sign, size, True)
+        lo = start
+        hi = end - 1
+        if lo > hi:
+            return 0, -1
+    return lo, hi
+
+
+@njit(parallel=True)
+def _paint(out, grid, centers, sizes, values, footprints, offsets, cells, band_height):
+    """
+    Paint the cells onto the grid. The bands of rows are painted in parallel, each
+    by a single thread, with the cells in the order of the lists of the bands.
+    """
+    ny = grid.shape[1]
+    nvalues = values.shape[0]
+    for b in prange(len(offsets) - 1):
+        jstart = b * band_height
+        jend = min(jstart + band_height, ny)
+        for c in range(offsets[b], offsets[b + 1]):
+            n = cells[c]
+            i1, i2, j1, j2, k1, k2 = footprints[n]
+            for k in range(k1, k2):
+                for j in range(max(j1, jstart), min(j2, jend)):
+                    lo, hi = _row_interval(grid, k, j, i1, i2, centers[n], sizes[n])
+                    for i in range(lo, hi + 1):
+                        for v in range(nvalues):
+                            out[v, k, j, i] = values[v, n]
+
+
 def evaluate_on_grid(
     cell_positions_in_new_basis_x,
     cell_positions_in_new_basis_y,
@@ -23,112 +152,276 @@ def evaluate_on_grid(
     grid_spacing_in_new_basis_z,
     grid_positions_in_original_basis,
     ndim,
+    band_height=8,
 ):
+    """
+    Evaluate the values of the cells at the positions of the pixels of a grid. A
+    pixel takes the value of the cell it is in, or ``NaN`` if it is not in any
+    cell (the ``cell_sizes`` are the half sizes of the cells).
+
+    The result does not depend on the number of threads: the cells are painted from
+    the coarsest to the finest, so that where cells overlap, the finest cell wins
+    (and the last one, among cells of the same size). The grid is split into bands
+    of ``band_height`` rows, which are painted in parallel.
+    """
     nz, ny, nx = grid_positions_in_original_basis.shape[:3]
-    diagonal = np.sqrt(ndim)
+    footprints = _footprints(
+        cell_positions_in_new_basis_x,
+        cell_positions_in_new_basis_y,
+        cell_positions_in_new_basis_z,
+        cell_sizes,
+        grid_lower_edge_in_new_basis_x,
+        grid_lower_edge_in_new_basis_y,
+        grid_lower_edge_in_new_basis_z,
+        grid_spacing_in_new_basis_x,
+        grid_spacing_in_new_basis_y,
+        grid_spacing_in_new_basis_z,
+        nx,
+        ny,
+        nz,
+        np.sqrt(ndim),
+    )
+    centers = np.ascontiguousarray(
+        np.stack(
+            [
+                pos
+                for pos in (
+                    cell_positions_in_original_basis_x,
+                    cell_positions_in_original_basis_y,
+                    cell_positions_in_original_basis_z,
+                )
+                if pos is not None
+            ],
+            axis=1,
+        ),
+        dtype=np.float64,
+    )
+    order = np.argsort(-cell_sizes, kind="stable")
+    offsets, cells = _bands(
+        footprints, order, band_height, nbands=-(-ny // band_height)
+    )
     out = np.full(
         shape=(cell_values.shape[0], nz, ny, nx), fill_value=np.nan, dtype=np.float64
     )
+    _paint(
+        out,
+        grid_positions_in_original_basis,
+        centers,
+        cell_sizes,
+        cell_values,
+        footprints,
+        offsets,
+        cells,
+        band_height,
+    )
+    return out
 
-    ncells = len(cell_positions_in_new_basis_x)
-    for n in prange(ncells):
-        half_size = cell_sizes[n] * diagonal
-        ix1 = max(
-            int(
-                (
-                    (cell_positions_in_new_basis_x[n] - half_size)
-                    - grid_lower_edge_in_new_basis_x
-                )
-                / grid_spacing_in_new_basis_x
-            ),
-            0,
-        )
-        ix2 = min(
-            int(
-                (
-                    (cell_positions_in_new_basis_x[n] + half_size)
-                    - grid_lower_edge_in_new_basis_x
-                )
-                / grid_spacing_in_new_basis_x
-            )
-            + 1,
-            nx,
-        )
-        iy1 = max(
-            int(
-                (
-                    (cell_positions_in_new_basis_y[n] - half_size)
-                    - grid_lower_edge_in_new_basis_y
-                )
-                / grid_spacing_in_new_basis_y
-            ),
-            0,
-        )
-        iy2 = min(
-            int(
-                (
-                    (cell_positions_in_new_basis_y[n] + half_size)
-                    - grid_lower_edge_in_new_basis_y
-                )
-                / grid_spacing_in_new_basis_y
-            )
-            + 1,
-            ny,
-        )
-        iz1 = max(
-            int(
-                (
-                    (cell_positions_in_new_basis_z[n] - half_size)
-                    - grid_lower_edge_in_new_basis_z
-                )
-                / grid_spacing_in_new_basis_z
-            ),
-            0,
-        )
-        iz2 = min(
-            int(
-                (
-                    (cell_positions_in_new_basis_z[n] + half_size)
-                    - grid_lower_edge_in_new_basis_z
-                )
-                / grid_spacing_in_new_basis_z
-            )
-            + 1,
-            nz,
-        )
 
-        for k in range(iz1, iz2):
-            for j in range(iy1, iy2):
-                for i in range(ix1, ix2):
-                    ok_x = (
-                        np.abs(
-                            grid_positions_in_original_basis[k, j, i, 0]
-                            - cell_positions_in_original_basis_x[n]
-                        )
-                        <= cell_sizes[n]
-                    )
-                    ok_y = True
-                    if cell_positions_in_original_basis_y is not None:
-                        ok_y = (
-                            np.abs(
-                                grid_positions_in_original_basis[k, j, i, 1]
-                                - cell_positions_in_original_basis_y[n]
-                            )
-                            <= cell_sizes[n]
-                        )
-                    ok_z = True
-                    if cell_positions_in_original_basis_z is not None:
-                        ok_z = (
-                            np.abs(
-                                grid_positions_in_original_basis[k, j, i, 2]
-                                - cell_positions_in_original_basis_z[n]
-                            )
-                            <= cell_sizes[n]
-                        )
-
-                    if ok_x and ok_y and ok_z:
-                        out[:, k, j, i] = cell_values[:, n]
+# The operations of the projections along the line of sight
+PROJECTIONS = {
+    "sum": 0,
+    "nansum": 0,
+    "mean": 1,
+    "nanmean": 1,
+    "min": 2,
+    "nanmin": 2,
+    "max": 3,
+    "nanmax": 3,
+}
+
+
+@njit(parallel=True)
+def _project(
+    out,
+    weight_sums,
+    centers,
+    sizes,
+    values,
+    weights,
+    footprints,
+    offsets,
+    cells,
+    band_height,
+    xcenters,
+    ycenters,
+    u,
+    v,
+    n,
+    zmin,
+    zmax,
+    mode,
+    skip_nan,
+    nudge,
+):
+    """
+    Deposit the cells onto the image. For each pixel, the path length of the line
+    of sight through each cell is computed in the original basis, with the slab
+    method, and clipped to ``[zmin, zmax]``. The bands of rows are projected in
+    parallel, each by a single thread, with the cells in the order of the lists of
+    the bands. A line of sight which is parallel to a face of a cell crosses the
+    cell if it is inside the face or on its lower edge, after being moved up by
+    ``nudge``. If ``skip_nan``, the cells with a ``NaN`` value (or weight, for the
+    mean) are left out of the pixels they cover, otherwise they make them ``NaN``.
+    """
+    ny, nx = out.shape[1:]
+    ncomp = centers.shape[1]
+    nvalues = values.shape[0]
+    for b in prange(len(offsets) - 1):
+        jstart = b * band_height
+        jend = min(jstart + band_height, ny)
+        for c in range(offsets[b], offsets[b + 1]):
+            cell = cells[c]
+            i1, i2, j1, j2 = footprints[cell, :4]
+            for j in range(max(j1, jstart), min(j2, jend)):
+                for i in range(i1, i2):
+                    t_enter = zmin
+                    t_exit = zmax
+                    for a in range(ncomp):
+                        start = xcenters[i] * u[a] + ycenters[j] * v[a]
+                        if n[a] == 0:
+                            # The line of sight is parallel to the faces: a line on
+                            # a face belongs to the cell on its upper side only. The
+                            # line is nudged upwards, so that a line which is on a
+                            # face up to rounding errors is in the same cell for
+                            # both the cells sharing the face
+                            d = start + nudge - centers[cell, a]
+                            if not (-sizes[cell] <= d < sizes[cell]):
+                                t_exit = t_enter
+                        else:
+                            t1 = (centers[cell, a] - sizes[cell] - start) / n[a]
+                            t2 = (centers[cell, a] + sizes[cell] - start) / n[a]
+                            t_enter = max(t_enter, min(t1, t2))
+                            t_exit = min(t_exit, max(t1, t2))
+                    length = t_exit - t_enter
+                    if not length > 0:
+                        continue
+                    for k in range(nvalues):
+                        value = values[k, cell]
+                        weight = weights[k, cell] if mode == 1 else 1.0
+                        if skip_nan and (np.isnan(value) or np.isnan(weight)):
+                            continue
+                        if mode == 0:
+                            out[k, j, i] += value * length
+                        elif mode == 1:
+                            out[k, j, i] += value * weight * length
+                        elif mode == 2:
+                            # A NaN value, once deposited, is kept
+                            if np.isnan(value) or value < out[k, j, i]:
+                                out[k, j, i] = value
+                        else:
+                            if np.isnan(value) or value > out[k, j, i]:
+                                out[k, j, i] = value
+                        weight_sums[k, j, i] += weight * length
+
+
+def project_on_grid(
+    cell_positions_in_new_basis_x,
+    cell_positions_in_new_basis_y,
+    cell_positions_in_new_basis_z,
+    cell_positions_in_original_basis,
+    cell_values,
+    cell_weights,
+    cell_sizes,
+    grid_centers_in_new_basis_x,
+    grid_centers_in_new_basis_y,
+    grid_spacing_in_new_basis_x,
+    grid_spacing_in_new_basis_y,
+    zmin,
+    zmax,
+    basis,
+    operation,
+    ndim,
+    band_height=8,
+):
+    """
+    Project the values of the cells along the line of sight, between ``zmin`` and
+    ``zmax``, onto a grid of pixels. Each cell is deposited directly onto the
+    pixels it covers, with the exact length of the line of sight through the cell,
+    so that no 3D grid is needed.
+
+    The operation is one of:
+
+    - ``"sum"``: the integral of the values along the line of sight
+    - ``"mean"``: the mean of the values along the line of sight, weighted by
+      ``cell_weights``
+    - ``"min"`` and ``"max"``: the minimum and maximum of the values of the cells
+      crossed by the line of sight
 
+    As with numpy, a cell whose value is ``NaN`` (e.g. a masked value) makes the
+    pixels it covers ``NaN``, while the ``nan`` versions of the operations (e.g.
+    ``"nansum"``) skip it. Pixels whose line of sight does not cross any cell (with
+    a value which is not skipped) are ``NaN``. The result does not depend on the
+    number of threads.
+
+    :param cell_positions_in_original_basis: The positions of the cells relative to
+        the center of the map, with shape ``(ncells, ndim)``.
+
+    :param cell_sizes: The half sizes of the cells.
+
+    :param basis: The unit vectors ``u``, ``v`` and ``n`` of the map, in the
+        original basis, with shape ``(3, 3)``.
+    """
+    if operation not in PROJECTIONS:
+        raise ValueError(
+            "Unknown operation '{}' for a thick map. Available operations are: "
+            "{}.".format(operation, ", ".join(PROJECTIONS))
+        )
+    mode = PROJECTIONS[operation]
+    nx = len(grid_centers_in_new_basis_x)
+    ny = len(grid_centers_in_new_basis_y)
+    footprints = _footprints(
+        cell_positions_in_new_basis_x,
+        cell_positions_in_new_basis_y,
+        cell_positions_in_new_basis_z,
+        cell_sizes,
+        grid_centers_in_new_basis_x[0] - 0.5 * grid_spacing_in_new_basis_x,
+        grid_centers_in_new_basis_y[0] - 0.5 * grid_spacing_in_new_basis_y,
+        zmin,
+        grid_spacing_in_new_basis_x,
+        grid_spacing_in_new_basis_y,
+        zmax - zmin,
+        nx,
+        ny,
+        1,
+        np.sqrt(ndim),
+    )
+    offsets, cells = _bands(
+        footprints,
+        np.arange(len(cell_sizes)),
+        band_height,
+        nbands=-(-ny // band_height),
+    )
+    nvalues = cell_values.shape[0]
+    fill = {2: np.inf, 3: -np.inf}.get(mode, 0.0)
+    out = np.full((nvalues, ny, nx), fill, dtype=np.float64)
+    weight_sums = np.zeros((nvalues, ny, nx), dtype=np.float64)
+    basis = np.asarray(basis, dtype=np.float64)
+    _project(
+        out,
+        weight_sums,
+        np.ascontiguousarray(cell_positions_in_original_basis, dtype=np.float64),
+        cell_sizes,
+        cell_values,
+        cell_weights,
+        footprints,
+        offsets,
+        cells,
+        band_height,
+        grid_centers_in_new_basis_x,
+        grid_centers_in_new_basis_y,
+        basis[0],
+        basis[1],
+        basis[2],
+        zmin,
+        zmax,
+        mode,
+        operation.startswith("nan"),
+        1.0e-6 * min(grid_spacing_in_new_basis_x, grid_spacing_in_new_basis_y),
+    )
+    if mode == 1:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out /= weight_sums
+    out[weight_sums == 0] = np.nan
     return out
 
 
@@ -1,12 +1,23 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
 
+from .index import SpatialIndex, spatial_index
+from .kdtree import KDTree, kdtree
+from .region import Box, Cylinder, Slab, Sphere
 from .subdomain import extract_box, extract_sphere
 
 __all__ = [
+    "Box",
+    "Cylinder",
+    "KDTree",
+    "Slab",
+    "SpatialIndex",
+    "Sphere",
     "angular_momentum_vector",
     "extract_box",
     "extract_sphere",
+    "kdtree",
     "side_view",
+    "spatial_index",
     "top_view",
 ]
@@ -0,0 +1,185 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+import numpy as np
+
+from .region import _frozen
+
+
+def _ranges(starts, ends):
+    """
+    Return the concatenation of ``np.arange(start, end)`` for all the ranges.
+    """
+    counts = ends - starts
+    total = int(np.sum(counts))
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return np.arange(total, dtype=np.int64) + offsets
+
+
+class _SizeClass:
+    """
+    The positions of one size of cells (or of the particles), sorted into a uniform
+    grid of buckets.
+    """
+
+    def __init__(self, indices, position, size, bucket_size):
+        self.indices = indices
+        ndim = position.shape[1]
+        self.smax = float(np.max(size)) if len(size) > 0 else 0.0
+        self.lower = position.min(axis=0)
+        extent = float(np.max(position.max(axis=0) - self.lower))
+        # Buckets of a few cells per dimension, with enough of them to hold about
+        # ``bucket_size`` positions each, but not so many that the keys overflow
+        width = max(
+            self.smax * bucket_size ** (1.0 / ndim),
+            extent / max(len(indices) / bucket_size, 1.0) ** (1.0 / ndim),
+            extent / 2**20,
+        )
+        self.width = width if width > 0 else 1.0
+        coords = np.floor((position - self.lower) / self.width).astype(np.int64)
+        self.shape = coords.max(axis=0) + 1
+        keys = np.ravel_multi_index(coords.T, self.shape)
+        order = np.argsort(keys, kind="stable")
+        self.indices = self.indices[order]
+        self.position = position[order]
+        self.sizes = size[order]
+        self.keys, self.starts = np.unique(keys[order], return_index=True)
+        self.ends = np.append(self.starts[1:], len(order))
+        self.coords = np.stack(np.unravel_index(self.keys, self.shape), axis=1)
+
+    def candidates(self, region, length, pad):
+        """
+        Return the buckets which may hold positions inside the region.
+        """
+        lower, upper = region.bounds(length, pad=pad)
+        ndim = len(self.shape)
+        lower = np.floor((lower[:ndim] - self.lower) / self.width)
+        upper = np.floor((upper[:ndim] - self.lower) / self.width)
+        if np.any(upper < 0) or np.any(lower >= self.shape):
+            return np.empty(0, dtype=np.int64)
+        lower = np.clip(lower, 0, self.shape - 1).astype(np.int64)
+        upper = np.clip(upper, 0, self.shape - 1).astype(np.int64)
+        if np.prod(upper - lower + 1, dtype=np.float64) <= len(self.keys):
+            # Few buckets in the bounding box of the region: look up their keys
+            grid = np.meshgrid(
+                *[np.arange(lo, hi + 1) for lo, hi in zip(lower, upper)],
+                indexing="ij",
+            )
+            keys = np.ravel_multi_index([g.ravel() for g in grid], self.shape)
+            pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            buckets = pos[self.keys[pos] == keys]
+        else:
+            inside = np.all((self.coords >= lower) & (self.coords <= upper), axis=1)
+            buckets = np.nonzero(inside)[0]
+        corner = self.lower + self.coords[buckets] * self.width
+        hit = region.intersects(corner, corner + self.width, length=length, pad=pad)
+        return buckets[hit]
+
+
+class SpatialIndex:
+    """
+    An index of the positions of the cells or particles of a ``Datagroup``, to find
+    those inside a region without testing all of them.
+
+    The positions are split by cell size (i.e. by AMR level), and the positions of
+    each size are sorted into a uniform grid of buckets, a few cells wide. A query
+    only tests the positions in the buckets which intersect the region, so that its
+    cost grows with the number of positions it returns, rather than with the size of
+    the group.
+
+    It is usually obtained with :func:`spatial_index`, which caches it on the
+    position vector of the group.
+
+    :param position: The ``Vector`` of the positions.
+
+    :param dx: The ``Array`` of the sizes of the cells. Default is ``None``, for
+        particles.
+
+    :param bucket_size: The average number of positions in each bucket. Default is
+        16.
+    """
+
+    def __init__(self, position, dx=None, bucket_size=16):
+        self.unit = position.unit
+        self.length = 1.0 * self.unit
+        self.ndim = position.nvec
+        self.npos = len(position)
+        xyz = np.stack([c.values for c in position._xyz.values()], axis=1).astype(
+            np.float64, copy=False
+        )
+        if dx is None:
+            size = np.zeros(self.npos)
+            exponents = np.zeros(self.npos, dtype=np.int64)
+        else:
+            size = dx.to(self.unit).values.astype(np.float64, copy=False)
+            exponents = np.frexp(size)[1]
+        order = np.argsort(exponents, kind="stable")
+        bounds = np.flatnonzero(np.diff(exponents[order])) + 1
+        self.classes = [
+            _SizeClass(
+                indices=ind,
+                position=xyz[ind],
+                size=size[ind],
+                bucket_size=bucket_size,
+            )
+            for ind in np.split(order, bounds)
+            if len(ind) > 0
+        ]
+
+    def __len__(self):
+        return self.npos
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        return "SpatialIndex: {} positions, {} sizes, {} buckets".format(
+            self.npos, len(self.classes), sum(len(c.keys) for c in self.classes)
+        )
+
+    def query(self, region, pad=0.0):
+        """
+        Return the sorted indices of the positions inside a region.
+
+        :param region: The region, e.g. a ``Sphere``, ``Box``, ``Cylinder`` or
+            ``Slab``.
+
+        :param pad: Enlarge the region around each position by ``pad`` times the
+            size of its cell, e.g. ``0.5 * sqrt(3)`` to include the cells which
+            overlap the region. Default is 0.
+        """
+        region = _frozen(region, self.length)
+        found = []
+        for cls in self.classes:
+            buckets = cls.candidates(region, self.length, pad=pad * cls.smax)
+            rows = _ranges(cls.starts[buckets], cls.ends[buckets])
+            inside = region.contains(
+                cls.position[rows], self.length, pad=pad * cls.sizes[rows]
+            )
+            found.append(cls.indices[rows[inside]])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(found))
+
+
+def spatial_index(group):
+    """
+    Return the ``SpatialIndex`` of the positions of a ``Datagroup`` (or of a plot
+    ``Layer``), using the ``dx`` of the cells if there is one.
+
+    The index is built on the first call and stored with the ``position`` vector, so
+    that the next calls on the same group return it directly. It is rebuilt if the
+    ``position`` or ``dx`` of the group is replaced, e.g. after sorting the group.
+    Modifying the values of the components of the positions in place is not
+    detected.
+    """
+    position = group["position"]
+    dx = group["dx"] if "dx" in group.keys() else None
+    cached = getattr(position, "_spatial_index", None)
+    if cached is not None and cached[0] is dx and len(cached[1]) == len(position):
+        return cached[1]
+    index = SpatialIndex(position, dx=dx)
+    position._spatial_index = (dx, index)
+    return index
@@ -0,0 +1,404 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+import numpy as np
+from numba import njit, prange
+
+from ..core import Array
+from .region import _to_length
+
+# Large enough for the depth of a tree with 2**64 points
+_STACK_SIZE = 128
+
+
+@njit(cache=True)
+def _select(idx, points, dim, start, end, kth):
+    """
+    Reorder ``idx[start:end]`` so that the point at ``kth`` has the median
+    coordinate along ``dim``, with smaller coordinates before it and larger ones
+    after it (Hoare's selection algorithm).
+    """
+    left = start
+    right = end - 1
+    while right > left:
+        pivot = points[idx[(left + right) // 2], dim]
+        i = left
+        j = right
+        while i <= j:
+            while points[idx[i], dim] < pivot:
+                i += 1
+            while points[idx[j], dim] > pivot:
+                j -= 1
+            if i <= j:
+                idx[i], idx[j] = idx[j], idx[i]
+                i += 1
+                j -= 1
+        if kth <= j:
+            right = j
+        elif kth >= i:
+            left = i
+        else:
+            break
+
+
+@njit(cache=True)
+def _build(points, leafsize):
+    """
+    Build the nodes of the tree. Each node holds the range ``start:end`` of the
+    points in ``idx`` below it, and their bounding box. Nodes with more than
+    ``leafsize`` points are split in two at the median of their widest dimension.
+    """
+    npoints, ndim = points.shape
+    idx = np.arange(npoints)
+    maxnodes = 2 * (npoints // max((leafsize + 1) // 2, 1)) + 1
+    start = np.empty(maxnodes, dtype=np.int64)
+    end = np.empty(maxnodes, dtype=np.int64)
+    children = np.full((maxnodes, 2), -1, dtype=np.int64)
+    lower = np.empty((maxnodes, ndim))
+    upper = np.empty((maxnodes, ndim))
+
+    nnodes = 1
+    start[0] = 0
+    end[0] = npoints
+    stack = np.empty(_STACK_SIZE, dtype=np.int64)
+    stack[0] = 0
+    sp = 1
+    while sp > 0:
+        sp -= 1
+        node = stack[sp]
+        for n in range(ndim):
+            lower[node, n] = np.inf
+            upper[node, n] = -np.inf
+        for i in range(start[node], end[node]):
+            for n in range(ndim):
+                x = points[idx[i], n]
+                lower[node, n] = min(lower[node, n], x)
+                upper[node, n] = max(upper[node, n], x)
+        if end[node] - start[node] <= leafsize:
+            continue
+        dim = 0
+        for n in range(1, ndim):
+            if upper[node, n] - lower[node, n] > upper[node, dim] - lower[node, dim]:
+                dim = n
+        middle = (start[node] + end[node]) // 2
+        _select(idx, points, dim, start[node], end[node], middle)
+        for side in range(2):
+            child = nnodes
+            nnodes += 1
+            start[child] = start[node] if side == 0 else middle
+            end[child] = middle if side == 0 else end[node]
+            children[node, side] = child
+            stack[sp] = child
+            sp += 1
+    return (
+        idx,
+        start[:nnodes].copy(),
+        end[:nnodes].copy(),
+        children[:nnodes].copy(),
+        lower[:nnodes].copy(),
+        upper[:nnodes].copy(),
+    )
+
+
+@njit(cache=True)
+def _box_distance2(lower, upper, center, boxsize):
+    """
+    Return the squared distance from a point to a box, using the nearest periodic
+    image along the dimensions where ``boxsize`` is positive.
+    """
+    d2 = 0.0
+    for n in range(len(center)):
+        c = center[n]
+        if c < lower[n]:
+            d = lower[n] - c
+            if boxsize[n] > 0:
+                d = min(d, c + boxsize[n] - upper[n])
+        elif c > upper[n]:
+            d = c - upper[n]
+            if boxsize[n] > 0:
+                d = min(d, lower[n] + boxsize[n] - c)
+        else:
+            d = 0.0
+        d2 += d * d
+    return d2
+
+
+@njit(cache=True)
+def _point_distance2(point, center, boxsize):
+    d2 = 0.0
+    for n in range(len(center)):
+        d = abs(point[n] - center[n])
+        if boxsize[n] > 0 and d > 0.5 * boxsize[n]:
+            d = boxsize[n] - d
+        d2 += d * d
+    return d2
+
+
+@njit(parallel=True, cache=True)
+def _query_knn(points, idx, start, end, children, lower, upper, centers, k, boxsize):
+    ncenters = len(centers)
+    distance2 = np.full((ncenters, k), np.inf)
+    found = np.full((ncenters, k), len(points), dtype=np.int64)
+    for q in prange(ncenters):
+        center = centers[q]
+        best_d2 = distance2[q]
+        best = found[q]
+        stack = np.empty(_STACK_SIZE, dtype=np.int64)
+        stack[0] = 0
+        sp = 1
+        while sp > 0:
+            sp -= 1
+            node = stack[sp]
+            if _box_distance2(lower[node], upper[node], center, boxsize) > best_d2[-1]:
+                continue
+            if children[node, 0] < 0:
+                for i in range(start[node], end[node]):
+                    d2 = _point_distance2(points[idx[i]], center, boxsize)
+                    if d2 < best_d2[-1]:
+                        # Insert into the sorted list of the k nearest points
+                        j = k - 1
+                        while j > 0 and best_d2[j - 1] > d2:
+                            best_d2[j] = best_d2[j - 1]
+                            best[j] = best[j - 1]
+                            j -= 1
+                        best_d2[j] = d2
+                        best[j] = idx[i]
+                continue
+            near, far = children[node, 0], children[node, 1]
+            if _box_distance2(lower[far], upper[far], center, boxsize) < _box_distance2(
+                lower[near], upper[near], center, boxsize
+            ):
+                near, far = far, near
+            # Visit the nearest child first
+            stack[sp] = far
+            stack[sp + 1] = near
+            sp += 2
+    return distance2, found
+
+
+@njit(cache=True)
+def _ball(points, idx, start, end, children, lower, upper, center, r2, boxsize, out):
+    """
+    Find the points within a squared distance ``r2`` of a center. They are written
+    to ``out`` if it is not empty. Return the number of points.
+    """
+    count = 0
+    stack = np.empty(_STACK_SIZE, dtype=np.int64)
+    stack[0] = 0
+    sp = 1
+    while sp > 0:
+        sp -= 1
+        node = stack[sp]
+        if _box_distance2(lower[node], upper[node], center, boxsize) > r2:
+            continue
+        if children[node, 0] < 0:
+            for i in range(start[node], end[node]):
+                if _point_distance2(points[idx[i]], center, boxsize) <= r2:
+                    if len(out) > 0:
+                        out[count] = idx[i]
+                    count += 1
+            continue
+        stack[sp] = children[node, 0]
+        stack[sp + 1] = children[node, 1]
+        sp += 2
+    return count
+
+
+@njit(parallel=True, cache=True)
+def _query_ball(points, idx, start, end, children, lower, upper, centers, r2, boxsize):
+    ncenters = len(centers)
+    empty = np.empty(0, dtype=np.int64)
+    counts = np.zeros(ncenters, dtype=np.int64)
+    for q in prange(ncenters):
+        counts[q] = _ball(
+            points,
+            idx,
+            start,
+            end,
+            children,
+            lower,
+            upper,
+            centers[q],
+            r2[q],
+            boxsize,
+            empty,
+        )
+    offsets = np.zeros(ncenters + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    found = np.empty(offsets[-1], dtype=np.int64)
+    for q in prange(ncenters):
+        out = found[offsets[q] : offsets[q + 1]]
+        _ball(
+            points,
+            idx,
+            start,
+            end,
+            children,
+            lower,
+            upper,
+            centers[q],
+            r2[q],
+            boxsize,
+            out,
+        )
+        out[:] = np.sort(out)
+    return found, offsets
+
+
+def _to_points(vector, unit):
+    """
+    Convert a Vector of positions to an array of shape ``(N, ndim)`` in ``unit``.
+    """
+    points = np.stack(
+        [np.atleast_1d(xyz.to(unit).values) for xyz in vector._xyz.values()], axis=1
+    )
+    return np.ascontiguousarray(points, dtype=np.float64)
+
+
+class KDTree:
+    """
+    A KD-tree of the positions of the cells or particles of a ``Datagroup``, to find
+    the nearest neighbours of a set of centers, or the points within a given
+    distance of them. The queries from many centers are run in parallel.
+
+    It is usually obtained with :func:`kdtree`, which caches it on the position
+    vector of the group.
+
+    :param position: The ``Vector`` of the positions.
+
+    :param boxsize: The size of the periodic box, as a length or a ``Vector`` of
+        lengths (one for each dimension). The distances are computed using the nearest
+        periodic image of the points. Default is ``None`` (no periodicity).
+
+    :param leafsize: The maximum number of points in the leaves of the tree.
+        Default is 16.
+    """
+
+    def __init__(self, position, boxsize=None, leafsize=16):
+        self.unit = position.unit
+        self.length = 1.0 * self.unit
+        self.ndim = position.nvec
+        points = _to_points(position, self.unit)
+        self.boxsize = np.zeros(self.ndim)
+        if boxsize is not None:
+            self.boxsize[:] = _to_length(boxsize, self.length)
+            periodic = self.boxsize > 0
+            points[:, periodic] = np.mod(points[:, periodic], self.boxsize[periodic])
+        self.points = points
+        (
+            self.idx,
+            self.start,
+            self.end,
+            self.children,
+            self.lower,
+            self.upper,
+        ) = _build(points, leafsize)
+
+    def __len__(self):
+        return len(self.points)
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        return "KDTree: {} points, {} nodes{}".format(
+            len(self),
+            len(self.start),
+            ", periodic" if np.any(self.boxsize > 0) else "",
+        )
+
+    def _centers(self, centers):
+        points = _to_points(centers, self.unit)
+        periodic = self.boxsize > 0
+        points[:, periodic] = np.mod(points[:, periodic], self.boxsize[periodic])
+        return points
+
+    def _nodes(self):
+        return (
+            self.points,
+            self.idx,
+            self.start,
+            self.end,
+            self.children,
+            self.lower,
+            self.upper,
+        )
+
+    def query(self, centers, k=1):
+        """
+        Find the ``k`` nearest neighbours of each center.
+
+        :param centers: A ``Vector`` of one or more positions.
+
+        :param k: The number of neighbours. Default is 1.
+
+        Return the distances to the neighbours (an ``Array``) and their indices, in
+        order of increasing distance, with shape ``(ncenters, k)``, or
+        ``(ncenters,)`` if ``k`` is 1. The first dimension is dropped if
+        ``centers`` is a single position. Missing neighbours (if ``k`` is larger
+        than the number of points) have an infinite distance and an index equal to
+        the number of points.
+        """
+        distance2, found = _query_knn(
+            *self._nodes(), self._centers(centers), int(k), self.boxsize
+        )
+        distance = np.sqrt(distance2)
+        if k == 1:
+            distance, found = distance[:, 0], found[:, 0]
+        if centers.shape == ():
+            distance, found = distance[0], found[0]
+        return Array(values=distance, unit=self.unit), found
+
+    def query_ball(self, centers, radius):
+        """
+        Find the points within a distance ``radius`` of each center.
+
+        :param centers: A ``Vector`` of one or more positions.
+
+        :param radius: The radius of the ball around each center, as a length or an
+            ``Array`` of one length for each center.
+
+        Return the sorted indices of the points in the ball of each center, as a list
+        of arrays, or as one array if ``centers`` is a single position.
+        """
+        points = self._centers(centers)
+        r = np.broadcast_to(
+            np.asarray(_to_length(radius, self.length), dtype=np.float64),
+            (len(points),),
+        )
+        found, offsets = _query_ball(*self._nodes(), points, r * r, self.boxsize)
+        balls = np.split(found, offsets[1:-1])
+        if centers.shape == ():
+            return balls[0]
+        return balls
+
+
+def kdtree(group, periodic=False):
+    """
+    Return the ``KDTree`` of the positions of a ``Datagroup``.
+
+    The tree is built on the first call and stored with the ``position`` vector, so
+    that the next calls on the same group return it directly. It is rebuilt if the
+    ``position`` of the group is replaced.
+
+    :param group: The ``Datagroup``, e.g. ``data["part"]`` or ``data["sink"]``.
+
+    :param periodic: Use the periodic images of the points, in a box of size
+        ``meta["boxlen"]`` of the dataset of the group. Default is ``False``.
+    """
+    position = group["position"]
+    cached = getattr(position, "_kdtree", None)
+    if cached is not None and cached[0] == periodic:
+        return cached[1]
+    boxsize = None
+    if periodic:
+        dataset = getattr(group, "parent", None)
+        if dataset is None or dataset.units is None or "boxlen" not in dataset.meta:
+            raise ValueError(
+                "The size of the periodic box is only known for the groups of a "
+                "dataset loaded from a RAMSES output. Use KDTree with boxsize instead."
+            )
+        boxsize = dataset.meta["boxlen"] * dataset.units["x"]
+    tree = KDTree(position, boxsize=boxsize)
+    position._kdtree = (periodic, tree)
+    return tree
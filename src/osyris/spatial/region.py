@@ -0,0 +1,306 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+
+import copy
+
+import numpy as np
+from pint import Quantity
+
+from ..core import Array, Vector
+
+
+def _to_length(value, length):
+    """
+    Convert a length (Array, Vector or Quantity) to a float or an array of floats, in
+    units of ``length``.
+    """
+    if isinstance(value, Vector):
+        return np.array([_to_length(xyz, length) for xyz in value._xyz.values()])
+    if isinstance(value, Array):
+        value = value.values * value.unit
+    if not isinstance(value, Quantity):
+        raise TypeError("The dimensions of the region must be given with units.")
+    return (value / length).to("dimensionless").magnitude
+
+
+def _to_direction(value):
+    """
+    Convert a direction (a Vector or a list of numbers) to a unit vector.
+    """
+    if isinstance(value, Vector):
+        value = [xyz.values for xyz in value._xyz.values()]
+    direction = np.asarray(value, dtype=np.float64).ravel()
+    norm = np.linalg.norm(direction)
+    return direction if norm == 1.0 else direction / norm
+
+
+def _frozen(region, length):
+    """
+    Return a copy of a region whose dimensions are converted to units of ``length``
+    only once, to be queried many times with the same ``length``.
+    """
+    scaled = region._scaled(length)
+    frozen = copy.copy(region)
+    frozen._scaled = lambda _: scaled
+    return frozen
+
+
+def _pad(pad, ndim):
+    # Padding given per position or per box, as a column to broadcast over dimensions
+    pad = np.asarray(pad, dtype=np.float64)
+    return pad[:, None] if pad.ndim == 1 else pad
+
+
+class Sphere:
+    """
+    A spherical region of radius ``radius`` around an origin point, which can be used
+    to load only the cells and particles inside the sphere.
+
+    :param radius: The radius of the sphere.
+
+    :param origin: The position of the center of the sphere.
+    """
+
+    def __init__(self, radius, origin):
+        self.radius = radius
+        self.origin = origin
+
+    def _scaled(self, length):
+        return _to_length(self.origin, length), _to_length(self.radius, length)
+
+    def bounds(self, length, pad=0.0):
+        """
+        Return the lower and upper corners of the bounding box of the region, in
+        units of ``length``. The region can be enlarged by ``pad`` (in units of
+        ``length``) in all directions.
+        """
+        center, radius = self._scaled(length)
+        return center - radius - pad, center + radius + pad
+
+    def contains(self, position, length, pad=0.0):
+        """
+        Return a mask which is ``True`` for the positions (an array of shape
+        ``(N, ndim)`` in units of ``length``) that are inside the region. The region
+        can be enlarged by ``pad``, a distance or an array of ``N`` distances.
+        """
+        center, radius = self._scaled(length)
+        ndim = position.shape[1]
+        return np.sum((position - center[:ndim]) ** 2, axis=1) < (radius + pad) ** 2
+
+    def intersects(self, lower, upper, length, pad=0.0):
+        """
+        Return a mask which is ``True`` for the boxes (given by their lower and upper
+        corners, arrays of shape ``(N, ndim)`` in units of ``length``) that
+        intersect the region. The region can be enlarged by ``pad``.
+        """
+        center, radius = self._scaled(length)
+        ndim = lower.shape[1]
+        distance = np.clip(center[:ndim], lower, upper) - center[:ndim]
+        return np.sum(distance**2, axis=1) < (radius + pad) ** 2
+
+
+class Box:
+    """
+    A rectangular region of size ``dx``, ``dy`` and ``dz`` around an origin point,
+    which can be used to load only the cells and particles inside the box.
+
+    :param dx: The size of the box along x.
+
+    :param dy: The size of the box along y. Default is ``None``, in which case it is
+        equal to ``dx``.
+
+    :param dz: The size of the box along z. Default is ``None``, in which case it is
+        equal to ``dx``.
+
+    :param origin: The position of the center of the box.
+    """
+
+    def __init__(self, dx, dy=None, dz=None, origin=None):
+        if origin is None:
+            raise ValueError("The origin of the box must be specified.")
+        self.dx = dx
+        self.dy = dx if dy is None else dy
+        self.dz = dx if dz is None else dz
+        self.origin = origin
+
+    def _scaled(self, length):
+        center = _to_length(self.origin, length)
+        size = np.array([_to_length(d, length) for d in (self.dx, self.dy, self.dz)])
+        return center, 0.5 * size[: len(center)]
+
+    def bounds(self, length, pad=0.0):
+        """
+        Return the lower and upper corners of the region, in units of ``length``.
+        The region can be enlarged by ``pad`` (in units of ``length``) in all
+        directions.
+        """
+        center, half = self._scaled(length)
+        return center - half - pad, center + half + pad
+
+    def contains(self, position, length, pad=0.0):
+        """
+        Return a mask which is ``True`` for the positions (an array of shape
+        ``(N, ndim)`` in units of ``length``) that are inside the region. The region
+        can be enlarged by ``pad``, a distance or an array of ``N`` distances.
+        """
+        lower, upper = self.bounds(length)
+        ndim = position.shape[1]
+        pad = _pad(pad, ndim)
+        return np.all(
+            (position >= lower[:ndim] - pad) & (position <= upper[:ndim] + pad), axis=1
+        )
+
+    def intersects(self, lower, upper, length, pad=0.0):
+        """
+        Return a mask which is ``True`` for the boxes (given by their lower and upper
+        corners, arrays of shape ``(N, ndim)`` in units of ``length``) that
+        intersect the region. The region can be enlarged by ``pad``.
+        """
+        start, end = self.bounds(length, pad=pad)
+        ndim = lower.shape[1]
+        return np.all((upper >= start[:ndim]) & (lower <= end[:ndim]), axis=1)
+
+
+class Cylinder:
+    """
+    A cylindrical region of radius ``radius`` and height ``height`` around an
+    origin point, with its axis along ``direction``. It can be used to load only the
+    cells and particles inside the cylinder, e.g. to select a disk.
+
+    :param radius: The radius of the cylinder.
+
+    :param height: The height of the cylinder, along its axis.
+
+    :param origin: The position of the center of the cylinder.
+
+    :param direction: The direction of the axis of the cylinder, as a ``Vector`` or
+        a list of 3 numbers. Default is ``[0, 0, 1]``.
+    """
+
+    def __init__(self, radius, height, origin, direction=(0, 0, 1)):
+        self.radius = radius
+        self.height = height
+        self.origin = origin
+        self.direction = direction
+
+    def _scaled(self, length):
+        return (
+            _to_length(self.origin, length),
+            _to_length(self.radius, length),
+            0.5 * _to_length(self.height, length),
+            _to_direction(self.direction),
+        )
+
+    def _distances(self, position, center, axis):
+        # Distances of the positions to the center along the axis and to the axis
+        ndim = position.shape[1]
+        relative = position - center[:ndim]
+        along = relative @ axis[:ndim]
+        across = np.sqrt(
+            np.maximum(np.sum(relative**2, axis=1) - along**2, 0.0), dtype=np.float64
+        )
+        return np.abs(along), across
+
+    def bounds(self, length, pad=0.0):
+        """
+        Return the lower and upper corners of the bounding box of the region, in
+        units of ``length``. The region can be enlarged by ``pad`` (in units of
+        ``length``) in all directions.
+        """
+        center, radius, half, axis = self._scaled(length)
+        axis = axis[: len(center)]
+        extent = (radius + pad) * np.sqrt(np.maximum(1.0 - axis**2, 0.0)) + (
+            half + pad
+        ) * np.abs(axis)
+        return center - extent, center + extent
+
+    def contains(self, position, length, pad=0.0):
+        """
+        Return a mask which is ``True`` for the positions (an array of shape
+        ``(N, ndim)`` in units of ``length``) that are inside the region. The region
+        can be enlarged by ``pad``, a distance or an array of ``N`` distances.
+        """
+        center, radius, half, axis = self._scaled(length)
+        along, across = self._distances(position, center, axis)
+        return (along <= half + pad) & (across < radius + pad)
+
+    def intersects(self, lower, upper, length, pad=0.0):
+        """
+        Return a mask which is ``True`` for the boxes (given by their lower and upper
+        corners, arrays of shape ``(N, ndim)`` in units of ``length``) that may
+        intersect the region. The test is conservative: a few boxes which do not
+        intersect the region may be included.
+        """
+        center, radius, half, axis = self._scaled(length)
+        ndim = lower.shape[1]
+        size = 0.5 * (upper - lower)
+        along, across = self._distances(0.5 * (lower + upper), center, axis)
+        return (along <= half + pad + size @ np.abs(axis[:ndim])) & (
+            across < radius + pad + np.sqrt(np.sum(size**2, axis=1))
+        )
+
+
+class Slab:
+    """
+    The region between two parallel planes, at a distance of ``thickness / 2`` on
+    either side of an origin point, perpendicular to ``normal``.
+
+    :param thickness: The distance between the two planes.
+
+    :param origin: A position in the middle of the slab.
+
+    :param normal: The direction perpendicular to the planes, as a ``Vector`` or a
+        list of 3 numbers. Default is ``[0, 0, 1]``.
+    """
+
+    def __init__(self, thickness, origin, normal=(0, 0, 1)):
+        self.thickness = thickness
+        self.origin = origin
+        self.normal = normal
+
+    def _scaled(self, length):
+        return (
+            _to_length(self.origin, length),
+            0.5 * _to_length(self.thickness, length),
+            _to_direction(self.normal),
+        )
+
+    def _distance(self, position, center, normal):
+        # Same order of operations as Vector.dot
+        distance = np.zeros(len(position))
+        for n in range(position.shape[1]):
+            distance += (position[:, n] - center[n]) * normal[n]
+        return np.abs(distance)
+
+    def bounds(self, length, pad=0.0):
+        """
+        Return the lower and upper corners of the bounding box of the region, in
+        units of ``length``. The slab is infinite, apart from the direction of the
+        normal if it is along one of the axes.
+        """
+        center, half, normal = self._scaled(length)
+        normal = normal[: len(center)]
+        aligned = np.abs(normal) == 1.0
+        extent = np.where(aligned, half + pad, np.inf)
+        return center - extent, center + extent
+
+    def contains(self, position, length, pad=0.0):
+        """
+        Return a mask which is ``True`` for the positions (an array of shape
+        ``(N, ndim)`` in units of ``length``) that are inside the region. The region
+        can be enlarged by ``pad``, a distance or an array of ``N`` distances.
+        """
+        center, half, normal = self._scaled(length)
+        return self._distance(position, center, normal) <= half + pad
+
+    def intersects(self, lower, upper, length, pad=0.0):
+        """
+        Return a mask which is ``True`` for the boxes (given by their lower and upper
+        corners, arrays of shape ``(N, ndim)`` in units of ``length``) that
+        intersect the region. The region can be enlarged by ``pad``.
+        """
+        center, half, normal = self._scaled(length)
+        ndim = lower.shape[1]
+        size = 0.5 * (upper - lower)
+        distance = self._distance(0.5 * (lower + upper), center, normal)
+        return distance <= half + pad + size @ np.abs(normal[:ndim])
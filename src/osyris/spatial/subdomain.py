@@ -3,55 +3,41 @@
 
 import warnings
 
-import numpy as np
+from ..core import Dataset
+from .index import spatial_index
+from .region import Box, Sphere
 
-from .. import Dataset
 
-
-def extract_sphere(dataset, radius, origin):
-    """
-    Extract a spherical subdomain around an origin point.
-    """
+def _extract(dataset, region):
     subdomain = Dataset()
     subdomain.meta = dataset.meta.copy()
 
     for name, group in dataset.items():
-        pos = group.get("position", group.parent["amr"]["position"])
-        if pos.shape != group.shape:
+        if "position" not in group:
             warnings.warn(
-                "Ignoring datagroup '{}', which has no position ".format(group)
-                + "vector and has different shape than 'amr' group."
+                "Ignoring datagroup '{}', which has no position vector.".format(name)
             )
             continue
-        r = (pos - origin).norm
-        c = (r < radius).values
-        if np.any(c):
-            subdomain[name] = dataset[name][c]
+        selection = spatial_index(group).query(region)
+        if len(selection) > 0:
+            subdomain[name] = group[selection]
 
     return subdomain
 
 
-def extract_box(dataset, dx, dy, dz, origin):
+def extract_sphere(dataset, radius, origin):
     """
-    Extract a cubic domain of size dx, dy & dz around an origin point
+    Extract a spherical subdomain around an origin point.
+    The cells and particles are found with the spatial index of each group, which
+    is built on the first extraction and reused by the next ones.
     """
-    subdomain = Dataset()
-    subdomain.meta = dataset.meta.copy()
+    return _extract(dataset, Sphere(radius=radius, origin=origin))
 
-    for name, group in dataset.items():
-        pos = group.get("position", group.parent["amr"]["position"])
-        if pos.shape != group.shape:
-            warnings.warn(
-                "Ignoring datagroup '{}', which has no position ".format(group)
-                + "vector and has different shape than 'amr' group."
-            )
-            continue
-        centered_pos = pos - origin
-        cx = (centered_pos.x <= dx * 0.5) & (centered_pos.x >= -dx * 0.5)
-        cy = (centered_pos.y <= dy * 0.5) & (centered_pos.y >= -dy * 0.5)
-        cz = (centered_pos.z <= dz * 0.5) & (centered_pos.z >= -dz * 0.5)
-        c = (cx & cy & cz).values
-        if np.any(c):
-            subdomain[name] = dataset[name][c]
 
-    return subdomain
+def extract_box(dataset, dx, dy, dz, origin):
+    """
+    Extract a cubic domain of size dx, dy & dz around an origin point.
+    The cells and particles are found with the spatial index of each group, which
+    is built on the first extraction and reused by the next ones.
+    """
+    return _extract(dataset, Box(dx=dx, dy=dy, dz=dz, origin=origin))
@@ -0,0 +1,278 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+"""
+Write small synthetic RAMSES outputs, with the same file layout as the real ones,
+to test the loader.
+"""
+
+import os
+
+import numpy as np
+
+from osyris.io.hilbert import _hilbert3d
+
+NDIM = 3
+TWOTONDIM = 2**NDIM
+LEVELMIN = 3
+CENTER = np.array([0.35, 0.45, 0.55])
+HYDRO_VARIABLES = [
+    "density",
+    "velocity_x",
+    "velocity_y",
+    "velocity_z",
+    "pressure",
+]
+PART_VARIABLES = {
+    "position_x": "d",
+    "position_y": "d",
+    "position_z": "d",
+    "velocity_x": "d",
+    "velocity_y": "d",
+    "velocity_z": "d",
+    "mass": "d",
+    "identity": "i",
+    "levelp": "i",
+}
+UNITS = {"unit_l": 3.0857e18, "unit_d": 1.0e-20, "unit_t": 3.15e13}
+
+
+def _record(f, values, dtype):
+    values = np.asarray(values, dtype=dtype).ravel()
+    marker = np.array([values.nbytes], dtype=np.int32).tobytes()
+    f.write(marker + values.tobytes() + marker)
+
+
+def _keys(positions, levelmax):
+    """
+    The Hilbert keys of points in the unit box, on the grid of the finest level.
+    """
+    nx = 2 ** (levelmax + 1)
+    ijk = np.clip(np.floor(positions * nx).astype(np.int64), 0, nx - 1)
+    return _hilbert3d(ijk[:, 0], ijk[:, 1], ijk[:, 2], levelmax + 1)
+
+
+def _cell_offsets():
+    """
+    The offsets of the cell centers from the oct center, in units of the cell size,
+    in the order of the cells in the files.
+    """
+    offsets = np.zeros([TWOTONDIM, NDIM])
+    for ind in range(TWOTONDIM):
+        iz = ind // 4
+        iy = (ind - 4 * iz) // 2
+        ix = ind - 2 * iy - 4 * iz
+        offsets[ind] = [ix - 0.5, iy - 0.5, iz - 0.5]
+    return offsets
+
+
+def _build_octs(levelmax):
+    """
+    Build the octs of a mesh which is uniform up to ``LEVELMIN``, and refined further
+    in nested spheres around ``CENTER``. Return a list of the oct centers and of the
+    refinement flags of their cells, on each level.
+    """
+    offsets = _cell_offsets()
+    centers = [np.array([[0.5, 0.5, 0.5]])]
+    refined = []
+    for ilevel in range(levelmax):
+        dx = 0.5 ** (ilevel + 1)
+        cells = centers[ilevel][:, None, :] + offsets[None, :, :] * dx
+        if ilevel + 1 < LEVELMIN:
+            refine = np.ones(cells.shape[:2], dtype=bool)
+        elif ilevel + 1 < levelmax:
+            radius = 0.6 * 0.5 ** (ilevel + 1 - LEVELMIN)
+            refine = np.linalg.norm(cells - CENTER, axis=-1) < radius
+        else:
+            refine = np.zeros(cells.shape[:2], dtype=bool)
+        refined.append(refine)
+        if ilevel + 1 < levelmax:
+            centers.append(cells[refine])
+    return centers, refined
+
+
+def hydro_values(position):
+    """
+    The values of the hydro variables (in code units) at the given positions.
+    """
+    r2 = np.sum((position - CENTER) ** 2, axis=-1)
+    density = 1.0 + 10.0 * np.exp(-r2 / 0.02)
+    return np.stack(
+        [
+            density,
+            position[..., 0] - 0.5,
+            0.5 - position[..., 1],
+            position[..., 2] ** 2,
+            0.1 * density**1.4,
+        ],
+        axis=-1,
+    )
+
+
+def write_output(path, nout=1, ncpu=4, levelmax=5, nparticles=400, time=1.0):
+    """
+    Write a synthetic output ``output_{nout}`` in ``path``, with the AMR, hydro,
+    gravity and particle files of ``ncpu`` cpus, and the info and descriptor files.
+    The domains of the cpus are consecutive ranges of Hilbert keys of equal size.
+    Each file also holds the octs of the other domains on the first two levels, as
+    the ghost octs of the real outputs, which are stepped over by the readers.
+    Return the name of the output directory.
+    """
+    number = str(nout).zfill(5)
+    directory = os.path.join(path, "output_" + number)
+    os.makedirs(directory, exist_ok=True)
+
+    nkeys = 2 ** (NDIM * (levelmax + 1))
+    bound_key = np.linspace(0, nkeys, ncpu + 1)
+    centers, refined = _build_octs(levelmax)
+    domains = [
+        np.searchsorted(bound_key, _keys(c, levelmax), side="right") - 1
+        for c in centers
+    ]
+    offsets = _cell_offsets()
+
+    rng = np.random.default_rng(seed=nout)
+    part = {
+        "position": rng.uniform(0.0, 1.0, size=(nparticles, NDIM)),
+        "velocity": rng.normal(size=(nparticles, NDIM)),
+        "mass": rng.uniform(0.5, 2.0, size=nparticles),
+        "identity": np.arange(1, nparticles + 1),
+        "levelp": np.full(nparticles, levelmax),
+    }
+    part_domain = (
+        np.searchsorted(bound_key, _keys(part["position"], levelmax), side="right") - 1
+    )
+
+    for cpu in range(ncpu):
+        # The octs stored in the files of the cpu, for each level and domain
+        blocks = [
+            [
+                np.flatnonzero(
+                    (domains[ilevel] == d) & ((d == cpu) | (ilevel < LEVELMIN - 1))
+                )
+                for d in range(ncpu)
+            ]
+            for ilevel in range(levelmax)
+        ]
+        ngrid = np.array(
+            [[len(block) for block in level] for level in blocks], dtype=np.int32
+        )
+        suffix = number + ".out" + str(cpu + 1).zfill(5)
+
+        with open(os.path.join(directory, "amr_" + suffix), "wb") as f:
+            _record(f, [ncpu], "i")
+            _record(f, [NDIM], "i")
+            _record(f, [1, 1, 1], "i")
+            _record(f, [levelmax], "i")
+            _record(f, [100000], "i")
+            _record(f, [0], "i")
+            _record(f, [int(ngrid.sum())], "i")
+            _record(f, [1.0], "d")
+            _record(f, [1, 1, 1], "i")
+            _record(f, [time], "d")
+            _record(f, [1.0], "d")
+            _record(f, [time], "d")
+            _record(f, np.full(levelmax, 1.0e-3), "d")
+            _record(f, np.full(levelmax, 1.0e-3), "d")
+            for _ in range(7):
+                _record(f, [0], "i")
+            _record(f, ngrid, "i")
+            _record(f, ngrid.sum(axis=1), "i")
+            for _ in range(6):
+                _record(f, [0], "i")
+            for ilevel in range(levelmax):
+                for block in blocks[ilevel]:
+                    ncache = len(block)
+                    if ncache == 0:
+                        continue
+                    for _ in range(3):
+                        _record(f, np.arange(1, ncache + 1), "i")
+                    for n in range(NDIM):
+                        _record(f, centers[ilevel][block, n], "d")
+                    for _ in range(1 + 2 * NDIM):
+                        _record(f, np.zeros(ncache), "i")
+                    for ind in range(TWOTONDIM):
+                        _record(f, refined[ilevel][block, ind], "i")
+                    for _ in range(2 * TWOTONDIM):
+                        _record(f, np.zeros(ncache), "i")
+
+        with open(os.path.join(directory, "hydro_" + suffix), "wb") as f:
+            for value in [ncpu, len(HYDRO_VARIABLES), NDIM, levelmax, 0]:
+                _record(f, [value], "i")
+            _record(f, [1.4], "d")
+            for ilevel in range(levelmax):
+                dx = 0.5 ** (ilevel + 1)
+                for block in blocks[ilevel]:
+                    _record(f, [ilevel + 1], "i")
+                    _record(f, [len(block)], "i")
+                    if len(block) == 0:
+                        continue
+                    for ind in range(TWOTONDIM):
+                        values = hydro_values(
+                            centers[ilevel][block] + offsets[ind] * dx
+                        )
+                        for ivar in range(len(HYDRO_VARIABLES)):
+                            _record(f, values[:, ivar], "d")
+
+        with open(os.path.join(directory, "grav_" + suffix), "wb") as f:
+            for value in [ncpu, NDIM + 1, levelmax, 0]:
+                _record(f, [value], "i")
+            for ilevel in range(levelmax):
+                dx = 0.5 ** (ilevel + 1)
+                for block in blocks[ilevel]:
+                    _record(f, [ilevel + 1], "i")
+                    _record(f, [len(block)], "i")
+                    if len(block) == 0:
+                        continue
+                    for ind in range(TWOTONDIM):
+                        position = centers[ilevel][block] + offsets[ind] * dx
+                        _record(f, -hydro_values(position)[:, 0], "d")
+                        for n in range(NDIM):
+                            _record(f, CENTER[n] - position[:, n], "d")
+
+        own = part_domain == cpu
+        with open(os.path.join(directory, "part_" + suffix), "wb") as f:
+            _record(f, [ncpu], "i")
+            _record(f, [NDIM], "i")
+            _record(f, [np.count_nonzero(own)], "i")
+            _record(f, [0, 0, 0, 0], "i")
+            _record(f, [0], "i")
+            _record(f, [0.0], "d")
+            _record(f, [0.0], "d")
+            _record(f, [0], "i")
+            for key, dtype in PART_VARIABLES.items():
+                name, _, c = key.partition("_")
+                values = part[name] if len(c) == 0 else part[name][:, "xyz".index(c)]
+                _record(f, values[own], dtype)
+
+    with open(os.path.join(directory, "hydro_file_descriptor.txt"), "w") as f:
+        f.write("# version:  1\n# ivar, variable_name, variable_type\n")
+        for ivar, key in enumerate(HYDRO_VARIABLES):
+            f.write(f"  {ivar + 1}, {key}, d\n")
+    with open(os.path.join(directory, "part_file_descriptor.txt"), "w") as f:
+        f.write("# version:  1\n# ivar, variable_name, variable_type\n")
+        for ivar, (key, dtype) in enumerate(PART_VARIABLES.items()):
+            f.write(f"  {ivar + 1}, {key}, {dtype}\n")
+
+    with open(os.path.join(directory, "info_" + number + ".txt"), "w") as f:
+        f.write(f"ncpu        = {ncpu:10d}\n")
+        f.write(f"ndim        = {NDIM:10d}\n")
+        f.write(f"levelmin    = {LEVELMIN:10d}\n")
+        f.write(f"levelmax    = {levelmax:10d}\n")
+        f.write(f"ngridmax    = {100000:10d}\n")
+        f.write(f"nstep_coarse= {10:10d}\n")
+        f.write("\n")
+        f.write(f"boxlen      = {1.0:23.15E}\n")
+        f.write(f"time        = {time:23.15E}\n")
+        f.write(f"aexp        = {1.0:23.15E}\n")
+        for key in ["H0", "omega_m", "omega_l", "omega_k", "omega_b"]:
+            f.write(f"{key:<12}= {0.0:23.15E}\n")
+        for key, value in UNITS.items():
+            f.write(f"{key:<12}= {value:23.15E}\n")
+        f.write("\n")
+        f.write("ordering type = hilbert\n")
+        f.write("   DOMAIN   ind_min                 ind_max\n")
+        for cpu in range(ncpu):
+            f.write(
+                f"{cpu + 1:8d} {bound_key[cpu]:23.15E} {bound_key[cpu + 1]:23.15E}\n"
+            )
+    return directory
@@ -303,6 +303,15 @@ def test_power():
     assert arrayclose(a**3, expected)
 
 
+def test_single_precision_keeps_units():
+    a = Array(values=np.array([1.0, 2.0, 3.0], dtype=np.float32), unit="g/cm**3")
+    b = Array(values=np.array([2.0, 1.0, 0.5], dtype=np.float32), unit="cm")
+    c = a * b**3
+    assert c.dtype == np.float32
+    assert c.unit == units("g")
+    assert arrayclose(c.to("kg"), Array(values=[8.0e-3, 2.0e-3, 3.75e-4], unit="kg"))
+
+
 def test_negative():
     a = Array(values=[1.0, 2.0, 4.0, 6.0, 200.0], unit="s")
     expected = Array(values=[-1.0, -2.0, -4.0, -6.0, -200.0], unit="s")
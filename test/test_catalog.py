@@ -0,0 +1,97 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+import os
+
+import numpy as np
+import pytest
+from ramses import UNITS, write_output
+
+from osyris import Catalog, units
+from osyris.io import catalog as catalog_module
+
+
+@pytest.fixture
+def path(tmp_path):
+    for nout, time in [(1, 1.0), (2, 2.0), (4, 4.0)]:
+        write_output(tmp_path, nout=nout, ncpu=2, levelmax=4, time=time)
+    return str(tmp_path)
+
+
+def test_catalog_entries(path):
+    catalog = Catalog(path)
+    assert len(catalog) == 3
+    assert np.array_equal(catalog.nouts, [1, 2, 4])
+    assert catalog[2]["ncpu"] == 2
+    assert catalog[2]["levelmax"] == 4
+    assert np.allclose(
+        catalog.times.values, np.array([1.0, 2.0, 4.0]) * UNITS["unit_t"]
+    )
+    directory = os.path.join(path, "output_00002")
+    assert catalog.sizes[1] == sum(
+        os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+    )
+
+
+def test_catalog_nearest_and_open(path):
+    catalog = Catalog(path)
+    assert catalog.nearest(2.9 * UNITS["unit_t"] * units("s")) == 2
+    assert catalog.nearest(3.1 * UNITS["unit_t"] * units("s")) == 4
+    with pytest.raises(TypeError):
+        catalog.nearest(3.0)
+    assert catalog.open().meta["nout"] == 4
+    assert catalog.open(nout=1).meta["nout"] == 1
+
+
+def test_catalog_index_is_reused(path):
+    Catalog(path)
+    assert os.path.exists(os.path.join(path, Catalog.filename))
+    write_output(path, nout=5, ncpu=2, levelmax=4, time=5.0)
+    catalog = Catalog(path)
+    assert np.array_equal(catalog.nouts, [1, 2, 4, 5])
+    assert np.array_equal(Catalog(path, index=False).sizes, catalog.sizes)
+
+
+def test_catalog_reopen_only_reads_the_stamps(path, monkeypatch):
+    entries = Catalog(path).entries
+
+    def fail(directory):
+        raise AssertionError("The files of {} were listed".format(directory))
+
+    monkeypatch.setattr(catalog_module, "source_stats", fail)
+    with pytest.raises(AssertionError):
+        Catalog(path, check_files=True)
+    catalog = Catalog(path)
+    assert catalog.entries == entries
+    # A new file in an output changes the modification time of the directory
+    directory = os.path.join(path, "output_00002")
+    monkeypatch.undo()
+    os.utime(directory, ns=(0, 0))
+    with open(os.path.join(directory, "extra.txt"), "w") as f:
+        f.write("extra")
+    catalog = Catalog(path)
+    assert catalog[2]["size"] == entries[2]["size"] + 5
+    assert catalog[1] == entries[1]
+
+
+def test_catalog_detects_files_rewritten_in_place(path):
+    catalog = Catalog(path, check_files=True)
+    size = catalog[1]["size"]
+    directory = os.path.join(path, "output_00001")
+    info = os.stat(os.path.join(directory, "info_00001.txt"))
+    before = os.stat(directory)
+    with open(os.path.join(directory, "hydro_00001.out00001"), "ab") as f:
+        f.write(b"\0" * 100)
+    # Neither the info file nor the directory have changed
+    assert os.stat(os.path.join(directory, "info_00001.txt")) == info
+    assert os.stat(directory).st_mtime_ns == before.st_mtime_ns
+    assert Catalog(path)[1]["size"] == size
+    assert Catalog(path, check_files=True)[1]["size"] == size + 100
+
+
+def test_catalog_empty(tmp_path):
+    catalog = Catalog(str(tmp_path))
+    assert len(catalog) == 0
+    with pytest.raises(ValueError):
+        catalog.open()
+    with pytest.raises(ValueError):
+        catalog.nearest(1.0 * units("s"))
@@ -201,3 +201,46 @@ def test_can_share_arrays_between_datagroups():
     dg2["a2"] /= 10.0
     assert arrayequal(dg1["a1"], Array(values=[1.0, 2.0, 3.0, 4.0, 5.0], unit="m"))
     assert arrayequal(dg2["a2"], Array(values=[1.0, 2.0, 3.0, 4.0, 5.0], unit="m"))
+
+
+def test_datagroup_defer():
+    a = Array(values=[1.0, 2.0, 3.0, 4.0, 5.0], unit="m")
+    calls = []
+
+    def load_b():
+        calls.append(1)
+        return Array(values=[6.0, 7.0, 8.0, 9.0, 10.0], unit="s")
+
+    dg = Datagroup({"a": a})
+    dg.defer("b", load_b)
+    assert "b" in dg
+    assert "b" in dg.keys()
+    assert len(dg) == 2
+    assert not dg.is_loaded("b")
+    assert len(calls) == 0
+    assert arrayequal(dg["b"], Array(values=[6.0, 7.0, 8.0, 9.0, 10.0], unit="s"))
+    assert dg["b"].name == "b"
+    assert dg.is_loaded("b")
+    dg["b"]
+    assert len(calls) == 1
+
+
+def test_datagroup_defer_slice_and_sortby():
+    a = Array(values=[2.0, 3.0, 1.0, 5.0, 4.0], unit="m")
+    dg = Datagroup({"a": a})
+    dg.defer("b", lambda: Array(values=[6.0, 7.0, 8.0, 9.0, 10.0], unit="s"))
+    sliced = dg[1:3]
+    assert not sliced.is_loaded("b")
+    assert arrayequal(sliced["b"], Array(values=[7.0, 8.0], unit="s"))
+    dg.sortby("a")
+    assert not dg.is_loaded("b")
+    assert arrayequal(dg["b"], Array(values=[8.0, 6.0, 7.0, 10.0, 9.0], unit="s"))
+
+
+def test_datagroup_defer_delitem():
+    a = Array(values=[1.0, 2.0, 3.0, 4.0, 5.0], unit="m")
+    dg = Datagroup({"a": a})
+    dg.defer("b", lambda: Array(values=[6.0, 7.0, 8.0, 9.0, 10.0], unit="s"))
+    del dg["b"]
+    assert "b" not in dg
+    assert len(dg) == 1
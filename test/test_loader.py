@@ -0,0 +1,522 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from common import arrayequal, vectorequal
+from ramses import write_output
+
+from osyris import Box, ColumnCache, RamsesDataset, Sphere, Vector
+from osyris.io import utils
+from osyris.io.hilbert import _hilbert3d
+
+
+@pytest.fixture(scope="module")
+def path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("ramses")
+    write_output(path)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def reference(path):
+    return RamsesDataset(1, path=path).load()
+
+
+def load(path, **kwargs):
+    return RamsesDataset(1, path=path).load(**kwargs)
+
+
+def groupequal(a, b):
+    if set(a.keys()) != set(b.keys()):
+        return False
+    for key in a.keys():
+        if isinstance(a[key], Vector):
+            if not vectorequal(a[key], b[key]):
+                return False
+        elif not arrayequal(a[key], b[key]):
+            return False
+    return True
+
+
+def datasetequal(a, b, groups=("mesh", "part")):
+    return all(groupequal(a[group], b[group]) for group in groups)
+
+
+def test_load_synthetic_output(reference):
+    mesh = reference["mesh"]
+    assert reference.meta["ncells"] == len(mesh["level"])
+    assert reference.meta["nparticles"] == len(reference["part"]["mass"])
+    assert np.array_equal(np.unique(mesh["cpu"].values), [1, 2, 3, 4])
+    # The leaf cells fill the box
+    box = reference.meta["boxlen"] * reference.units["x"]
+    assert np.isclose(np.sum((mesh["dx"] ** 3).values), (box**3).to("cm**3").magnitude)
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_load_workers(path, reference, workers):
+    ds = load(path, workers=workers)
+    assert datasetequal(ds, reference)
+    assert ds.meta["ncells"] == reference.meta["ncells"]
+    assert ds.meta["nparticles"] == reference.meta["nparticles"]
+
+
+def test_read_record_and_skip_records():
+    records = [np.arange(5, dtype=np.int32), np.linspace(0.0, 1.0, 3)]
+    content = b""
+    for values in records:
+        marker = np.array([values.nbytes], dtype=np.int32).tobytes()
+        content += marker + values.tobytes() + marker
+    ints, cursor = utils.read_record(content, 0, "i")
+    assert np.array_equal(ints, records[0])
+    assert cursor == 28
+    assert utils.skip_records(content, 0) == cursor
+    doubles, end = utils.read_record(content, cursor, "d", count=2)
+    assert np.array_equal(doubles, records[1][:2])
+    assert end == len(content)
+    assert utils.skip_records(content, 0, nrecords=2) == len(content)
+
+
+def test_load_python_decoding(path, reference):
+    ds = load(path, compiled=False, index=False)
+    assert datasetequal(ds, reference)
+
+
+def test_load_index(path, reference):
+    fname = utils.generate_fname(1, path, ftype="osyris_index", cpuid=0, ext=".npz")
+    assert datasetequal(load(path, index=False), reference)
+    assert datasetequal(load(path, index=True), reference)
+    with np.load(fname) as content:
+        index = {key: content[key] for key in content.files}
+    assert set(index) == {"amr", "hydro", "grav"}
+    assert np.all(index["amr"] >= 0)
+    # Offsets recorded for files that have since changed are not used
+    for row in index.values():
+        row[:, 0] -= 1
+        row[:, 2:] = 0
+    utils.write_record_index(fname, index)
+    assert datasetequal(load(path, index=True), reference)
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_load_preallocate(path, reference, compiled):
+    ds = load(path, preallocate=True, compiled=compiled)
+    assert datasetequal(ds, reference)
+
+
+def test_load_preallocate_with_selection(path, reference):
+    dmin = 3.0e-20 * reference.units["density"].units
+    ds = load(path, select={"mesh": {"density": lambda d: d > dmin}}, preallocate=True)
+    expected = reference["mesh"][(reference["mesh"]["density"] > dmin).values]
+    assert groupequal(ds["mesh"], expected)
+
+
+CACHE_KEY_SCRIPT = """
+import os
+import subprocess
+import sys
+
+import numpy as np
+import osyris
+from osyris import units
+from osyris.io.cache import cache_directory
+
+x = {threshold}
+select = {{
+    "mesh": {{
+        "density": lambda d: d > x * osyris.units("g/cm**3"),
+        "pressure": lambda p: np.log(p.values) > x * units("").magnitude,
+    }}
+}}
+region = osyris.Sphere(radius=x * units("pc"), origin=osyris.Vector(x, x, x, unit="pc"))
+print(cache_directory("cache", "output_00001", select=select, region=region))
+"""
+
+
+def _cache_key(threshold):
+    return subprocess.run(
+        [sys.executable, "-c", CACHE_KEY_SCRIPT.format(threshold=threshold)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def test_cache_key_is_the_same_in_different_processes():
+    key = _cache_key(3.0)
+    assert key == _cache_key(3.0)
+    assert key != _cache_key(4.0)
+
+
+def test_load_cache(path, reference, tmp_path):
+    dmin = 3.0e-20 * reference.units["density"].units
+    select = {"mesh": {"density": lambda d: d > dmin}}
+    first = load(path, select=select, cache=str(tmp_path))
+    second = load(path, select=select, cache=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+    expected = reference["mesh"][(reference["mesh"]["density"] > dmin).values]
+    assert groupequal(first["mesh"], expected)
+    assert datasetequal(second, first)
+    assert second.meta["ncells"] == first.meta["ncells"]
+
+
+@pytest.mark.parametrize("chunk_cpus", [1, 3])
+def test_iter_chunks(path, reference, chunk_cpus):
+    chunks = list(RamsesDataset(1, path=path).iter_chunks(chunk_cpus=chunk_cpus))
+    assert len(chunks) == int(np.ceil(4 / chunk_cpus))
+    for group in ["mesh", "part"]:
+        for key, array in reference[group].items():
+            for c in "xyz" if isinstance(array, Vector) else [None]:
+                pieces = [
+                    getattr(chunk[group][key], c) if c else chunk[group][key]
+                    for chunk in chunks
+                ]
+                assert np.array_equal(
+                    np.concatenate([piece.values for piece in pieces]),
+                    (getattr(array, c) if c else array).values,
+                )
+    assert sum(chunk.meta["ncells"] for chunk in chunks) == reference.meta["ncells"]
+
+
+def test_hilbert_keys_of_arrays_match_scalars():
+    rng = np.random.default_rng(1)
+    ijk = rng.integers(0, 2**6, size=(50, 3))
+    keys = _hilbert3d(ijk[:, 0], ijk[:, 1], ijk[:, 2], 6)
+    assert np.array_equal(keys, [_hilbert3d(*c, 6) for c in ijk])
+    # The keys of the cells of a grid are a permutation of the cell indices
+    i, j, k = np.meshgrid(*[np.arange(4)] * 3, indexing="ij")
+    keys = _hilbert3d(i.ravel(), j.ravel(), k.ravel(), 2)
+    assert np.array_equal(np.sort(keys), np.arange(64))
+
+
+def test_load_position_selection_reads_fewer_cpus(path, reference):
+    xmax = 0.2 * reference.meta["boxlen"] * reference.units["x"]
+    ds = load(path, select={"mesh": {"position_x": lambda x: x < xmax}})
+    expected = reference["mesh"][(reference["mesh"]["position"].x < xmax).values]
+    assert groupequal(ds["mesh"], expected)
+    assert len(ds.loader.readers["amr"].cpu_list) < ds.meta["ncpu"]
+
+
+def _inside(region, group, box):
+    position = group["position"]
+    xyz = np.stack([position.x.values, position.y.values, position.z.values], axis=1)
+    return region.contains(xyz / box.to(position.unit).magnitude, box)
+
+
+@pytest.mark.parametrize("kind", ["sphere", "box"])
+def test_load_region(path, reference, kind):
+    box = reference.meta["boxlen"] * reference.units["x"]
+    origin = Vector(0.3, 0.4, 0.5) * box
+    if kind == "sphere":
+        region = Sphere(radius=0.17 * box, origin=origin)
+    else:
+        region = Box(dx=0.3 * box, dy=0.2 * box, dz=0.25 * box, origin=origin)
+    ds = load(path, region=region)
+    for group in ["mesh", "part"]:
+        expected = reference[group][_inside(region, reference[group], box)]
+        assert len(expected["mass"]) > 0
+        assert groupequal(ds[group], expected)
+
+
+def test_load_particle_selection(path, reference):
+    mmin = 1.2 * reference.units["mass"]
+    ds = load(path, select={"part": {"mass": lambda m: m > mmin}})
+    expected = reference["part"][(reference["part"]["mass"] > mmin).values]
+    assert 0 < len(expected["mass"]) < len(reference["part"]["mass"])
+    assert groupequal(ds["part"], expected)
+    assert groupequal(ds["mesh"], reference["mesh"])
+
+
+@pytest.mark.parametrize("selection", ["none", "level", "particles"])
+def test_load_compiled_matches_python(path, reference, selection):
+    mmin = 1.2 * reference.units["mass"]
+    select = {
+        "none": None,
+        "level": {"mesh": {"level": lambda level: level < 5}},
+        "particles": {"part": {"mass": lambda m: m > mmin}},
+    }[selection]
+    compiled = load(path, select=select, compiled=True)
+    python = load(path, select=select, compiled=False)
+    assert datasetequal(compiled, python)
+    assert compiled.meta["ncells"] == python.meta["ncells"]
+
+
+@pytest.mark.parametrize("max_bytes", [None, 1])
+def test_load_prefetch(path, reference, max_bytes):
+    ds = load(path, prefetch=2, prefetch_max_bytes=max_bytes)
+    assert datasetequal(ds, reference)
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_load_report(path, reference, workers):
+    reports = []
+    ds = RamsesDataset(1, path=path).load(
+        workers=workers, callback=lambda report: reports.append(report.ncpus)
+    )
+    report = ds.meta["load_report"]
+    assert datasetequal(ds, reference)
+    assert report.ncpus == 4
+    assert report.ncells == reference.meta["ncells"]
+    assert report.nparticles == reference.meta["nparticles"]
+    # The callback is called after each cpu, and at the end of the load
+    assert reports == [1, 2, 3, 4, 4]
+    for group in ["amr", "hydro", "grav", "part"]:
+        assert report.file_nbytes[group] == sum(
+            os.path.getsize(utils.generate_fname(1, path, ftype=group, cpuid=cpu))
+            for cpu in range(1, 5)
+        )
+    assert all(seconds >= 0 for seconds in report.timings.values())
+    assert report.wall_time > 0
+    assert "LoadReport: 4 cpus" in str(report)
+    if sys.platform != "win32":
+        assert report.peak_memory > 0
+        assert (report.peak_memory_workers is None) == (workers is None)
+        if workers is not None:
+            assert report.peak_memory_workers > 0
+            assert "peak memory (workers)" in str(report)
+
+
+def test_plan(tmp_path):
+    write_output(tmp_path)
+    ds = RamsesDataset(1, path=str(tmp_path))
+    # Without a zone map, all the cells in the domains of the cpus are counted
+    before = ds.plan()
+    ds.load()
+    after = RamsesDataset(1, path=str(tmp_path)).plan()
+    assert before.ncells > ds.meta["ncells"]
+    assert after.ncells == ds.meta["ncells"]
+    assert after.nparticles == ds.meta["nparticles"]
+    assert after.cpu_list == [1, 2, 3, 4]
+    assert len(after.files) == 16
+    assert after.file_nbytes == sum(ds.meta["load_report"].file_nbytes.values())
+    for group, key in [("mesh", "density"), ("mesh", "level"), ("part", "identity")]:
+        assert after.columns[group][key] == ds[group][key].values.nbytes
+
+
+def test_plan_with_selection_and_dtype(path, reference):
+    xmax = 0.2 * reference.meta["boxlen"] * reference.units["x"]
+    select = {"mesh": {"position_x": lambda x: x < xmax}}
+    plan = RamsesDataset(1, path=path).plan(select=select, dtype="float32")
+    ds = load(path, select=select, dtype="float32")
+    assert plan.cpu_list == ds.loader.readers["amr"].cpu_list
+    assert plan.ncells >= ds.meta["ncells"]
+    assert plan.columns["mesh"]["density"] == 4 * plan.ncells
+
+
+@pytest.mark.parametrize(
+    "options", [{"compiled": True}, {"compiled": False}, {"workers": 2}]
+)
+def test_load_float32(path, reference, options):
+    ds = load(path, dtype="float32", **options)
+    assert ds.meta["ncells"] == reference.meta["ncells"]
+    for group in ["mesh", "part"]:
+        assert set(ds[group].keys()) == set(reference[group].keys())
+        for key, array in ds[group].items():
+            expected = reference[group][key]
+            assert array.unit == expected.unit
+            components = (
+                zip(array._xyz.values(), expected._xyz.values())
+                if isinstance(array, Vector)
+                else [(array, expected)]
+            )
+            for a, b in components:
+                if key in ["position", "dx"]:
+                    # The positions and cell sizes are kept in double precision
+                    assert a.dtype == np.float64
+                    assert np.array_equal(a.values, b.values)
+                elif key in ["level", "cpu"]:
+                    assert a.dtype == np.int8
+                    assert np.array_equal(a.values, b.values)
+                elif key in ["identity", "levelp"]:
+                    # The integer particle variables keep their type in the files
+                    assert a.dtype == np.int32
+                    assert np.array_equal(a.values, b.values)
+                else:
+                    # The mass of the cells is computed from their double precision
+                    # size by the additional variables
+                    if (group, key) != ("mesh", "mass"):
+                        assert a.dtype == np.float32
+                    np.testing.assert_allclose(a.values, b.values, rtol=3.0e-7)
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_load_more(path, reference, compiled):
+    box = reference.meta["boxlen"] * reference.units["x"]
+    region = Sphere(radius=0.3 * box, origin=Vector(0.4, 0.4, 0.5) * box)
+    ds = RamsesDataset(1, path=path).load(
+        select={"mesh": ["density"], "part": False},
+        region=region,
+        sortby={"mesh": "density"},
+        compiled=compiled,
+    )
+    assert list(ds["mesh"].keys()) == ["density"]
+    ds.load_more(["pressure", "velocity", "grav_potential"])
+    expected = reference["mesh"][_inside(region, reference["mesh"], box)]
+    expected.sortby("density")
+    for key in ["density", "pressure", "grav_potential"]:
+        assert arrayequal(ds["mesh"][key], expected[key])
+    assert vectorequal(ds["mesh"]["velocity"], expected["velocity"])
+    with pytest.raises(KeyError):
+        ds.load_more("temperature")
+
+
+def _lazy_options(reference, kind):
+    box = reference.meta["boxlen"] * reference.units["x"]
+    dmin = 3.0e-20 * reference.units["density"].units
+    region = Sphere(radius=0.3 * box, origin=Vector(0.4, 0.4, 0.5) * box)
+    select = {"mesh": {"density": (dmin, None)}}
+    return {
+        "none": {},
+        "select": {"select": select},
+        "sortby": {"sortby": {"mesh": "level"}},
+        "workers": {"workers": 2},
+        "region": {"region": region},
+        "all": {
+            "select": select,
+            "sortby": {"mesh": "level"},
+            "workers": 2,
+            "region": region,
+        },
+    }[kind]
+
+
+@pytest.mark.parametrize(
+    "kind", ["none", "select", "sortby", "workers", "region", "all"]
+)
+def test_load_lazy(path, reference, kind):
+    options = _lazy_options(reference, kind)
+    full = load(path, **options)
+    ds = load(path, lazy=True, **options)
+    mesh = ds["mesh"]
+    assert set(mesh.keys()) == set(full["mesh"].keys())
+    deferred = [key for key in mesh.keys() if not mesh.is_loaded(key)]
+    assert {"velocity", "pressure", "grav_potential", "grav_acceleration"} <= set(
+        deferred
+    )
+    assert mesh.is_loaded("position") and mesh.is_loaded("level")
+    # Each deferred item is read on its own when it is accessed
+    for ind, key in enumerate(deferred):
+        if isinstance(full["mesh"][key], Vector):
+            assert vectorequal(mesh[key], full["mesh"][key])
+        else:
+            assert arrayequal(mesh[key], full["mesh"][key])
+        assert mesh.is_loaded(key)
+        assert not any(mesh.is_loaded(k) for k in deferred[ind + 1 :])
+    assert datasetequal(ds, full)
+    assert ds.meta["ncells"] == full.meta["ncells"]
+
+
+def test_load_lazy_slices_and_sorts_deferred_items(path, reference):
+    ds = load(path, lazy=True)
+    subset = ds["mesh"][ds["mesh"]["level"].values == 5]
+    subset.sortby("density")
+    assert not subset.is_loaded("pressure")
+    expected = reference["mesh"][reference["mesh"]["level"].values == 5]
+    expected.sortby("density")
+    assert arrayequal(subset["pressure"], expected["pressure"])
+    assert vectorequal(subset["velocity"], expected["velocity"])
+    # The item has only been read for the subset
+    assert not ds["mesh"].is_loaded("pressure")
+
+
+@pytest.mark.parametrize("max_bytes", [1e8, 2e5])
+def test_load_column_cache(path, reference, max_bytes):
+    cache = ColumnCache(max_bytes=max_bytes)
+    first = load(path, column_cache=cache)
+    assert datasetequal(first, reference)
+    assert cache.hits == 0
+    assert cache.nbytes <= max_bytes
+    dmin = 3.0e-20 * reference.units["density"].units
+    second = load(
+        path, select={"mesh": {"density": lambda d: d > dmin}}, column_cache=cache
+    )
+    expected = reference["mesh"][(reference["mesh"]["density"] > dmin).values]
+    assert groupequal(second["mesh"], expected)
+    if max_bytes > 1e7:
+        assert cache.misses == 4
+        assert cache.hits > 0
+        assert cache.evictions == 0
+    else:
+        assert cache.evictions > 0
+
+
+def test_load_interval_selection(path, reference):
+    unit = reference.units["density"].units
+    dmin, dmax = 3.0e-20 * unit, 8.0e-20 * unit
+    ds = load(path, select={"mesh": {"density": (dmin, dmax)}})
+    density = reference["mesh"]["density"]
+    mask = (density >= dmin) & (density <= dmax)
+    assert groupequal(ds["mesh"], reference["mesh"][mask.values])
+    ds = load(path, select={"mesh": {"level": (None, 4)}})
+    assert datasetequal(ds, load(path, select={"mesh": {"level": lambda x: x <= 4}}))
+    assert ds.meta["lmax"] == 4
+
+
+@pytest.mark.parametrize("key", ["density", "position_x"])
+def test_prune_with_band_function_does_not_skip(path, reference, key):
+    if key == "density":
+        unit = reference.units["density"].units
+        lower, upper = 5.0e-20 * unit, 8.0e-20 * unit
+    else:
+        box = reference.meta["boxlen"] * reference.units["x"]
+        lower, upper = 0.4 * box, 0.6 * box
+    # The zone map is recorded by the reference load
+    select = {"mesh": {key: lambda v: (v > lower) & (v < upper)}}
+    pruned = RamsesDataset(1, path=path).load(select=select, prune=True)
+    assert len(pruned.loader.pruned) == 0
+    assert datasetequal(pruned, load(path, select=select, prune=False))
+    assert pruned.meta["ncells"] > 0
+
+
+def test_prune_with_band_interval(path, reference):
+    unit = reference.units["density"].units
+    select = {"mesh": {"density": (5.0e-20 * unit, 8.0e-20 * unit)}}
+    pruned = RamsesDataset(1, path=path).load(select=select, prune=True)
+    assert len(pruned.loader.pruned) > 0
+    assert datasetequal(pruned, load(path, select=select, prune=False))
+    assert pruned.meta["ncells"] > 0
+
+
+def _cell_centers(octree, boxlen):
+    octs, slots = octree.cell_octs()
+    size = 0.5 ** (octree.level[octs].astype(np.float64) - 1)
+    offsets = (slots[:, None] >> np.arange(octree.ndim)) & 1
+    return (octree.coords[octs] + 0.25 + 0.5 * offsets) * size[:, None] * boxlen
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_load_octree(path, reference, compiled):
+    ds = load(path, octree=True, compiled=compiled, sortby={"mesh": "density"})
+    octree = ds.meta["octree"]
+    expected = reference["mesh"].copy()
+    expected.sortby("density")
+    assert groupequal(ds["mesh"], expected)
+    assert np.count_nonzero(octree.cells >= 0) == ds.meta["ncells"]
+
+    # The octs give the positions of the cells, after sorting
+    position = ds["mesh"]["position"]
+    boxlen = (ds.meta["boxlen"] * ds.units["x"]).to(position.unit).magnitude
+    xyz = np.stack([position.x.values, position.y.values, position.z.values], axis=1)
+    assert np.allclose(_cell_centers(octree, boxlen), xyz)
+
+    # The parents and children are linked
+    has_parent = octree.parent >= 0
+    assert np.all(has_parent == (octree.level > 1))
+    assert np.array_equal(
+        octree.children[octree.parent[has_parent], octree.slot[has_parent]],
+        np.flatnonzero(has_parent),
+    )
+
+    # The neighbours of the cells touch them, at the same or a coarser level
+    dx = ds["mesh"]["dx"].values
+    for axis in range(3):
+        for side in (-1, 1):
+            nb = octree.cell_neighbours(axis=axis, side=side)
+            found = nb >= 0
+            assert np.count_nonzero(found) > 0
+            distance = side * (xyz[nb[found], axis] - xyz[found, axis])
+            assert np.allclose(distance, 0.5 * (dx[found] + dx[nb[found]]))
+            assert np.all(dx[nb[found]] >= dx[found])
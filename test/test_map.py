@@ -0,0 +1,223 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+import numpy as np
+import pytest
+
+import osyris
+from osyris import Array, Datagroup, MapPlan, Vector, units
+
+
+def _make_group(n=8):
+    """
+    A cube of ``n**3`` cells with a size of 1 cm, where the cells close to the
+    center are replaced by 8 cells of half their size.
+    """
+    centers = (np.arange(n) + 0.5) / n
+    xyz = np.stack(
+        [c.ravel() for c in np.meshgrid(centers, centers, centers, indexing="ij")],
+        axis=1,
+    )
+    dx = np.full(len(xyz), 1.0 / n)
+    refine = np.linalg.norm(xyz - 0.5, axis=1) < 0.2
+    offsets = np.array(np.meshgrid([-1, 1], [-1, 1], [-1, 1])).reshape(3, -1).T
+    children = (xyz[refine][:, None, :] + 0.25 * offsets / n).reshape(-1, 3)
+    xyz = np.concatenate([xyz[~refine], children])
+    dx = np.concatenate([dx[~refine], np.full(len(children), 0.5 / n)])
+    r = np.linalg.norm(xyz - 0.5, axis=1)
+    return Datagroup(
+        {
+            "position": Vector(*xyz.T, unit="cm"),
+            "dx": Array(values=dx, unit="cm"),
+            "density": Array(values=1.0 + np.exp(-(r**2) / 0.05), unit="g/cm**3"),
+            "temperature": Array(values=10.0 + 100.0 * xyz[:, 0], unit="K"),
+        }
+    )
+
+
+VIEW = {
+    "dx": 0.8 * units("cm"),
+    "origin": Vector(0.5, 0.5, 0.5, unit="cm"),
+    "resolution": 32,
+}
+
+
+def _cells(group):
+    xyz = np.stack([c.values for c in group["position"]._xyz.values()], axis=1)
+    return xyz, group["dx"].values
+
+
+def _pixels(plan, along=0.0):
+    """
+    The positions of the pixel centers of a plan, in the original basis, moved by
+    ``along`` (an array of distances) along the normal of the map. The result has
+    shape ``(ny, nx, len(along), 3)``.
+    """
+    u, v, n = (
+        np.array([vec.x.values, vec.y.values, vec.z.values], dtype=float).ravel()
+        for vec in (plan.basis.u, plan.basis.v, plan.basis.n)
+    )
+    origin = np.array([c.values for c in plan.origin._xyz.values()], dtype=float)
+    y, x, z = np.meshgrid(
+        plan.ycenters, plan.xcenters, np.atleast_1d(along), indexing="ij"
+    )
+    return origin + x[..., None] * u + y[..., None] * v + z[..., None] * n
+
+
+def _locate(group, points):
+    """
+    Return the index of the cell containing each point, or -1 outside the mesh,
+    by looking up the points in a uniform grid for each cell size, from the
+    finest to the coarsest.
+    """
+    xyz, dx = _cells(group)
+    out = np.full(points.shape[:-1], -1)
+    for size in np.unique(dx):
+        n = int(round(1.0 / size))
+        grid = np.full((n, n, n), -1)
+        on_level = np.flatnonzero(dx == size)
+        grid[tuple(np.floor(xyz[on_level] / size).astype(int).T)] = on_level
+        ijk = np.floor(points / size).astype(int)
+        inside = np.all((ijk >= 0) & (ijk < n), axis=-1) & (out < 0)
+        out[inside] = grid[tuple(ijk[inside].T)]
+    return out
+
+
+def _assert_plan_map_matches(plan, layer, expected):
+    """
+    Check that a map of ``layer`` with the plan gives ``expected`` where it is
+    finite, and is masked where it is ``NaN``.
+    """
+    data = plan.map(layer, plot=False).layers[0]["data"]
+    assert np.array_equal(np.ma.getmaskarray(data), np.isnan(expected))
+    np.testing.assert_allclose(data.filled(np.nan), expected, equal_nan=True)
+
+
+@pytest.mark.parametrize("direction", ["z", "x", Vector(1, 2, 3)])
+@pytest.mark.parametrize("origin", [0.5, 0.4])
+def test_thin_map_matches_brute_force(direction, origin):
+    group = _make_group()
+    view = dict(VIEW, origin=Vector(origin, origin, origin, unit="cm"))
+    plan = MapPlan(group, direction=direction, **view)
+    assert not plan.thick
+    xyz, dx = _cells(group)
+    values = group["density"].values
+    pixels = _pixels(plan)[:, :, 0, :]
+    # Test every pixel against every cell. A pixel on a face is in several cells,
+    # and can take the value of any of them.
+    inside = np.all(
+        np.abs(pixels[:, :, None, :] - xyz) <= 0.5 * dx[:, None] * (1.0 + 1.0e-12),
+        axis=-1,
+    )
+    covered = inside.any(axis=-1)
+    assert covered.mean() > 0.9
+    data = plan.map(group.layer("density"), plot=False).layers[0]["data"]
+    # The pixels outside of the mesh are masked
+    assert np.array_equal(np.ma.getmaskarray(data), ~covered)
+    assert np.any(inside & (values == data.filled(np.nan)[:, :, None]), axis=-1)[
+        covered
+    ].all()
+    # Away from the faces, a pixel is in a single cell
+    single = inside.sum(axis=-1) == 1
+    assert single.any() == (origin != 0.5 or not isinstance(direction, str))
+    assert np.array_equal(data[single], values[np.argmax(inside, axis=-1)[single]])
+
+
+@pytest.mark.parametrize("direction", ["z", Vector(1, 2, 3)])
+@pytest.mark.parametrize("operation", ["sum", "mean", "max"])
+def test_thick_map_matches_sampling(direction, operation):
+    group = _make_group()
+    dz = 0.4 * units("cm")
+    plan = MapPlan(group, direction=direction, dz=dz, **VIEW)
+    assert plan.thick
+    # Sample each line of sight at the middle of 4000 steps across the slab
+    nsamples = 4000
+    step = dz.magnitude / nsamples
+    along = (np.arange(nsamples) + 0.5) * step - 0.5 * dz.magnitude
+    cells = _locate(group, _pixels(plan, along))
+    samples = np.where(cells >= 0, group["density"].values[cells], np.nan)
+    inside = np.isfinite(samples).any(axis=-1)
+    assert inside.all() if isinstance(direction, str) else inside.mean() > 0.9
+    with np.errstate(invalid="ignore"):
+        expected = {
+            "sum": np.nansum(samples, axis=-1) * step,
+            "mean": np.nanmean(samples, axis=-1),
+            "max": np.nanmax(samples, axis=-1),
+        }[operation]
+    expected[~inside] = np.nan
+
+    result = plan.map(group.layer("density"), operation=operation, plot=False)
+    layer = result.layers[0]
+    unit = group["density"].unit
+    assert layer["unit"] == (unit * units("cm") if operation == "sum" else unit)
+    data = layer["data"]
+    assert np.array_equal(np.ma.getmaskarray(data), ~inside)
+    if operation == "max":
+        # A cell crossed over less than a step can be missed by the sampling
+        assert np.all(data[inside] >= expected[inside])
+        assert np.mean(data[inside] == expected[inside]) > 0.99
+    else:
+        np.testing.assert_allclose(data[inside], expected[inside], rtol=2.0e-3)
+
+
+def test_thick_map_of_a_uniform_density():
+    # With 64x48 pixels, many lines of sight are on the faces of the cells
+    group = _make_group(n=16)
+    group["density"] = Array(values=np.ones(len(group["dx"])), unit="g/cm**3")
+    result = osyris.map(
+        group.layer("density"),
+        dz=0.4 * units("cm"),
+        plot=False,
+        **dict(VIEW, resolution={"x": 64, "y": 48}),
+    )
+    data = result.layers[0]["data"]
+    assert data.shape == (48, 64)
+    assert not np.ma.getmaskarray(data).any()
+    np.testing.assert_allclose(data, 0.4, rtol=1.0e-12)
+
+
+@pytest.mark.parametrize("dz", [None, 0.4 * units("cm")])
+def test_plan_renders_several_layers(dz):
+    group = _make_group()
+    plan = MapPlan(group, direction=Vector(1, 2, 3), dz=dz, **VIEW)
+    keys = ["density", "temperature"]
+    both = plan.map(*(group.layer(key) for key in keys), plot=False)
+    for ind, key in enumerate(keys):
+        # Each layer is the same as when mapped on its own, with a new plan
+        alone = MapPlan(group, direction=Vector(1, 2, 3), dz=dz, **VIEW).map(
+            group.layer(key), plot=False
+        )
+        assert alone.layers[0]["unit"] == both.layers[ind]["unit"]
+        assert np.array_equal(
+            np.ma.getmaskarray(alone.layers[0]["data"]),
+            np.ma.getmaskarray(both.layers[ind]["data"]),
+        )
+        assert np.array_equal(
+            alone.layers[0]["data"].filled(0.0), both.layers[ind]["data"].filled(0.0)
+        )
+    # Each layer is computed from its own values
+    assert not np.allclose(
+        both.layers[0]["data"].filled(0.0), both.layers[1]["data"].filled(0.0)
+    )
+
+
+def test_map_is_the_same_as_plan_map():
+    group = _make_group()
+    layer = group.layer("temperature")
+    expected = MapPlan(group, dz=0.4 * units("cm"), **VIEW).map(
+        layer, operation="mean", plot=False
+    )
+    result = osyris.map(
+        layer, dz=0.4 * units("cm"), operation="mean", plot=False, **VIEW
+    )
+    assert np.array_equal(result.x, expected.x)
+    assert np.array_equal(result.y, expected.y)
+    assert np.array_equal(
+        result.layers[0]["data"].filled(0.0), expected.layers[0]["data"].filled(0.0)
+    )
+
+
+def test_plan_rejects_layers_of_a_different_length():
+    group = _make_group()
+    plan = MapPlan(group, **VIEW)
+    with pytest.raises(ValueError):
+        plan.map(_make_group(n=4).layer("temperature"), plot=False)
@@ -0,0 +1,295 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from osyris.plot.utils import PROJECTIONS, evaluate_on_grid, project_on_grid
+
+
+def _cube(n=4):
+    """
+    The positions and half sizes of a cube of ``n**3`` cells, centered on the origin,
+    with a size of 1.
+    """
+    centers = (np.arange(n) + 0.5) / n - 0.5
+    xyz = np.meshgrid(centers, centers, centers, indexing="ij")
+    positions = np.stack([c.ravel() for c in xyz], axis=1)
+    return positions, np.full(len(positions), 0.5 / n)
+
+
+def _grid_centers(npix):
+    return (np.arange(npix) + 0.5) / npix - 0.5
+
+
+def _project(
+    positions, sizes, values, operation, weights=None, npix=8, centers=None, scale=1.0
+):
+    """
+    Project the cells onto ``npix**2`` pixels covering ``[-0.5, 0.5]``, or pixels
+    with the given ``centers`` and a spacing of ``1 / len(centers)``. All the
+    lengths are divided by ``scale``.
+    """
+    if centers is None:
+        centers = _grid_centers(npix)
+    positions = positions / scale
+    centers = centers / scale
+    spacing = 1.0 / (len(centers) * scale)
+    return project_on_grid(
+        cell_positions_in_new_basis_x=positions[:, 0],
+        cell_positions_in_new_basis_y=positions[:, 1],
+        cell_positions_in_new_basis_z=positions[:, 2],
+        cell_positions_in_original_basis=positions,
+        cell_values=values,
+        cell_weights=np.ones_like(values) if weights is None else weights,
+        cell_sizes=sizes / scale,
+        grid_centers_in_new_basis_x=centers,
+        grid_centers_in_new_basis_y=centers,
+        grid_spacing_in_new_basis_x=spacing,
+        grid_spacing_in_new_basis_y=spacing,
+        zmin=-0.5 / scale,
+        zmax=0.5 / scale,
+        basis=np.eye(3),
+        operation=operation,
+        ndim=3,
+    )
+
+
+def _evaluate(positions, sizes, values, basis, lower, spacing, shape, band_height=8):
+    """
+    Evaluate the cells on a grid of ``shape = (nz, ny, nx)`` pixels, with the axes
+    of the grid along the rows of ``basis``.
+    """
+    new = positions @ basis.T
+    z, y, x = np.meshgrid(
+        *(lower[a] + (np.arange(shape[2 - a]) + 0.5) * spacing[a] for a in (2, 1, 0)),
+        indexing="ij",
+    )
+    return evaluate_on_grid(
+        cell_positions_in_new_basis_x=new[:, 0],
+        cell_positions_in_new_basis_y=new[:, 1],
+        cell_positions_in_new_basis_z=new[:, 2],
+        cell_positions_in_original_basis_x=positions[:, 0],
+        cell_positions_in_original_basis_y=positions[:, 1],
+        cell_positions_in_original_basis_z=positions[:, 2],
+        cell_values=values,
+        cell_sizes=sizes,
+        grid_lower_edge_in_new_basis_x=lower[0],
+        grid_lower_edge_in_new_basis_y=lower[1],
+        grid_lower_edge_in_new_basis_z=lower[2],
+        grid_spacing_in_new_basis_x=spacing[0],
+        grid_spacing_in_new_basis_y=spacing[1],
+        grid_spacing_in_new_basis_z=spacing[2],
+        grid_positions_in_original_basis=np.ascontiguousarray(
+            x[..., None] * basis[0] + y[..., None] * basis[1] + z[..., None] * basis[2]
+        ),
+        ndim=3,
+        band_height=band_height,
+    )
+
+
+def _refined_cube(seed):
+    """
+    A cube of 4**3 cells, where a few cells are refined into 8 cells which overlap
+    their parent, with random values. The cells are shuffled.
+    """
+    positions, sizes = _cube()
+    children = []
+    for parent in [0, 21, 42, 63]:
+        offsets = np.array(np.meshgrid([-1, 1], [-1, 1], [-1, 1])).reshape(3, -1).T
+        children.append(positions[parent] + 0.5 * sizes[parent] * offsets)
+    positions = np.concatenate([positions] + children)
+    sizes = np.concatenate([sizes, np.full(32, 0.5 * sizes[0])])
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(sizes))
+    values = rng.uniform(size=(2, len(sizes)))
+    return positions[order], sizes[order], values
+
+
+def _sample(positions, sizes, values, npix=8, nz=16):
+    """
+    Evaluate the cells on a 3D grid of ``nz`` layers, as thick maps used to do
+    before the cells were projected directly.
+    """
+    xcenters = _grid_centers(npix)
+    zcenters = _grid_centers(nz)
+    z, y, x = np.meshgrid(zcenters, xcenters, xcenters, indexing="ij")
+    return evaluate_on_grid(
+        cell_positions_in_new_basis_x=positions[:, 0],
+        cell_positions_in_new_basis_y=positions[:, 1],
+        cell_positions_in_new_basis_z=positions[:, 2],
+        cell_positions_in_original_basis_x=positions[:, 0],
+        cell_positions_in_original_basis_y=positions[:, 1],
+        cell_positions_in_original_basis_z=positions[:, 2],
+        cell_values=values,
+        cell_sizes=sizes,
+        grid_lower_edge_in_new_basis_x=-0.5,
+        grid_lower_edge_in_new_basis_y=-0.5,
+        grid_lower_edge_in_new_basis_z=-0.5,
+        grid_spacing_in_new_basis_x=1.0 / npix,
+        grid_spacing_in_new_basis_y=1.0 / npix,
+        grid_spacing_in_new_basis_z=1.0 / nz,
+        grid_positions_in_original_basis=np.stack([x, y, z], axis=-1),
+        ndim=3,
+    )
+
+
+@pytest.mark.parametrize("operation", list(PROJECTIONS))
+def test_project_matches_sampling_on_a_3d_grid(operation):
+    positions, sizes = _cube()
+    rng = np.random.default_rng(7)
+    values = rng.uniform(1.0, 2.0, size=(2, len(positions)))
+    # A few NaN cells, which do not fill any line of sight
+    values[1, [5, 22, 40]] = np.nan
+    expected = getattr(np, operation)(_sample(positions, sizes, values), axis=1)
+    if PROJECTIONS[operation] == PROJECTIONS["sum"]:
+        expected /= 16
+    projected = _project(positions, sizes, values, operation)
+    assert np.isnan(projected[1]).any() == (not operation.startswith("nan"))
+    np.testing.assert_allclose(projected, expected, equal_nan=True)
+
+
+@pytest.mark.parametrize("scale", [1.0, 0.8, 0.3])
+@pytest.mark.parametrize("operation", ["sum", "mean", "max"])
+def test_project_lines_of_sight_on_cell_faces(operation, scale):
+    # The pixel centers are on the faces and edges of the cells, and on the lower
+    # faces of the cube. Each line of sight crosses one column of cells.
+    positions, sizes = _cube()
+    rng = np.random.default_rng(11)
+    values = np.stack([np.ones(len(sizes)), rng.uniform(1.0, 2.0, len(sizes))])
+    centers = np.arange(16) / 16 - 0.5
+    projected = _project(
+        positions, sizes, values, operation, centers=centers, scale=scale
+    )
+    # The values of the columns of cells, from the pixel on their lower corner
+    columns = values.reshape(2, 4, 4, 4)
+    expected = {
+        "sum": columns.sum(axis=-1) / 4,
+        "mean": columns.mean(axis=-1),
+        "max": columns.max(axis=-1),
+    }[operation]
+    if operation == "sum":
+        expected /= scale
+    expected = np.repeat(np.repeat(expected.transpose(0, 2, 1), 4, axis=1), 4, axis=2)
+    np.testing.assert_allclose(projected, expected, rtol=1.0e-12)
+
+
+def test_project_cells_with_nan_values():
+    # Two cells along the line of sight, the second one is NaN
+    positions = np.array([[0.0, 0.0, -0.25], [0.0, 0.0, 0.25]])
+    sizes = np.full(2, 0.25)
+    values = np.array([[1.0, np.nan], [np.nan, np.nan]])
+    expected = {
+        "sum": np.nan,
+        "nansum": 0.5,
+        "mean": np.nan,
+        "nanmean": 1.0,
+        "min": np.nan,
+        "nanmin": 1.0,
+        "max": np.nan,
+        "nanmax": 1.0,
+    }
+    for operation, value in expected.items():
+        projected = _project(positions, sizes, values, operation, npix=1)
+        np.testing.assert_allclose(projected[0, 0, 0], value, equal_nan=True)
+        # A line of sight with only NaN cells is NaN, whatever the operation
+        assert np.isnan(projected[1, 0, 0])
+
+
+def test_project_weighted_mean():
+    positions = np.array([[0.0, 0.0, -0.25], [0.0, 0.0, 0.25]])
+    sizes = np.full(2, 0.25)
+    values = np.array([[1.0, 3.0]])
+    weights = np.array([[3.0, 1.0]])
+    projected = _project(positions, sizes, values, "mean", weights=weights, npix=1)
+    assert projected[0, 0, 0] == 1.5
+    projected = _project(positions, sizes, values, "sum", weights=weights, npix=1)
+    assert projected[0, 0, 0] == 2.0
+
+
+def test_project_unknown_operation():
+    positions, sizes = _cube(2)
+    with pytest.raises(ValueError):
+        _project(positions, sizes, np.ones((1, len(positions))), "median")
+
+
+def test_evaluate_finest_cell_wins():
+    positions = np.array([[0.0, 0.0, 0.0], [0.125, 0.125, 0.0]])
+    sizes = np.array([0.5, 0.125])
+    values = np.array([[1.0, 2.0]])
+    expected = np.ones((1, 1, 8, 8))
+    expected[..., 4:6, 4:6] = 2.0
+    for order in ([0, 1], [1, 0]):
+        out = _evaluate(
+            positions[order],
+            sizes[order],
+            values[:, order],
+            basis=np.eye(3),
+            lower=(-0.5, -0.5, -0.5),
+            spacing=(0.125, 0.125, 1.0),
+            shape=(1, 8, 8),
+        )
+        assert np.array_equal(out, expected)
+
+
+THREADS_SCRIPT = """
+import numba
+import numpy as np
+from test_plot_utils import _evaluate, _refined_cube
+
+positions, sizes, values = _refined_cube(seed=3)
+basis = np.linalg.qr(np.random.default_rng(3).normal(size=(3, 3)))[0].T
+args = dict(
+    basis=basis,
+    lower=(-0.8, -0.8, -0.45),
+    spacing=(1.6 / 67, 1.6 / 61, 0.3),
+    shape=(3, 61, 67),
+    band_height=4,
+)
+assert numba.get_num_threads() == 4
+expected = _evaluate(positions, sizes, values, **args)
+numba.set_num_threads(1)
+out = _evaluate(positions, sizes, values, **args)
+print(np.array_equal(out, expected, equal_nan=True))
+"""
+
+
+def test_evaluate_does_not_depend_on_the_number_of_threads():
+    # Run in a new process, to have several threads even on a single core
+    result = subprocess.run(
+        [sys.executable, "-c", THREADS_SCRIPT],
+        cwd=os.path.dirname(__file__),
+        env=dict(os.environ, NUMBA_NUM_THREADS="4"),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "True"
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_evaluate_oblique_basis_matches_brute_force(seed):
+    positions, sizes, values = _refined_cube(seed=seed)
+    basis = np.linalg.qr(np.random.default_rng(seed).normal(size=(3, 3)))[0].T
+    lower = (-0.8, -0.8, -0.45)
+    spacing = (1.6 / 40, 1.6 / 36, 0.3)
+    shape = (3, 36, 40)
+    out = _evaluate(positions, sizes, values, basis, lower, spacing, shape)
+
+    # Test every pixel against every cell, and keep the finest cell
+    z, y, x = np.meshgrid(
+        *(lower[a] + (np.arange(shape[2 - a]) + 0.5) * spacing[a] for a in (2, 1, 0)),
+        indexing="ij",
+    )
+    pixels = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1) @ basis
+    inside = np.all(
+        np.abs(pixels[:, None, :] - positions[None, :, :]) <= sizes[None, :, None],
+        axis=-1,
+    )
+    finest = np.argmin(np.where(inside, sizes, np.inf), axis=1)
+    expected = np.where(inside.any(axis=1), values[:, finest], np.nan)
+    assert np.isnan(expected).any() and not np.isnan(expected).all()
+    assert np.array_equal(out, expected.reshape((2,) + shape), equal_nan=True)
@@ -0,0 +1,158 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2024 Osyris contributors (https://github.com/osyris-project/osyris)
+import numpy as np
+import pytest
+
+from osyris import Array, Datagroup, Dataset, Vector, spatial, units
+
+
+def _make_group(n=5000, particles=False):
+    rng = np.random.default_rng(42)
+    xyz = rng.random((n, 3))
+    group = Datagroup({"position": Vector(*xyz.T, unit="cm")})
+    if not particles:
+        group["dx"] = Array(values=0.5 ** rng.integers(3, 8, n), unit="cm")
+    group["density"] = Array(values=rng.random(n), unit="g/cm**3")
+    return group
+
+
+def _positions(group):
+    return np.stack([c.values for c in group["position"]._xyz.values()], axis=1)
+
+
+@pytest.mark.parametrize("particles", [False, True])
+@pytest.mark.parametrize(
+    "region",
+    [
+        spatial.Sphere(
+            radius=0.2 * units("cm"), origin=Vector(0.3, 0.6, 0.5, unit="cm")
+        ),
+        spatial.Box(
+            dx=0.3 * units("cm"),
+            dy=0.1 * units("cm"),
+            dz=0.5 * units("cm"),
+            origin=Vector(0.5, 0.2, 0.9, unit="cm"),
+        ),
+        spatial.Cylinder(
+            radius=0.3 * units("cm"),
+            height=0.1 * units("cm"),
+            origin=Vector(0.5, 0.5, 0.5, unit="cm"),
+            direction=[1, 2, 3],
+        ),
+        spatial.Slab(
+            thickness=0.05 * units("cm"),
+            origin=Vector(0.5, 0.5, 0.5, unit="cm"),
+            normal=[0.3, -1, 0.2],
+        ),
+    ],
+)
+def test_spatial_index_query(region, particles):
+    group = _make_group(particles=particles)
+    index = spatial.spatial_index(group)
+    expected = np.nonzero(region.contains(_positions(group), 1.0 * units("cm")))[0]
+    assert len(expected) > 0
+    assert np.array_equal(index.query(region), expected)
+
+
+def test_spatial_index_query_with_padding():
+    group = _make_group()
+    region = spatial.Slab(
+        thickness=0.0 * units("cm"), origin=Vector(0.5, 0.5, 0.5, unit="cm")
+    )
+    pad = 0.5 * np.sqrt(3.0)
+    expected = np.nonzero(
+        region.contains(
+            _positions(group), 1.0 * units("cm"), pad=pad * group["dx"].values
+        )
+    )[0]
+    assert len(expected) > 0
+    assert np.array_equal(spatial.spatial_index(group).query(region, pad=pad), expected)
+
+
+def test_spatial_index_is_cached():
+    group = _make_group()
+    index = spatial.spatial_index(group)
+    assert spatial.spatial_index(group) is index
+    group["position"] = group["position"] * 2.0
+    assert spatial.spatial_index(group) is not index
+
+
+def test_extract_sphere():
+    ds = Dataset()
+    ds["mesh"] = _make_group()
+    ds["part"] = _make_group(n=300, particles=True)
+    origin = Vector(0.4, 0.5, 0.6, unit="cm")
+    radius = 0.25 * units("cm")
+    sub = spatial.extract_sphere(ds, radius=radius, origin=origin)
+    for name in ("mesh", "part"):
+        select = ((ds[name]["position"] - origin).norm < radius).values
+        assert np.array_equal(
+            sub[name]["density"].values, ds[name]["density"].values[select]
+        )
+
+
+def test_extract_box():
+    ds = Dataset()
+    ds["mesh"] = _make_group()
+    origin = Vector(0.4, 0.5, 0.6, unit="cm")
+    size = 0.2 * units("cm")
+    sub = spatial.extract_box(ds, dx=size, dy=size, dz=size, origin=origin)
+    pos = ds["mesh"]["position"] - origin
+    select = (
+        (np.abs(pos.x.values) <= 0.1)
+        & (np.abs(pos.y.values) <= 0.1)
+        & (np.abs(pos.z.values) <= 0.1)
+    )
+    assert np.array_equal(
+        sub["mesh"]["density"].values, ds["mesh"]["density"].values[select]
+    )
+
+
+def _distances(group, centers, boxsize=None):
+    diff = np.abs(_positions(group)[None, :, :] - centers[:, None, :])
+    if boxsize is not None:
+        diff = np.minimum(diff, boxsize - diff)
+    return np.sqrt(np.sum(diff**2, axis=-1))
+
+
+@pytest.mark.parametrize("boxsize", [None, 1.0])
+def test_kdtree_query(boxsize):
+    group = _make_group(n=2000, particles=True)
+    centers = np.random.default_rng(1).random((50, 3))
+    tree = spatial.KDTree(
+        group["position"], boxsize=None if boxsize is None else boxsize * units("cm")
+    )
+    distance, found = tree.query(Vector(*centers.T, unit="cm"), k=6)
+    expected = _distances(group, centers, boxsize=boxsize)
+    assert np.array_equal(found, np.argsort(expected, axis=1)[:, :6])
+    assert np.allclose(distance.values, np.sort(expected, axis=1)[:, :6])
+    assert distance.unit == units("cm")
+
+
+def test_kdtree_query_single_center():
+    group = _make_group(n=2000, particles=True)
+    tree = spatial.kdtree(group)
+    assert spatial.kdtree(group) is tree
+    distance, found = tree.query(Vector(0.5, 0.5, 0.5, unit="cm"))
+    expected = _distances(group, np.array([[0.5, 0.5, 0.5]]))[0]
+    assert found == np.argmin(expected)
+    assert np.isclose(distance.values, expected.min())
+
+
+@pytest.mark.parametrize("boxsize", [None, 1.0])
+def test_kdtree_query_ball(boxsize):
+    group = _make_group(n=2000, particles=True)
+    centers = np.random.default_rng(1).random((50, 3))
+    tree = spatial.KDTree(
+        group["position"], boxsize=None if boxsize is None else boxsize * units("cm")
+    )
+    balls = tree.query_ball(Vector(*centers.T, unit="cm"), 0.1 * units("cm"))
+    expected = _distances(group, centers, boxsize=boxsize)
+    assert len(balls) == len(centers)
+    for ball, dist in zip(balls, expected):
+        assert np.array_equal(ball, np.nonzero(dist <= 0.1)[0])
+
+
+def test_kdtree_periodic_needs_boxlen():
+    with pytest.raises(ValueError):
+        spatial.kdtree(_make_group(n=100, particles=True), periodic=True)